@@ -1,18 +1,63 @@
 """Module voor het aansturen van een gcode apparaat via de seriele poort."""
 
-from .driver import (
-    GCodeDeviceConnectEvent,
-    GCodeResult,
-    ResponseReveivedEvent,
-    CommandQueuedEvent,
-    CommandStartedEvent,
-    CommandProcessedEvent,
-    GCodeGenericCommand,
-    GenericDriver,
-)
-from .uarm import UArm
-from .grblplotter import Plotter
-from .robotarm import RobotArm
+import importlib
+
+# the submodules are imported on first use, importing the package itself
+# (for example for the command line tool) stays fast
+_EXPORTS = {
+    "GCodeDeviceConnectEvent": "driver",
+    "GCodeResult": "driver",
+    "ResponseReveivedEvent": "driver",
+    "CommandQueuedEvent": "driver",
+    "CommandStartedEvent": "driver",
+    "CommandProcessedEvent": "driver",
+    "GCodeGenericCommand": "driver",
+    "GenericDriver": "driver",
+    "DeviceResetException": "driver",
+    "CommandAbortedException": "driver",
+    "UArm": "uarm",
+    "Plotter": "grblplotter",
+    "RobotArm": "robotarm",
+    "GCodeEncoder": "encoder",
+    "SerialLink": "seriallink",
+    "SettingsCache": "settingscache",
+    "Job": "job",
+    "Checkpoint": "job",
+    "RestoreFailedException": "job",
+    "simulate": "simulator",
+    "simulate_file": "simulator",
+    "SimulationResult": "simulator",
+    "Scheduler": "scheduler",
+    "ScheduledJob": "scheduler",
+    "CompiledProgram": "compiler",
+    "compile_gcode": "compiler",
+    "compile_script": "compiler",
+    "Jogger": "jog",
+    "StateBoard": "stateboard",
+    "StateBoardReader": "stateboard",
+    "raster_gcode": "raster",
+    "FlowControl": "flowcontrol",
+    "StopAndWait": "flowcontrol",
+    "CharacterCounting": "flowcontrol",
+    "WindowedFlowControl": "flowcontrol",
+    "optimize_strokes": "pathoptimizer",
+    "PathOptimizerResult": "pathoptimizer",
+}
+
+
+def __getattr__(name):
+    module = _EXPORTS.get(name)
+    if module is None:
+        raise AttributeError(
+            "module {!r} has no attribute {!r}".format(__name__, name)
+        )
+    value = getattr(importlib.import_module("." + module, __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_EXPORTS))
 
 
 __all__ = [
@@ -27,4 +72,30 @@ __all__ = [
     "GCodeGenericCommand",
     "RobotArm",
     "GenericDriver",
+    "GCodeEncoder",
+    "SerialLink",
+    "SettingsCache",
+    "Job",
+    "Checkpoint",
+    "RestoreFailedException",
+    "simulate",
+    "simulate_file",
+    "SimulationResult",
+    "Scheduler",
+    "ScheduledJob",
+    "CompiledProgram",
+    "compile_gcode",
+    "compile_script",
+    "Jogger",
+    "StateBoard",
+    "StateBoardReader",
+    "raster_gcode",
+    "DeviceResetException",
+    "CommandAbortedException",
+    "FlowControl",
+    "StopAndWait",
+    "CharacterCounting",
+    "WindowedFlowControl",
+    "optimize_strokes",
+    "PathOptimizerResult",
 ]
@@ -0,0 +1,6 @@
+"""Run the command line tool with python -m asyncgcodecli."""
+
+import sys
+from asyncgcodecli.cli import main
+
+sys.exit(main())
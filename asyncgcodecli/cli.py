@@ -0,0 +1,257 @@
+"""Command line tool that streams gcode files to devices."""
+
+# Only argparse is imported at the top, asyncio, pyserial and the drivers
+# are loaded when there is something to stream. "asyncgcodecli --help"
+# and argument errors stay fast on slow controllers.
+
+__all__ = ["main"]
+
+import argparse
+import os
+import sys
+
+_FLOW_CONTROL = ("character-counting", "stop-and-wait", "windowed")
+_LOG_LEVELS = ("none", "fatal", "error", "warning", "info", "debug", "trace")
+
+
+def _parser():
+    parser = argparse.ArgumentParser(
+        prog="asyncgcodecli",
+        description="Stream gcode files to one or more devices at the same time.",
+        epilog=(
+            "With as many files as ports, each port gets its own file. "
+            "Otherwise every port gets all files, one after the other. "
+            "Files made with compile_gcode are streamed as is."
+        ),
+    )
+    parser.add_argument("files", nargs="+", metavar="FILE", help="gcode file")
+    parser.add_argument(
+        "-p",
+        "--port",
+        action="append",
+        required=True,
+        dest="ports",
+        metavar="PORT",
+        help="serial port or tcp://host:port, may be repeated",
+    )
+    parser.add_argument(
+        "-b", "--baudrate", type=int, default=115200, help="default: %(default)s"
+    )
+    parser.add_argument(
+        "-f",
+        "--flow-control",
+        choices=_FLOW_CONTROL,
+        default=_FLOW_CONTROL[0],
+        help="default: %(default)s",
+    )
+    parser.add_argument(
+        "-e",
+        "--on-error",
+        choices=("continue", "abort"),
+        default="continue",
+        help="stop a port at the first failing line, default: %(default)s",
+    )
+    parser.add_argument(
+        "-l",
+        "--log-level",
+        choices=_LOG_LEVELS,
+        default="warning",
+        help="default: %(default)s",
+    )
+    parser.add_argument(
+        "-t",
+        "--timeout",
+        type=float,
+        default=10.0,
+        help="seconds to wait for a device to connect, default: %(default)s",
+    )
+    parser.add_argument(
+        "-q", "--quiet", action="store_true", help="do not show the progress"
+    )
+    return parser
+
+
+def _assign(files, ports):
+    if len(files) == len(ports):
+        return [(port, [file]) for port, file in zip(ports, files)]
+    return [(port, list(files)) for port in ports]
+
+
+def _flow_control(name):
+    from asyncgcodecli.flowcontrol import (
+        CharacterCounting,
+        StopAndWait,
+        WindowedFlowControl,
+    )
+
+    return {
+        "character-counting": CharacterCounting,
+        "stop-and-wait": StopAndWait,
+        "windowed": WindowedFlowControl,
+    }[name]()
+
+
+def _compile(files, directory):
+    """Compile every file once, returns the file to stream for each."""
+    from asyncgcodecli.compiler import CompiledProgram, compile_gcode
+
+    compiled = {}
+    for path in files:
+        if path in compiled:
+            continue
+        try:
+            CompiledProgram.open(path).close()
+            compiled[path] = path
+        except ValueError:
+            compiled[path] = os.path.join(directory, "{}.gcb".format(len(compiled)))
+            # the devices are GRBL (GenericDriver), spaces only fill its buffer
+            compile_gcode(path, compiled[path], compact=True)
+    return compiled
+
+
+class _Progress:
+    """The progress of all ports, redrawn on one line."""
+
+    def __init__(self, ports, stream):
+        self.stream = stream
+        self.state = {port: None for port in ports}
+
+    def render(self):
+        parts = []
+        for port, state in self.state.items():
+            if state is None:
+                parts.append("{} connecting".format(port))
+                continue
+            name, command = state
+            if command.line_count:
+                percent = 100 * command.acked // command.line_count
+            else:
+                percent = 100
+            parts.append(
+                "{} {} {}/{} {}%".format(
+                    port, name, command.acked, command.line_count, percent
+                )
+            )
+        self.stream.write("\r" + "  ".join(parts) + "\033[K")
+        self.stream.flush()
+
+    async def run(self, interval=0.25):
+        import asyncio
+
+        try:
+            while True:
+                self.render()
+                await asyncio.sleep(interval)
+        finally:
+            self.render()
+            self.stream.write("\n")
+            self.stream.flush()
+
+
+async def _stream(device, port, files, compiled, progress, timeout):
+    import asyncio
+    import asyncgcodecli.logger as logger
+    from asyncgcodecli.compiler import CompiledProgram
+    from asyncgcodecli.driver import GCodeStreamCommand
+
+    errors = 0
+    device.start()
+    try:
+        await asyncio.wait_for(device.ready(), timeout)
+        for path in files:
+            program = CompiledProgram.open(compiled[path])
+            command = GCodeStreamCommand(program, close=True)
+            if progress is not None:
+                progress.state[port] = (os.path.basename(path), command)
+            if command.line_count == 0:
+                program.close()
+                continue
+            result = await device.queue_command(command)
+            for line, error in result.get("errors", []):
+                errors += 1
+                logger.log(
+                    logger.ERROR,
+                    "{}: {} line {}: error {}",
+                    (port, path, line + 1, error.get("error_code")),
+                )
+        await device.wait_queue_empty()
+    except asyncio.TimeoutError:
+        logger.log(logger.ERROR, "{}: no response from the device", port)
+        errors += 1
+    except Exception as e:
+        logger.log(logger.ERROR, "{}: {}", (port, e))
+        errors += 1
+    finally:
+        device.stop()
+    return errors
+
+
+async def _run(args):
+    import asyncio
+    import tempfile
+    from asyncgcodecli.driver import GenericDriver
+    from asyncgcodecli.seriallink import SerialLink
+
+    jobs = _assign(args.files, args.ports)
+    progress = None
+    if not args.quiet and sys.stderr.isatty():
+        progress = _Progress(args.ports, sys.stderr)
+
+    with tempfile.TemporaryDirectory() as directory:
+        compiled = _compile(args.files, directory)
+        streams = []
+        for port, files in jobs:
+            device = GenericDriver(
+                port,
+                flow_control=_flow_control(args.flow_control),
+                serial_link=SerialLink(baudrate=args.baudrate),
+                error_policy=args.on_error,
+            )
+            streams.append(
+                _stream(device, port, files, compiled, progress, args.timeout)
+            )
+
+        drawing = None
+        if progress is not None:
+            drawing = asyncio.ensure_future(progress.run())
+        try:
+            errors = await asyncio.gather(*streams)
+        finally:
+            if drawing is not None:
+                drawing.cancel()
+                await asyncio.gather(drawing, return_exceptions=True)
+    return sum(errors)
+
+
+def main(argv=None):
+    """
+    Start het command line programma.
+
+    Verstuurt een of meer gcode bestanden tegelijk naar een of meer
+    apparaten, zie "asyncgcodecli --help".
+
+    Parameters
+    ----------
+    argv : list
+        De argumenten, None voor sys.argv.
+
+    Returns
+    -------
+    int
+        0 als alles goed ging, 1 als er regels of apparaten een fout
+        gaven.
+    """
+    args = _parser().parse_args(argv)
+    for path in args.files:
+        if not os.path.isfile(path):
+            _parser().error("{} does not exist".format(path))
+
+    import asyncio
+    import asyncgcodecli.logger as logger
+
+    logger.set_log_level(_LOG_LEVELS.index(args.log_level))
+    try:
+        errors = asyncio.run(_run(args))
+    except KeyboardInterrupt:
+        return 130
+    return 1 if errors else 0
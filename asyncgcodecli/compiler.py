@@ -0,0 +1,344 @@
+"""Ahead of time compilation of gcode to files that are streamed as is."""
+
+__all__ = ["CompiledProgram", "compile_gcode", "compile_script", "record_script"]
+
+import array
+import asyncio
+import mmap
+import os
+import re
+import struct
+import sys
+import tempfile
+from asyncgcodecli.driver import (
+    GCodeCommand,
+    GCodeDeviceConnectEvent,
+    GCodeWaitCommand,
+    ResponseReveivedEvent,
+)
+
+# magic, version, flags, line count, size of the data
+_HEADER = struct.Struct("<4sHHQQ4x")
+_MAGIC = b"AGCB"
+_VERSION = 1
+
+_COMMENT = re.compile(rb"\(.*?\)|;.*")
+_SPACE = re.compile(rb"\s+")
+_LINE_END = re.compile(rb"[\r\n]")
+# the letter of a word: a single letter followed by a number. Other text,
+# like the message of M117, keeps its case.
+_WORD_LETTER = re.compile(rb"(?<![A-Za-z])[a-z](?=\s*[-+.0-9])")
+
+
+def _padding(size):
+    return -size % 8
+
+
+class CompiledProgram:
+    """
+    Een gecompileerd gcode programma.
+
+    Het bestand bevat de regels precies zoals ze verstuurd worden en een
+    index met het begin van elke regel. Het wordt met mmap geopend, de
+    driver verstuurt de regels direct uit het bestand.
+
+    Attributes
+    ----------
+    data : memoryview
+        De bytes van alle regels achter elkaar.
+    offsets : memoryview
+        Het begin van elke regel in data, met als laatste de lengte van
+        data.
+    path : string
+        Het bestand, None als het programma in het geheugen staat.
+
+    Example
+    -------
+
+    Compileer een tekening eenmalig en speel hem daarna steeds af::
+
+        compile_gcode("drawing.gcode", "drawing.gcb")
+
+        async def draw(plotter):
+            with CompiledProgram.open("drawing.gcb") as program:
+                await plotter.stream_program(program)
+    """
+
+    def __init__(self, data, offsets, path=None):
+        self.data = data
+        self.offsets = offsets
+        self.path = path
+        self.__mmap = None
+
+    @classmethod
+    def open(cls, path):
+        """Open een gecompileerd bestand."""
+        with open(path, "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            if size < _HEADER.size:
+                raise ValueError("{} is not a compiled gcode file".format(path))
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        view = memoryview(mapped)
+        magic, version, _, line_count, data_size = _HEADER.unpack_from(view)
+        index_start = _HEADER.size + data_size + _padding(data_size)
+        index_end = index_start + 8 * (line_count + 1)
+        if magic != _MAGIC or version != _VERSION or index_end > size:
+            view.release()
+            mapped.close()
+            raise ValueError("{} is not a compiled gcode file".format(path))
+
+        data = view[_HEADER.size : _HEADER.size + data_size]
+        if sys.byteorder == "little":
+            offsets = view[index_start:index_end].cast("Q")
+        else:
+            offsets = array.array("Q", view[index_start:index_end])
+            offsets.byteswap()
+
+        program = cls(data, offsets, path)
+        program.__mmap = (mapped, view)
+        return program
+
+    def close(self):
+        """Geef het bestand vrij."""
+        if self.__mmap is None:
+            return
+        mapped, view = self.__mmap
+        self.__mmap = None
+        if isinstance(self.offsets, memoryview):
+            self.offsets.release()
+        self.data.release()
+        view.release()
+        mapped.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def line(self, index):
+        """Geef een regel als bytes, inclusief het regeleinde."""
+        return bytes(self.data[self.offsets[index] : self.offsets[index + 1]])
+
+    def lines(self):
+        """Geef alle regels, zonder regeleinde."""
+        for index in range(len(self)):
+            yield self.line(index).rstrip(b"\r\n")
+
+
+def _normalize(line, compact):
+    line = _COMMENT.sub(b"", line)
+    line = _WORD_LETTER.sub(lambda match: match[0].upper(), line)
+    if compact:
+        return _SPACE.sub(b"", line)
+    return line.strip()
+
+
+def _source_lines(source, encoder, compact):
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, "rb") as f:
+            for line in f:
+                line = _normalize(line, compact)
+                if line:
+                    yield line
+        return
+
+    for item in source:
+        if isinstance(item, GCodeCommand):
+            if encoder is not None:
+                line = item.encode(encoder)
+            else:
+                line = item.command()
+            line = line.strip(b"\r\n")
+        else:
+            if isinstance(item, str):
+                item = item.encode("utf-8")
+            line = _normalize(item, compact)
+        if line:
+            yield line
+
+
+def _write(path, lines, line_end):
+    offsets = array.array("Q", [0])
+    directory = os.path.dirname(path) or "."
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(b"\0" * _HEADER.size)
+            size = 0
+            chunk = bytearray()
+            for line in lines:
+                chunk += line
+                chunk += line_end
+                size += len(line) + len(line_end)
+                offsets.append(size)
+                if len(chunk) >= 65536:
+                    f.write(chunk)
+                    chunk = bytearray()
+            f.write(chunk)
+            f.write(b"\0" * _padding(size))
+
+            if sys.byteorder != "little":
+                offsets.byteswap()
+            f.write(offsets.tobytes())
+            f.seek(0)
+            f.write(_HEADER.pack(_MAGIC, _VERSION, 0, len(offsets) - 1, size))
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+    return len(offsets) - 1
+
+
+def compile_gcode(source, path, encoder=None, compact=False, line_end=b"\r"):
+    """
+    Compileer gcode naar een bestand dat direct verstuurd kan worden.
+
+    Commentaar wordt verwijderd, de letters van de woorden worden
+    hoofdletters en lege regels vervallen. Andere tekst, zoals de
+    boodschap van M117 of het #n volgnummer van een UArm, blijft zoals
+    hij is.
+
+    Parameters
+    ----------
+    source : string of iterable
+        Een gcode bestand, of regels (str of bytes) of GCodeCommand
+        objecten.
+    path : string
+        Het bestand dat gemaakt wordt.
+    encoder : GCodeEncoder
+        Als opgegeven, dan worden GCodeCommand objecten hiermee
+        gecodeerd.
+    compact : bool
+        Laat alle spaties weg. Alleen voor GRBL, die ze zelf ook
+        weglaat; andere firmware heeft ze nodig.
+    line_end : bytes
+        Het regeleinde.
+
+    Returns
+    -------
+    int
+        Het aantal regels.
+    """
+    return _write(path, _source_lines(source, encoder, compact), line_end)
+
+
+class _RecordingPort:
+    """A port that answers everything with ok and keeps the lines."""
+
+    def __init__(self, loop, banner, settings):
+        self.event_queue = asyncio.Queue()
+        self.stop = False
+        self.recording = False
+        self.lines = []
+        self.__banner = banner
+        self.__settings = settings or {}
+        self.__buffer = bytearray()
+
+    def start(self):
+        self.event_queue.put_nowait(GCodeDeviceConnectEvent(True))
+        self.__reply(self.__banner)
+
+    def close(self):
+        self.stop = True
+
+    def __reply(self, response):
+        self.event_queue.put_nowait(ResponseReveivedEvent(response))
+
+    def write(self, data):
+        self.__buffer += data
+        lines = _LINE_END.split(self.__buffer)
+        self.__buffer = bytearray(lines.pop())
+        for line in lines:
+            if not line:
+                continue
+            if line == b"$$":
+                for key, value in self.__settings.items():
+                    self.__reply("${}={}".format(key, value))
+            elif line == b"?":
+                self.__reply("<Idle>")
+            elif self.recording:
+                self.lines.append(bytes(line))
+            self.__reply("ok")
+
+
+class _Recorder:
+    """Transport for a device whose commands are recorded."""
+
+    def __init__(self, banner, settings):
+        self.banner = banner
+        self.settings = settings
+        self.port = None
+
+    def open_port(self, port, loop, link=None, probe=None):
+        self.port = _RecordingPort(loop, self.banner, self.settings)
+        return self.port
+
+
+async def record_script(script, device_type, *args, settings=None, **kw):
+    """
+    Voer een script uit zonder apparaat en geef de verstuurde regels.
+
+    Het script krijgt een device van device_type dat elke opdracht direct
+    bevestigt. Berekeningen zoals de inverse kinematica van een RobotArm
+    en de encoder gebeuren dus maar een keer. Wachten met sleep wordt een
+    G4 opdracht.
+
+    Parameters
+    ----------
+    script : script
+        Het script, net als bij execute_on_devices.
+    device_type : class
+        De class van het device, bijvoorbeeld Plotter.
+    settings : dict
+        De instellingen die het device bij $$ krijgt.
+
+    Overige argumenten gaan naar device_type.
+
+    Returns
+    -------
+    list
+        De regels (bytes) zonder regeleinde.
+    """
+    recorder = _Recorder(device_type.greeting, settings)
+    device = device_type("compile://", *args, transport=recorder, **kw)
+
+    # nothing moves, the device is idle as soon as the queue is empty
+    device.wait_for_idle = device.wait_queue_empty
+    device.sleep = lambda time: device.queue_command(GCodeWaitCommand(time))
+
+    device.start()
+    try:
+        await device.ready()
+        recorder.port.recording = True
+        await script(device)
+        await device.wait_queue_empty()
+    finally:
+        device.stop()
+    return recorder.port.lines
+
+
+def compile_script(script, path, device_type, *args, line_end=b"\r", **kw):
+    """
+    Compileer een script naar een bestand dat direct verstuurd kan worden.
+
+    Zie record_script voor de argumenten.
+
+    Returns
+    -------
+    int
+        Het aantal regels.
+
+    Example
+    -------
+
+    Compileer een script voor een RobotArm::
+
+        compile_script(pick_and_place, "pick.gcb", RobotArm)
+    """
+    lines = asyncio.run(record_script(script, device_type, *args, **kw))
+    return _write(path, lines, line_end)
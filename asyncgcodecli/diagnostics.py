@@ -0,0 +1,266 @@
+"""Event loop lag and hot path timing diagnostics."""
+
+# Diagnostics are off by default. They are switched on with enable() or
+# with the environment variable ASYNCGCODECLI_DIAGNOSTICS, its value is
+# the lag threshold in milliseconds ("1" or "on" use the default).
+#
+# The drivers only check the module attribute ``active`` on their hot
+# paths, so switched off diagnostics cost next to nothing.
+
+__all__ = ["enable", "disable", "report", "reset"]
+
+import asyncio
+import os
+import time
+import asyncgcodecli.logger as logger
+
+active = False
+
+_settings = {
+    "lag_threshold": 0.05,
+    "sample_interval": 0.01,
+    "report_interval": 10.0,
+    "profile_threshold": None,
+    "profile_duration": 2.0,
+    "profile_dir": None,
+}
+_stats = {}
+_window_full_since = {}
+_samplers = {}
+_profile = None
+
+
+class _Timer:
+    """Count, total and maximum of a duration."""
+
+    __slots__ = ("count", "total", "max", "period_max")
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.period_max = 0.0
+
+    def add(self, duration):
+        self.count += 1
+        self.total += duration
+        if duration > self.max:
+            self.max = duration
+        if duration > self.period_max:
+            self.period_max = duration
+
+    def as_dict(self):
+        return {
+            "count": self.count,
+            "total": self.total,
+            "mean": self.total / self.count if self.count else 0.0,
+            "max": self.max,
+        }
+
+
+def _timer(name):
+    timer = _stats.get(name)
+    if timer is None:
+        timer = _stats[name] = _Timer()
+    return timer
+
+
+def enable(
+    lag_threshold=0.05,
+    sample_interval=0.01,
+    report_interval=10.0,
+    profile_threshold=None,
+    profile_duration=2.0,
+    profile_dir=None,
+):
+    """
+    Zet de diagnostiek aan.
+
+    Meet hoe lang de event loop geblokkeerd is (lag), hoe lang het
+    verwerken van antwoorden (_process_response) en het versturen
+    (_process_queue) duurt, hoe lang een ontvangen regel op de event loop
+    wacht (handoff) en hoe lang de flow control vol zat terwijl er nog
+    opdrachten klaar stonden (window_full). Dat laatste betekent dat het
+    apparaat of de verbinding de beperking is, niet de event loop.
+
+    Parameters
+    ----------
+    lag_threshold : float
+        Een lag boven deze waarde (seconden) wordt als waarschuwing
+        gelogd.
+    sample_interval : float
+        Hoe vaak de lag gemeten wordt.
+    report_interval : float
+        Hoe vaak een samenvatting gelogd wordt (INFO), None voor nooit.
+    profile_threshold : float
+        Als opgegeven wordt bij een lag boven deze waarde cProfile
+        gestart voor profile_duration seconden.
+    profile_duration : float
+        De duur van een profiel.
+    profile_dir : string
+        Als opgegeven worden profielen hier als .prof bestand bewaard,
+        anders worden de duurste functies gelogd.
+    """
+    global active
+    _settings.update(
+        lag_threshold=lag_threshold,
+        sample_interval=sample_interval,
+        report_interval=report_interval,
+        profile_threshold=profile_threshold,
+        profile_duration=profile_duration,
+        profile_dir=profile_dir,
+    )
+    active = True
+    try:
+        _attach(asyncio.get_running_loop())
+    except RuntimeError:
+        # no loop yet, the drivers attach when they start
+        pass
+
+
+def disable():
+    """Zet de diagnostiek uit."""
+    global active
+    active = False
+    for task in _samplers.values():
+        task.cancel()
+    _samplers.clear()
+
+
+def reset():
+    """Begin opnieuw met meten."""
+    _stats.clear()
+    _window_full_since.clear()
+
+
+def report():
+    """
+    Geef de metingen tot nu toe.
+
+    Returns
+    -------
+    dict
+        Per meting ("loop_lag", "process_response", "process_queue",
+        "handoff", "window_full") een dict met "count", "total", "mean"
+        en "max" in seconden.
+    """
+    return {name: timer.as_dict() for name, timer in _stats.items()}
+
+
+def _attach(loop):
+    """Start measuring the lag of a loop, once per loop."""
+    if not active or loop in _samplers:
+        return
+    task = loop.create_task(_sample_lag())
+    _samplers[loop] = task
+    task.add_done_callback(lambda _: _samplers.pop(loop, None))
+
+
+def _record(name, duration):
+    _timer(name).add(duration)
+
+
+def _window_full(key, full):
+    """Record whether the send window of a driver is full with work waiting."""
+    if full:
+        _window_full_since.setdefault(key, time.perf_counter())
+    else:
+        since = _window_full_since.pop(key, None)
+        if since is not None:
+            _record("window_full", time.perf_counter() - since)
+
+
+def _log_report():
+    parts = []
+    for name, timer in sorted(_stats.items()):
+        if timer.count:
+            parts.append(
+                "{} n={} mean={:.2f}ms max={:.2f}ms".format(
+                    name,
+                    timer.count,
+                    1000 * timer.total / timer.count,
+                    1000 * timer.period_max,
+                )
+            )
+            timer.period_max = 0.0
+    if parts:
+        logger.log(logger.INFO, "Diagnostics: {}", "; ".join(parts))
+
+
+def _start_profile(lag):
+    global _profile
+    if _profile is not None:
+        return
+    import cProfile
+
+    logger.log(
+        logger.WARNING,
+        "Event loop lag {:.1f} ms, profiling for {} s",
+        (lag * 1000, _settings["profile_duration"]),
+    )
+    _profile = cProfile.Profile()
+    _profile.enable()
+    asyncio.get_running_loop().call_later(_settings["profile_duration"], _stop_profile)
+
+
+def _stop_profile():
+    global _profile
+    profile = _profile
+    _profile = None
+    if profile is None:
+        return
+    profile.disable()
+
+    directory = _settings["profile_dir"]
+    if directory is not None:
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(
+            directory, "asyncgcodecli-{}.prof".format(time.strftime("%Y%m%d-%H%M%S"))
+        )
+        profile.dump_stats(path)
+        logger.log(logger.WARNING, "Profile written to {}", path)
+    else:
+        import io
+        import pstats
+
+        out = io.StringIO()
+        pstats.Stats(profile, stream=out).sort_stats("cumulative").print_stats(15)
+        logger.log(logger.WARNING, "Profile:\n{}", out.getvalue())
+
+
+async def _sample_lag():
+    interval = _settings["sample_interval"]
+    next_report = time.monotonic() + (_settings["report_interval"] or 0)
+    while active:
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        lag = max(0.0, time.perf_counter() - start - interval)
+        _record("loop_lag", lag)
+
+        if lag > _settings["lag_threshold"]:
+            logger.log(
+                logger.WARNING, "Event loop was blocked for {:.1f} ms", lag * 1000
+            )
+        threshold = _settings["profile_threshold"]
+        if threshold is not None and lag > threshold:
+            _start_profile(lag)
+
+        if _settings["report_interval"] and time.monotonic() >= next_report:
+            next_report = time.monotonic() + _settings["report_interval"]
+            _log_report()
+
+
+def _from_environment():
+    value = os.environ.get("ASYNCGCODECLI_DIAGNOSTICS", "").strip().lower()
+    if value in ("", "0", "off", "no", "false"):
+        return
+    if value in ("1", "on", "yes", "true"):
+        enable()
+        return
+    try:
+        enable(lag_threshold=float(value) / 1000)
+    except ValueError:
+        logger.log(logger.WARNING, "Invalid ASYNCGCODECLI_DIAGNOSTICS {}", value)
+
+
+_from_environment()
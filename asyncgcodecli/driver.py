@@ -8,24 +8,86 @@ import re
 import asyncio
 import asyncio.events
 import asyncgcodecli.logger as logger
+import asyncgcodecli.diagnostics as diagnostics
+from asyncgcodecli.flowcontrol import StopAndWait, CharacterCounting
+from asyncgcodecli.seriallink import SerialLink
 
 __all__ = [
     "GCodeDeviceEvent",
     "GCodeDeviceConnectEvent",
     "GCodeGenericCommand",
+    "GCodeBatch",
+    "GCodeBarrier",
     "ResponseReveivedEvent",
     "GenericDriver",
     "GRBLDriver",
     "GCodeMoveRapidCommand",
     "GCodeMoveLinearCommand",
+    "GCodeMoveArcCommand",
+    "GCodeStreamCommand",
+    "GCodeJogCommand",
+    "TimeoutException",
+    "DeviceResetException",
+    "CommandAbortedException",
 ]
 
+_LINE_END = re.compile(rb"[\r\n]")
+
+# ports that are reached through asyncgcodecli.tcp
+_NETWORK_PORTS = ("tcp://", "telnet://")
+
 
 class TimeoutException(Exception):
     def __init__(self, *args, **kw):
         super().__init__(*args, **kw)
 
 
+class DeviceResetException(Exception):
+    """
+    Het apparaat is gereset of de verbinding is verbroken.
+
+    Alle opdrachten die nog niet verwerkt waren krijgen deze exception
+    als resultaat.
+    """
+
+    def __init__(self, *args, **kw):
+        super().__init__(*args, **kw)
+
+
+class CommandAbortedException(Exception):
+    """
+    De opdracht is afgebroken door abort.
+
+    Alle opdrachten die nog niet verwerkt waren krijgen deze exception
+    als resultaat, bijvoorbeeld omdat een eerdere opdracht een fout gaf
+    en error_policy "abort" is.
+
+    Attributes
+    ----------
+    result : dict
+        Het resultaat van de opdracht die de fout gaf, None als abort
+        door het script aangeroepen is.
+    command : GCodeCommand
+        De opdracht die de fout gaf, of None.
+    """
+
+    def __init__(self, message="aborted", result=None, command=None):
+        super().__init__(message)
+        self.result = result
+        self.command = command
+
+
+_ERROR_POLICIES = ("continue", "pause", "abort")
+
+
+def _fail_future(future, exception):
+    if not future.done():
+        future.set_exception(exception)
+        # most command results are never awaited, do not let each of
+        # them log an unretrieved exception
+        future.exception()
+
+
 class GCodeDeviceEvent:
     """Basis class voor CGodeEvents."""
 
@@ -65,6 +127,8 @@ class ResponseReveivedEvent(GCodeDeviceEvent):
     def __init__(self, response, *args, **kw):
         super().__init__(*args, **kw)
         self.response = response
+        # set in the receiving thread, for the handoff latency
+        self.received_at = time.perf_counter()
 
 
 class GCodeResult(asyncio.Future):
@@ -96,6 +160,48 @@ class GCodeResult(asyncio.Future):
         super().__init__(*args, **kw)
 
 
+class GCodeBatch:
+    """
+    Een groep opdrachten met een gezamenlijk resultaat.
+
+    Het resultaat is beschikbaar als alle opdrachten verwerkt zijn. Als
+    een of meer opdrachten een fout gaven, dan staan die in "errors" als
+    lijst van (index, resultaat) paren.
+    """
+
+    def __init__(self, commands):
+        self.commands = commands
+        self.errors = []
+        self.__remaining = len(commands)
+        self.gcode_result = GCodeResult()
+        for index, command in enumerate(commands):
+            command.batch = self
+            command.batch_index = index
+
+        if self.__remaining == 0:
+            self.gcode_result.set_result({"result": "ok", "error_code": 0})
+
+    def _command_resolved(self, command, result):
+        if result.get("result") != "ok":
+            self.errors.append((command.batch_index, result))
+
+        self.__remaining -= 1
+        if self.__remaining == 0 and not self.gcode_result.done():
+            if self.errors:
+                self.gcode_result.set_result(
+                    {
+                        "result": "error",
+                        "error_code": self.errors[0][1].get("error_code"),
+                        "errors": self.errors,
+                    }
+                )
+            else:
+                self.gcode_result.set_result({"result": "ok", "error_code": 0})
+
+    def _command_failed(self, command, exception):
+        _fail_future(self.gcode_result, exception)
+
+
 class GCodeCommand:
     nextId = 0
 
@@ -103,14 +209,52 @@ class GCodeCommand:
         super().__init__(*args, **kw)
         self.send = False
         self.confirmed = False
-        self.gcode_result = GCodeResult()
+        self.result = None
+        self.batch = None
         self.expect_ok = expect_ok
+        self.wire = None
+        self.error = None
+        self.__gcode_result = None
         self.id = GCodeCommand.nextId
         GCodeCommand.nextId += 1
 
+    @property
+    def gcode_result(self):
+        # the future is only created when somebody asks for it
+        if self.__gcode_result is None:
+            self.__gcode_result = GCodeResult()
+            if self.result is not None:
+                self.__gcode_result.set_result(self.result)
+            elif self.error is not None:
+                _fail_future(self.__gcode_result, self.error)
+        return self.__gcode_result
+
+    def _resolve(self, result):
+        self.result = result
+        if self.__gcode_result is not None and not self.__gcode_result.done():
+            self.__gcode_result.set_result(result)
+        if self.batch is not None:
+            self.batch._command_resolved(self, result)
+
+    def _fail(self, exception):
+        self.error = exception
+        if self.__gcode_result is not None:
+            _fail_future(self.__gcode_result, exception)
+        if self.batch is not None:
+            self.batch._command_failed(self, exception)
+
     def command(self):
         return b""
 
+    def encode(self, encoder):
+        # the effect on the modal state is unknown
+        encoder.reset()
+        return self.command()
+
+    def holds_queue(self):
+        """True als er na deze opdracht (nog) niets verstuurd mag worden."""
+        return False
+
 
 class GCodeGenericCommand(GCodeCommand):
     def __init__(self, gcode, *args, **kw):
@@ -126,6 +270,20 @@ class GCodeGenericCommand(GCodeCommand):
     def command(self):
         return self.gcode
 
+    def encode(self, encoder):
+        upper = self.gcode.upper()
+        if b"G91" in upper:
+            encoder.reset()
+            encoder.absolute = False
+        elif b"G90" in upper:
+            encoder.reset()
+        elif not (upper.startswith(b"M") or upper.startswith(b"?")):
+            # M-codes and status requests leave motion state alone
+            absolute = encoder.absolute
+            encoder.reset()
+            encoder.absolute = absolute
+        return self.gcode
+
 
 class GCodeMoveRapidCommand(GCodeCommand):
     def __init__(self, x=None, y=None, z=None, speed=None, *args, **kw):
@@ -149,6 +307,11 @@ class GCodeMoveRapidCommand(GCodeCommand):
         result += b"\r"
         return result
 
+    def encode(self, encoder):
+        return encoder.move(
+            b"G0", (("X", self.x), ("Y", self.y), ("Z", self.z)), self.speed
+        )
+
 
 class GCodeMoveLinearCommand(GCodeCommand):
     def __init__(self, x=None, y=None, z=None, speed=None, *args, **kw):
@@ -172,6 +335,66 @@ class GCodeMoveLinearCommand(GCodeCommand):
         result += b"\r"
         return result
 
+    def encode(self, encoder):
+        return encoder.move(
+            b"G1", (("X", self.x), ("Y", self.y), ("Z", self.z)), self.speed
+        )
+
+
+def _arc_offset(start, x, y, i, j, decimals):
+    """
+    I and J from the rounded start to a centre at the same distance of the
+    rounded start and end, GRBL rejects an arc whose radii differ (error:33).
+    """
+    sx, sy = round(start[0], decimals[0]), round(start[1], decimals[1])
+    ex, ey = round(x, decimals[0]), round(y, decimals[1])
+    cx, cy = start[0] + i, start[1] + j
+    dx, dy = ex - sx, ey - sy
+    length2 = dx * dx + dy * dy
+    if length2 > 0:
+        # move the centre onto the perpendicular bisector of the chord
+        mx, my = (sx + ex) / 2, (sy + ey) / 2
+        t = ((cx - mx) * -dy + (cy - my) * dx) / length2
+        cx, cy = mx - t * dy, my + t * dx
+    return cx - sx, cy - sy
+
+
+class GCodeMoveArcCommand(GCodeCommand):
+    def __init__(
+        self, x, y, i, j, clockwise=True, speed=None, start=None, *args, **kw
+    ):
+        super().__init__(*args, **kw)
+        self.x = x
+        self.y = y
+        self.i = i
+        self.j = j
+        self.clockwise = clockwise
+        self.speed = speed
+        # (x, y) where the arc starts, i and j are relative to it. If known
+        # the centre is corrected for the rounding of the start and end.
+        self.start = start
+
+    def _offset(self, decimals):
+        if self.start is None:
+            return self.i, self.j
+        return _arc_offset(self.start, self.x, self.y, self.i, self.j, decimals)
+
+    def command(self):
+        i, j = self._offset((2, 2))
+        result = b"G2" if self.clockwise else b"G3"
+        result += b" X%.2f Y%.2f I%.3f J%.3f" % (self.x, self.y, i, j)
+        if self.speed is not None:
+            result += b" F%.2f" % (self.speed)
+
+        result += b"\r"
+        return result
+
+    def encode(self, encoder):
+        i, j = self._offset(
+            (encoder.precision.get("X", 2), encoder.precision.get("Y", 2))
+        )
+        return encoder.arc(self.clockwise, self.x, self.y, i, j, speed=self.speed)
+
 
 class GCodeHomeCommand(GCodeCommand):
     def __init__(self, *args, **kw):
@@ -189,6 +412,9 @@ class GCodeSetSpindleCommand(GCodeCommand):
     def command(self):
         return b"M3 S%.2f\r" % (self.pos)
 
+    def encode(self, encoder):
+        return b"M3 S" + encoder.format("S", self.pos) + b"\r"
+
 
 class GCodeWaitCommand(GCodeCommand):
     def __init__(self, time, *args, **kw):
@@ -198,15 +424,204 @@ class GCodeWaitCommand(GCodeCommand):
     def command(self):
         return b"G4 P%.2f\r" % (self.time)
 
+    def encode(self, encoder):
+        return b"G4 P" + encoder.format("P", self.time) + b"\r"
+
+
+class GCodeJogCommand(GCodeCommand):
+    def __init__(self, x=None, y=None, z=None, speed=None, *args, **kw):
+        super().__init__(*args, **kw)
+        self.x = x
+        self.y = y
+        self.z = z
+        self.speed = speed
+
+    def command(self):
+        result = b"$J=G91 G21"
+        if self.x is not None:
+            result += b" X%.3f" % (self.x)
+        if self.y is not None:
+            result += b" Y%.3f" % (self.y)
+        if self.z is not None:
+            result += b" Z%.3f" % (self.z)
+        result += b" F%.0f\r" % (self.speed)
+        return result
+
+    def encode(self, encoder):
+        # the jog moves the machine and a jog cancel stops it anywhere, the
+        # next move must send all its axis words again
+        encoder.reset()
+        return self.command()
+
+
+class GCodeBarrier:
+    """
+    Synchronisatiepunt voor meerdere devices.
+
+    Elk device krijgt een GCodeSyncCommand in de wachtrij. Een device
+    stopt met versturen bij dat punt totdat alle devices het punt bereikt
+    hebben. Daarna gaan alle devices tegelijk verder.
+    """
+
+    def __init__(self, devices):
+        self.devices = list(devices)
+        self.gcode_result = GCodeResult()
+        self.aborted = False
+        self.__arrived = []
+
+    def _abort(self, device, exception):
+        # one device was reset, the others must not wait for it forever
+        self.aborted = True
+        _fail_future(self.gcode_result, exception)
+
+        arrived = [d for d in self.__arrived if d is not device]
+        self.__arrived = []
+        for device in arrived:
+            device._release_sync()
+
+    def _arrive(self, device):
+        if self.aborted:
+            device._release_sync()
+            return
+
+        self.__arrived.append(device)
+        if len(self.__arrived) < len(self.devices):
+            return
+
+        arrived = self.__arrived
+        self.__arrived = []
+        for device in arrived:
+            device._release_sync()
+
+        if not self.gcode_result.done():
+            self.gcode_result.set_result({"result": "ok", "error_code": 0})
+
+
+class GCodeSyncCommand(GCodeCommand):
+    def __init__(self, barrier, gcode=b"G4 P0", device=None, *args, **kw):
+        super().__init__(*args, **kw)
+        self.barrier = barrier
+        self.device = device
+        self.gcode = gcode
+        self.released = False
+
+    def command(self):
+        # the device only acknowledges the dwell once all motion is done
+        return self.gcode + b"\r"
+
+    def encode(self, encoder):
+        return self.command()
+
+    def holds_queue(self):
+        return not self.released
+
+    def _fail(self, exception):
+        super()._fail(exception)
+        self.barrier._abort(self.device, exception)
+
+
+class GCodeStreamCommand(GCodeCommand):
+    """
+    Een gecompileerd programma als een enkele opdracht in de wachtrij.
+
+    De regels worden direct uit de buffer van het programma verstuurd,
+    zonder een object per regel. Het resultaat is beschikbaar als alle
+    regels verwerkt zijn.
+
+    Parameters
+    ----------
+    program : CompiledProgram
+        Het programma, zie asyncgcodecli.compiler.
+    close : bool
+        Sluit het programma als de opdracht klaar is.
+    """
+
+    def __init__(self, program, close=False, *args, **kw):
+        super().__init__(*args, **kw)
+        self.program = program
+        self.line_count = len(program)
+        self.sent = 0
+        self.acked = 0
+        self.errors = []
+        self.__close = close
+        self.__sizes = None
+
+    def _next_lines(self, flow_control):
+        """Geef de bytes van de regels die nu verstuurd mogen worden."""
+        offsets = self.program.offsets
+        first = self.sent
+        end = offsets[first]
+        while self.sent < self.line_count:
+            start = end
+            end = offsets[self.sent + 1]
+            if not flow_control.can_send(self, end - start):
+                end = start
+                break
+            flow_control.on_send(self, end - start)
+            self.sent += 1
+
+        if self.sent == self.line_count:
+            self.send = True
+        return self.program.data[offsets[first] : end]
+
+    def _confirm_line(self, result):
+        """Verwerk het antwoord op de oudste regel, geeft de lengte terug."""
+        index = self.acked
+        if self.__sizes is None:
+            offsets = self.program.offsets
+            size = offsets[index + 1] - offsets[index]
+        else:
+            size = self.__sizes.pop(0)
+        self.acked += 1
+        if result.get("result") != "ok":
+            self.errors.append((index, result))
+
+        if self.acked == self.line_count:
+            self.confirmed = True
+            if self.errors:
+                self._resolve(
+                    {
+                        "result": "error",
+                        "error_code": self.errors[0][1].get("error_code"),
+                        "errors": self.errors,
+                    }
+                )
+            else:
+                self._resolve({"result": "ok", "error_code": 0})
+        return size
+
+    def _truncate(self):
+        """Stop after the lines that are sent, the program may be closed."""
+        offsets = self.program.offsets
+        self.__sizes = [
+            offsets[index + 1] - offsets[index]
+            for index in range(self.acked, self.sent)
+        ]
+        self.line_count = self.sent
+        self.send = True
+        self.confirmed = self.acked == self.sent
+
+    def _resolve(self, result):
+        super()._resolve(result)
+        if self.__close:
+            self.program.close()
+
+    def _fail(self, exception):
+        super()._fail(exception)
+        if self.__close:
+            self.program.close()
+
 
 class SerialReceiveThread(threading.Thread):
-    def __init__(self, port, loop, *args, **kw):
+    def __init__(self, port, loop, link=None, probe=None, *args, **kw):
         super().__init__(*args, **kw)
         self.event_queue = asyncio.Queue()
         self.port = port
         self.stop = False
         self._loop = loop
-        self.__serial = serial.Serial(None, baudrate=115200, timeout=0.01)
+        self.link = link if link is not None else SerialLink()
+        self.__probe = probe
+        self.__serial = self.link.create_serial()
         self.setDaemon(1)
 
     def post_event(self, event):
@@ -221,7 +636,10 @@ class SerialReceiveThread(threading.Thread):
 
     def write(self, gcode):
         self.__serial.write(gcode)
-        logger.log(logger.TRACE, "transmitted: {}", gcode.decode("utf-8"))
+        logger.log(logger.TRACE, "transmitted: {}", gcode.decode("utf-8", "replace"))
+
+    def close(self):
+        self.stop = True
 
     def run(self):
         logger.log(logger.INFO, "Connecting to {} ", (self.port))
@@ -237,8 +655,14 @@ class SerialReceiveThread(threading.Thread):
                         )
                     self.__serial.port = self.port
                     self.__serial.open()
+                    self.link.configure(self.__serial)
+                    banner = None
+                    if self.__probe is not None:
+                        banner = self.__probe(self.__serial)
                     self.post_event(GCodeDeviceConnectEvent(True))
                     logger.log(logger.INFO, "Connected.")
+                    for line in banner or []:
+                        self.post_event(ResponseReveivedEvent(line))
                     break
 
                 except serial.SerialException:
@@ -253,21 +677,23 @@ class SerialReceiveThread(threading.Thread):
                 (self.port),
             )
 
-        response = ""
+        response = bytearray()
 
         while self.__serial.is_open:
             if self.stop:
                 break
 
             try:
-                b = self.__serial.read(size=1)
-                if b:
-                    if b == b"\n" or b == b"\r":
-                        if len(response) > 0:
-                            self.post_event(ResponseReveivedEvent(response))
-                            response = ""
-                    else:
-                        response += b.decode("utf-8")
+                # read everything that is waiting, at high baudrates a
+                # byte per call can not keep up
+                response += self.__serial.read(self.__serial.in_waiting or 1)
+                lines = _LINE_END.split(response)
+                response = bytearray(lines.pop())
+                for line in lines:
+                    if line:
+                        self.post_event(
+                            ResponseReveivedEvent(line.decode("utf-8", "replace"))
+                        )
 
             except serial.SerialException:
                 logger.log(logger.FATAL, "Connection lost! {}", traceback.format_exc())
@@ -281,32 +707,147 @@ class SerialReceiveThread(threading.Thread):
 
 
 class GenericDriver:
+    sync_gcode = b"G4 P0"
+    banner = re.compile(r"Grbl \S+ \['\$' for help\]")
+    # a banner as the device sends it, for when there is no device
+    greeting = "Grbl 1.1h ['$' for help]"
+    # soft reset, makes GRBL send its banner again
+    probe_wakeup = b"\x18"
+    # seconds to wait for the banner after connecting before probe_wakeup
+    # is sent, a ser2net or telnet bridge does not reset the device
+    banner_timeout = 2.5
+    # seconds a script gets after a cached ready to queue its first moves,
+    # the settings are asked again once those are done
+    settings_refresh_delay = 0.1
+    # real-time commands, None if the device does not have them
+    feed_hold = b"!"
+    cycle_start = b"~"
+    soft_reset = b"\x18"
+    status_query = b"?"
+    # $J= jogging, None if the device can not jog
+    jog_cancel_code = b"\x85"
+
     def __init__(
-        self, port, async_event_queue=None, advanced_flow_control=False, *args, **kw
+        self,
+        port,
+        async_event_queue=None,
+        advanced_flow_control=False,
+        encoder=None,
+        io_hub=None,
+        flow_control=None,
+        serial_link=None,
+        transport=None,
+        settings_cache=None,
+        error_policy="continue",
+        *args,
+        **kw
     ):
         super().__init__(*args, **kw)
+        if error_policy not in _ERROR_POLICIES:
+            raise ValueError("unknown error_policy {!r}".format(error_policy))
+        # what to do when a command gives an error: "continue", "pause"
+        # (feed hold, nothing is sent until resume) or "abort", see abort
+        self.error_policy = error_policy
+        self.__paused = False
+        # nothing is sent while the transport is not connected
+        self.__connected = False
         self.__port = port
+        # anything with open_port(port, loop, link, probe), a SerialIOHub
+        # is one as well
+        self.__transport = transport if transport is not None else io_hub
+        self.serial_link = serial_link if serial_link is not None else SerialLink()
+        self.settings_cache = settings_cache
         self.__async_event_queue = async_event_queue
-        self.__advanced_flow_control = advanced_flow_control
+        if flow_control is None:
+            if advanced_flow_control:
+                flow_control = CharacterCounting()
+            else:
+                flow_control = StopAndWait()
+        self.flow_control = flow_control
+        self.encoder = encoder
         self.__serial = None
         self.__process_serial_events_task = None
+        self.__banner_timer = None
         self.__queue_empty_futures = []
+        self.__queue_space_futures = []
+        self.__gcode_queue = []
+        self.__processed_tail = 0
         self._ready_future = None
+        self.__status = "Unknown"
+        # the last reported (x, y, z), None if not known
+        self.position = None
+
+    @property
+    def port(self):
+        """De port van het apparaat."""
+        return self.__port
+
+    @property
+    def status(self):
+        """De laatst gemelde toestand, zoals "Idle" of "Run", of None."""
+        return None if self.__status == "Unknown" else self.__status
+
+    @property
+    def is_ready(self):
+        """True als het apparaat verbonden en ready is."""
+        future = self._ready_future
+        return (
+            future is not None
+            and future.done()
+            and not future.cancelled()
+            and future.exception() is None
+        )
+
+    @property
+    def paused(self):
+        """True na pause of abort, tot resume of een reset."""
+        return self.__paused
+
+    @property
+    def pending_commands(self):
+        """Het aantal opdrachten in de wachtrij dat nog niet verwerkt is."""
+        return len(self.__gcode_queue) - self.__processed_tail
 
     def _process_server_reset(self):
-        self.__conected = False
-        self.__processed_tail = 0
-        self.__gcode_queue = []
-        self.__send_limit = 128
+        self.__paused = False
+        self.__discard_queue(DeviceResetException("device was reset"))
         self.__status = "Unknown"
         if self._ready_future is None or self._ready_future.done():
             self._ready_future = asyncio.Future()
         self.settings = {}
+
+    def __discard_queue(self, exception):
+        """Laat alle opdrachten die nog niet verwerkt zijn mislukken."""
+        pending = [
+            command
+            for command in self.__gcode_queue[self.__processed_tail :]
+            if not command.confirmed
+        ]
+        self.__processed_tail = 0
+        self.__gcode_queue = []
+        self.flow_control.reset()
+        self.__sync_command = None
+        self.__sync_result = None
+        if self.encoder is not None:
+            self.encoder.reset()
+
+        if pending:
+            logger.log(
+                logger.WARNING,
+                "{}: {} unfinished commands failed",
+                (exception, len(pending)),
+            )
+        for command in pending:
+            command._fail(exception)
         self.__check_queue_empty()
 
     def _flush_queue(self):
         self.__gcode_queue = self.__gcode_queue[: self.__processed_tail]
 
+    def set_event_queue(self, async_event_queue):
+        """Stel de asyncio.Queue in die de events van dit device ontvangt."""
+        self.__async_event_queue = async_event_queue
+
     def _forward_event(self, event):
         if self.__async_event_queue:
             self.__async_event_queue.put_nowait(event)
@@ -316,13 +857,29 @@ class GenericDriver:
             while self.__serial is not None:
                 event = await self.__serial.event_queue.get()
                 if isinstance(event, ResponseReveivedEvent):
-                    self._process_response(event.response)
-
-                if (
-                    isinstance(event, GCodeDeviceConnectEvent)
-                    and event.connected is False
-                ):
-                    self._ready_future.set_exception(TimeoutException())
+                    if diagnostics.active:
+                        start = time.perf_counter()
+                        diagnostics._record("handoff", start - event.received_at)
+                        self._process_response(event.response)
+                        diagnostics._record(
+                            "process_response", time.perf_counter() - start
+                        )
+                    else:
+                        self._process_response(event.response)
+
+                if isinstance(event, GCodeDeviceConnectEvent):
+                    self.__connected = event.connected
+                    if event.connected:
+                        # a TCP bridge may reconnect without a reset and
+                        # banner, send what was queued in the meantime
+                        self.flow_control.reset()
+                        self.__process_queue()
+                        if not self._ready_future.done():
+                            self.__wait_for_banner()
+                    else:
+                        if not self._ready_future.done():
+                            self._ready_future.set_exception(TimeoutException())
+                        self.__discard_queue(DeviceResetException("connection lost"))
 
                 self.__check_queue_empty()
 
@@ -330,6 +887,23 @@ class GenericDriver:
         except Exception:
             logger.log(logger.FATAL, "error {}", traceback.format_exc())
 
+    def __wait_for_banner(self):
+        if self.probe_wakeup is None or self.banner_timeout is None:
+            return
+        if self.__banner_timer is not None:
+            self.__banner_timer.cancel()
+        ready = self._ready_future
+
+        def wake_up():
+            self.__banner_timer = None
+            if self.__connected and ready is self._ready_future and not ready.done():
+                logger.log(logger.INFO, "No banner from {}, resetting", self.__port)
+                self._write_realtime(self.probe_wakeup)
+
+        self.__banner_timer = asyncio.get_running_loop().call_later(
+            self.banner_timeout, wake_up
+        )
+
     def start(self):
         self._process_server_reset()
 
@@ -338,9 +912,26 @@ class GenericDriver:
 
         logger.log(logger.TRACE, "starting")
 
-        self.__serial = SerialReceiveThread(
-            self.__port, asyncio.events.get_running_loop()
-        )
+        probe = None
+        if self.serial_link.probe_baudrates:
+            probe = self._probe_link
+
+        transport = self.__transport
+        if transport is None and str(self.__port).startswith(_NETWORK_PORTS):
+            from asyncgcodecli.tcp import TcpConnector
+
+            transport = TcpConnector()
+
+        loop = asyncio.events.get_running_loop()
+        diagnostics._attach(loop)
+        if transport is not None:
+            self.__serial = transport.open_port(
+                self.__port, loop, self.serial_link, probe
+            )
+        else:
+            self.__serial = SerialReceiveThread(
+                self.__port, loop, self.serial_link, probe
+            )
 
         self.__process_serial_events_task = asyncio.create_task(
             self.__process_serial_events()
@@ -350,72 +941,434 @@ class GenericDriver:
 
         self.__serial.start()
 
+    def _probe_link(self, connection):
+        # runs in the serial thread
+        return self.serial_link.probe(connection, self.banner, self.probe_wakeup)
+
     def stop(self):
+        if self.__banner_timer is not None:
+            self.__banner_timer.cancel()
+            self.__banner_timer = None
+
         if self.__serial is not None:
-            self.__serial.stop = True
+            self.__serial.close()
 
         if self.__process_serial_events_task is not None:
             self.__process_serial_events_task.cancel()
 
     def __process_queue(self):
-        if not self.__serial:
+        if not diagnostics.active:
+            self.__send_queue()
             return
-
-        unconfirmed_commands_in_progress = False
+        start = time.perf_counter()
+        window_full = self.__send_queue()
+        diagnostics._record("process_queue", time.perf_counter() - start)
+        # commands wait for the device, not for the event loop
+        diagnostics._window_full(self, window_full)
+
+    def __send_queue(self):
+        # returns True when commands wait because the flow control is full
+        if not self.__serial or not self.__connected or self.__paused:
+            return False
+
+        window_full = False
+        # commands are collected and written at once, one write per
+        # command costs a system call and often a USB frame each
+        pending = bytearray()
+        flow_control = self.flow_control
         for index in range(self.__processed_tail, len(self.__gcode_queue)):
             head = self.__gcode_queue[index]
 
-            if head.send and not head.confirmed:
-                unconfirmed_commands_in_progress = True
-
-            if unconfirmed_commands_in_progress and not self.__advanced_flow_control:
-                break
             if head.send:
+                if head.holds_queue():
+                    break
+                continue
+
+            if isinstance(head, GCodeStreamCommand):
+                if head.sent == 0 and self.encoder is not None:
+                    # the program leaves the modal state unknown
+                    self.encoder.reset()
+                pending += head._next_lines(flow_control)
+                if not head.send:
+                    window_full = True
+                    break
                 continue
 
-            command = head.command()
+            command = self._encode_command(head)
             command_len = len(command)
-            if command_len > self.__send_limit:
+            if not flow_control.can_send(head, command_len):
+                window_full = True
                 break
 
-            self.__serial.write(command)
-            self.__send_limit -= command_len
-            print(self.__send_limit)
+            pending += command
+            flow_control.on_send(head, command_len)
             head.send = True
 
             if not head.expect_ok:
-                self._confirm_command({"result": "ok", "error_code": 0})
+                # confirming sends the next commands, keep them in order
+                self.__serial.write(bytes(pending))
+                pending = bytearray()
+                self._confirm_command({"result": "ok", "error_code": 0}, head)
 
-            if not head.confirmed:
-                unconfirmed_commands_in_progress = True
+            if head.holds_queue():
+                break
+
+        if pending:
+            self.__serial.write(bytes(pending))
+        return window_full
 
-    def _confirm_command(self, result):
+    def _confirm_command(self, result, command=None):
+        """
+        Verwerk het antwoord op een verstuurde opdracht.
+
+        Parameters
+        ----------
+        result : dict
+            Het resultaat van de opdracht.
+        command : GCodeCommand
+            De opdracht waar het antwoord bij hoort. Als None, dan is het
+            de oudste opdracht die nog geen antwoord heeft.
+        """
         try:
-            head = self.__gcode_queue[self.__processed_tail]
-            head.confirmed = True
-            head.gcode_result.set_result(result)
-            self.__processed_tail += 1
-            self._forward_event(CommandProcessedEvent(head))
-            self.__send_limit += len(head.command())
-            print(self.__send_limit)
+            head = command
+            if head is None:
+                head = self.__gcode_queue[self.__processed_tail]
+            if head.holds_queue():
+                # reached a barrier, wait for the other devices
+                self.__sync_command = head
+                self.__sync_result = result
+                head.barrier._arrive(self)
+                return
+
+            if isinstance(head, GCodeStreamCommand):
+                size = head._confirm_line(result)
+            else:
+                head.confirmed = True
+                head._resolve(result)
+                size = len(head.wire)
+            self.flow_control.on_confirm(head, size, result)
+
+            # replies may arrive out of order, move past everything confirmed
+            old_tail = self.__processed_tail
+            while (
+                self.__processed_tail < len(self.__gcode_queue)
+                and self.__gcode_queue[self.__processed_tail].confirmed
+            ):
+                self.__processed_tail += 1
+
+            if self.__async_event_queue and head.confirmed:
+                self._forward_event(CommandProcessedEvent(head))
+                if old_tail < self.__processed_tail < len(self.__gcode_queue):
+                    new_head = self.__gcode_queue[self.__processed_tail]
+                    self._forward_event(CommandStartedEvent(new_head))
+
+            if result.get("result") == "error":
+                if self.encoder is not None:
+                    # the rejected words never became the modal state
+                    self.encoder.reset()
+                if self.error_policy != "continue":
+                    self.__apply_error_policy(result, head)
 
-            if self.__processed_tail < len(self.__gcode_queue):
-                new_head = self.__gcode_queue[self.__processed_tail]
-                self._forward_event(CommandStartedEvent(new_head))
             self.__process_queue()
-        except Exception as e:
-            logger.log(logger.FATAL, "error {}", e.with_traceback())
+        except Exception:
+            logger.log(logger.FATAL, "error {}", traceback.format_exc())
+
+    def __apply_error_policy(self, result, command):
+        logger.log(
+            logger.WARNING,
+            "Device error {}, {}",
+            (result.get("error_code"), self.error_policy),
+        )
+        if self.error_policy == "abort":
+            self.abort(
+                CommandAbortedException(
+                    "aborted after error {}".format(result.get("error_code")),
+                    result,
+                    command,
+                )
+            )
+        else:
+            self.pause()
+
+    def query_status(self):
+        """
+        Vraag de status en positie op, buiten de wachtrij om.
+
+        Het antwoord werkt status en position bij. Doet niets als het
+        apparaat niet ready is of geen real-time statusvraag heeft, zoals
+        de UArm.
+        """
+        if self.status_query is not None and self.is_ready:
+            self._write_realtime(self.status_query)
+
+    def pause(self):
+        """
+        Pauzeer: stuur een feed hold en verstuur geen opdrachten meer.
+
+        Het apparaat remt af en stopt. Opdrachten die in de wachtrij
+        staan blijven staan tot resume.
+        """
+        self.__paused = True
+        if self.feed_hold is not None:
+            self._write_realtime(self.feed_hold)
+
+    def resume(self):
+        """Ga verder na pause of abort."""
+        self.__paused = False
+        if self.cycle_start is not None:
+            self._write_realtime(self.cycle_start)
+        self.__process_queue()
+
+    def reset(self):
+        """
+        Stuur een soft reset.
+
+        Het apparaat vergeet alle opdrachten die het nog had, ook de
+        bewegingen die na een abort nog in zijn buffer stonden. Het
+        apparaat is weer ready als het opnieuw begroet heeft, ready
+        wacht daarop.
+        """
+        if self.soft_reset is not None:
+            if self._ready_future is not None and self._ready_future.done():
+                self._ready_future = asyncio.Future()
+            self._write_realtime(self.soft_reset)
+
+    def abort(self, exception=None):
+        """
+        Breek alles af.
+
+        Stuurt een feed hold, haalt alle opdrachten die nog niet
+        verstuurd zijn uit de wachtrij en laat het resultaat van alle
+        onverwerkte opdrachten in een keer mislukken. Scripts die op een
+        resultaat wachten krijgen direct de exception.
+
+        Opdrachten die al verstuurd waren staan nog in de buffer van het
+        apparaat. resume voert ze alsnog uit, reset gooit ze weg.
+
+        Parameters
+        ----------
+        exception : Exception
+            De exception voor de onverwerkte opdrachten, standaard een
+            CommandAbortedException.
+        """
+        if exception is None:
+            exception = CommandAbortedException()
+        self.pause()
+
+        queue = self.__gcode_queue
+        pending = []
+        kept = queue[: self.__processed_tail]
+        for command in queue[self.__processed_tail :]:
+            if command.confirmed:
+                kept.append(command)
+                continue
+            pending.append(command)
+            if isinstance(command, GCodeStreamCommand) and command.sent:
+                # the device answers the lines it has, nothing more is sent
+                command._truncate()
+            if command.send and not command.confirmed:
+                # keep it, the answer must not be taken for a later command
+                kept.append(command)
+        self.__gcode_queue = kept
+        while (
+            self.__processed_tail < len(kept)
+            and kept[self.__processed_tail].confirmed
+        ):
+            self.__processed_tail += 1
+
+        if pending:
+            logger.log(
+                logger.WARNING, "{}: {} commands aborted", (exception, len(pending))
+            )
+        for command in pending:
+            command._fail(exception)
+        self.__check_queue_empty()
+
+    def _encode_command(self, command):
+        """
+        Geef de bytes die voor een opdracht verstuurd worden.
+
+        Een opdracht wordt maar een keer geencodeerd, in de volgorde
+        waarin de opdrachten verstuurd worden, zodat de modale toestand
+        van de encoder klopt.
+        """
+        if command.wire is None:
+            if self.encoder is None:
+                command.wire = command.command()
+            else:
+                command.wire = command.encode(self.encoder)
+        return command.wire
+
+    def _release_sync(self):
+        command = self.__sync_command
+        self.__sync_command = None
+        command.released = True
+        self._confirm_command(self.__sync_result, command)
+
+    def __compact_queue(self):
+        # drop processed commands once they make up most of the queue
+        if self.__processed_tail > 1024 and (
+            2 * self.__processed_tail > len(self.__gcode_queue)
+        ):
+            del self.__gcode_queue[: self.__processed_tail]
+            self.__processed_tail = 0
 
     def queue_command(self, command):
+        self._enqueue_command(command)
+        return command.gcode_result
+
+    def _enqueue_command(self, command):
+        """
+        Zet een opdracht in de wachtrij zonder een future te maken.
+
+        Voor wie het resultaat niet of pas later nodig heeft, bijvoorbeeld
+        een Job. command.confirmed, command.result en command.error geven
+        de afloop, command.gcode_result maakt alsnog een future.
+        """
+        self.__compact_queue()
         self.__gcode_queue.append(command)
-        self._forward_event(CommandQueuedEvent(command))
 
-        if self.__processed_tail == len(self.__gcode_queue) - 1:
-            head = self.__gcode_queue[self.__processed_tail]
-            self._forward_event(CommandStartedEvent(head))
+        if self.__async_event_queue:
+            self._forward_event(CommandQueuedEvent(command))
+            if self.__processed_tail == len(self.__gcode_queue) - 1:
+                head = self.__gcode_queue[self.__processed_tail]
+                self._forward_event(CommandStartedEvent(head))
 
         self.__process_queue()
-        return command.gcode_result
+
+    def queue_batch(self, commands):
+        """
+        Zet een groep opdrachten in een keer in de wachtrij.
+
+        Dit is veel sneller dan queue_command voor elke opdracht apart.
+        Er wordt maar een future gemaakt voor de hele groep.
+
+        Parameters
+        ----------
+        commands : list
+            De opdrachten.
+
+        Returns
+        -------
+        GCodeResult
+            Een future voor het resultaat van de hele groep. Het resultaat
+            bevat "errors" als een of meer opdrachten een fout gaven.
+        """
+        commands = list(commands)
+        batch = GCodeBatch(commands)
+        self.__compact_queue()
+        was_idle = self.__processed_tail == len(self.__gcode_queue)
+        self.__gcode_queue.extend(commands)
+
+        if commands and self.__async_event_queue:
+            for command in commands:
+                self._forward_event(CommandQueuedEvent(command))
+            if was_idle:
+                self._forward_event(CommandStartedEvent(commands[0]))
+
+        self.__process_queue()
+        return batch.gcode_result
+
+    def stream_program(self, program):
+        """
+        Verstuur een gecompileerd programma.
+
+        De regels gaan direct uit het (gemapte) bestand naar het
+        apparaat, er worden geen objecten per regel gemaakt.
+
+        Parameters
+        ----------
+        program : CompiledProgram of string
+            Het programma of het pad van een gecompileerd bestand, zie
+            asyncgcodecli.compiler.
+
+        Returns
+        -------
+        GCodeResult
+            Een future voor het resultaat van het hele programma. Het
+            resultaat bevat "errors" als (regel, resultaat) paren als een
+            of meer regels een fout gaven.
+        """
+        close = False
+        if not hasattr(program, "offsets"):
+            from asyncgcodecli.compiler import CompiledProgram
+
+            program = CompiledProgram.open(program)
+            close = True
+
+        command = GCodeStreamCommand(program, close)
+        if command.line_count == 0:
+            command._resolve({"result": "ok", "error_code": 0})
+            return command.gcode_result
+        return self.queue_command(command)
+
+    def jog(self, x=None, y=None, z=None, speed=1000):
+        """
+        Jog een stukje ten opzichte van de huidige positie ($J=).
+
+        Parameters
+        ----------
+        x, y, z : float
+            De verplaatsing in mm.
+        speed : float
+            De snelheid in mm/min.
+
+        Returns
+        -------
+        GCodeResult
+            Een future voor het resultaat. Het apparaat bevestigt een jog
+            zodra die gepland is, niet als hij klaar is.
+        """
+        if self.jog_cancel_code is None:
+            raise ValueError("{} can not jog".format(type(self).__name__))
+        return self.queue_command(GCodeJogCommand(x=x, y=y, z=z, speed=speed))
+
+    def jog_cancel(self):
+        """
+        Stop direct met joggen.
+
+        Stuurt het real-time jog cancel teken, het apparaat remt dan af
+        en vergeet alle geplande jogs. Jogs die nog niet verstuurd waren
+        worden uit de wachtrij gehaald.
+        """
+        if self.jog_cancel_code is None:
+            return
+        self._write_realtime(self.jog_cancel_code)
+        if self.encoder is not None:
+            # the machine stops somewhere along the jog
+            self.encoder.reset()
+        for command in self.__gcode_queue[self.__processed_tail :]:
+            if isinstance(command, GCodeJogCommand) and not command.send:
+                self._withdraw(command)
+
+    def _write_realtime(self, data):
+        """Verstuur real-time tekens direct, buiten de wachtrij om."""
+        if self.__serial is not None:
+            self.__serial.write(data)
+
+    def _withdraw(self, command):
+        """Haal een opdracht die nog niet verstuurd is uit de wachtrij."""
+        if command.send or command.confirmed:
+            return False
+        self.__gcode_queue.remove(command)
+        command.confirmed = True
+        command._resolve({"result": "cancelled", "error_code": None})
+        self.__check_queue_empty()
+        return True
+
+    def _last_result(self):
+        """
+        Geef het resultaat van de laatst toegevoegde opdracht.
+
+        Als alle opdrachten al verwerkt zijn, dan is het resultaat
+        direct beschikbaar.
+        """
+        if self.__processed_tail < len(self.__gcode_queue):
+            return self.__gcode_queue[-1].gcode_result
+
+        result = GCodeResult()
+        result.set_result({"result": "ok", "error_code": 0})
+        return result
 
     def __check_queue_empty(self):
         """
@@ -428,17 +1381,79 @@ class GenericDriver:
 
             self.__queue_empty_futures.clear()
 
+        if self.__queue_space_futures:
+            pending = len(self.__gcode_queue) - self.__processed_tail
+            waiting = []
+            for limit, f in self.__queue_space_futures:
+                if pending <= limit:
+                    if not f.done():
+                        f.set_result(True)
+                else:
+                    waiting.append((limit, f))
+            self.__queue_space_futures = waiting
+
+    @staticmethod
+    def synchronize(devices):
+        """
+        Laat meerdere devices op elkaar wachten.
+
+        Zet in de wachtrij van elk device een synchronisatiepunt. Een
+        device gaat pas verder met de opdrachten na dit punt als alle
+        devices hun bewegingen tot dit punt afgerond hebben. Daarna
+        gaan ze allemaal tegelijk verder. Het script hoeft hier niet op
+        te wachten, het kan direct de volgende opdrachten klaarzetten.
+
+        Parameters
+        ----------
+        devices : list
+            De devices die op elkaar moeten wachten.
+
+        Returns
+        -------
+        GCodeResult
+            Een future die klaar is als alle devices het punt bereikt
+            hebben.
+
+        Example
+        -------
+
+        Twee armen die om de beurt naar links en rechts bewegen::
+
+            for _ in range(5):
+                arms[0].move_linear(150, -200, 150, 200)
+                arms[1].move_linear(150, 200, 150, 200)
+                GenericDriver.synchronize(arms)
+        """
+        barrier = GCodeBarrier(devices)
+        for device in barrier.devices:
+            device.queue_command(
+                GCodeSyncCommand(barrier, device.sync_gcode, device)
+            )
+        return barrier.gcode_result
+
     async def wait_queue_empty(self):
         future = asyncio.Future()
         self.__queue_empty_futures.append(future)
         self.__check_queue_empty()
         return await future
 
+    async def wait_queue_space(self, max_pending):
+        """
+        Wacht tot er hoogstens max_pending opdrachten onverwerkt zijn.
+
+        Zo kan een script opdrachten bijmaken terwijl het apparaat nog
+        bezig is, zonder dat de wachtrij onbeperkt groeit.
+        """
+        future = asyncio.Future()
+        self.__queue_space_futures.append((max_pending, future))
+        self.__check_queue_empty()
+        return await future
+
     async def ready(self):
         return await self._ready_future
 
     def _queue_get_status(self):
-        self.queue_command(GCodeGenericCommand("?"))
+        self._enqueue_command(GCodeGenericCommand("?"))
 
     async def wait_for_idle(self):
         await self.wait_queue_empty()
@@ -449,6 +1464,76 @@ class GenericDriver:
             self._queue_get_status()
             await asyncio.sleep(0.5)
 
+    def _query_settings(self, firmware):
+        """
+        Vraag de instellingen op en maak het device daarna ready.
+
+        Met een settings_cache is het device direct ready als de
+        instellingen voor deze poort en firmware bekend zijn. Ze worden
+        dan ververst zodra de wachtrij na settings_refresh_delay leeg is,
+        zodat $$ de eerste bewegingen van het script niet ophoudt.
+
+        Parameters
+        ----------
+        firmware : string
+            De begroeting van het apparaat.
+        """
+        cache = self.settings_cache
+        cached = None
+        if cache is not None:
+            cached = cache.load(self.__port, firmware)
+            if cached is not None:
+                logger.log(logger.DEBUG, "Using cached settings for {}", self.__port)
+                self.settings.update(cached)
+                if not self._ready_future.done():
+                    self._ready_future.set_result(True)
+
+        async def wait_for_settings(settings_command):
+            if settings_command is None:
+                ready = self._ready_future
+                # the script got ready first and queues its moves now
+                await asyncio.sleep(self.settings_refresh_delay)
+                while self.pending_commands:
+                    await self.wait_queue_empty()
+                    await asyncio.sleep(0)
+                if self._ready_future is not ready:
+                    # reset in the meantime, the new banner asks again
+                    return
+                settings_command = GCodeGenericCommand("$$")
+                self.queue_command(settings_command)
+
+            try:
+                result = await settings_command.gcode_result
+            except DeviceResetException:
+                # the device greets again and the settings are asked again,
+                # that query makes the device ready
+                return
+            except CommandAbortedException as e:
+                logger.log(
+                    logger.WARNING, "Settings of {} not read: {}", (self.__port, e)
+                )
+                result = None
+
+            if cache is not None and result is not None and result["result"] == "ok":
+                if cache.store(self.__port, firmware, self.settings):
+                    logger.log(logger.DEBUG, "Settings of {} changed", self.__port)
+
+            if not self._ready_future.done():
+                self._ready_future.set_result(True)
+
+        settings_command = None
+        if cached is None:
+            settings_command = GCodeGenericCommand("$$")
+            self.queue_command(settings_command)
+        asyncio.create_task(wait_for_settings(settings_command))
+
+    def _prepare_resume(self):
+        """
+        Breng het apparaat in een veilige toestand voor het hervatten van
+        een job, er volgt een snelle beweging naar de laatste positie.
+        """
+        return self._last_result()
+
     def _process_response(self, response):
         m = re.compile(r"\<?(.*)\>").match(response)
         if m is not None:
@@ -457,23 +1542,9 @@ class GenericDriver:
         if response == "ok":
             self._confirm_command({"result": "ok", "error_code": 0})
 
-        if response == "Grbl 1.1h ['$' for help]":
+        if self.banner.fullmatch(response):
             self._process_server_reset()
-
-            settings_command = GCodeGenericCommand("$$")
-            self.queue_command(settings_command)
-
-            async def wait_for_settings(settings_command):
-                await settings_command.gcode_result
-
-                if not self._ready_future.done():
-                    self._ready_future.set_result(True)
-                else:
-                    # Todo deal with case of second setting responses
-                    # for example after pressing the plotter reset button
-                    pass
-
-            asyncio.create_task(wait_for_settings(settings_command))
+            self._query_settings(response)
 
         m = re.compile(r"\$([0-9]+)=([0-9]+\.?[0-9]*).*").match(response)
         if m is not None:
@@ -481,17 +1552,23 @@ class GenericDriver:
 
         m = re.compile(r"error:(.*)").match(response)
         if m is not None:
-            # ToDo set error
             self._confirm_command({"result": "error", "error_code": m[1]})
 
         m = re.compile(r"E([0-9]*)").match(response)
         if m is not None:
-            # ToDo set error
             self._confirm_command({"result": "error", "error_code": m[1]})
 
     def _process_status(self, status):
         components = status.split("|")
         self.__status = components[0]
+        for component in components[1:]:
+            if component.startswith(("MPos:", "WPos:")):
+                try:
+                    self.position = tuple(
+                        float(value) for value in component[5:].split(",")[:3]
+                    )
+                except ValueError:
+                    pass
 
     def setStatus(self, status):
         self.__status = status
@@ -525,7 +1602,30 @@ class GenericDriver:
         await asyncio.sleep(time)
 
     @staticmethod
-    def execute_on_devices(devices, script):
+    async def _execute_script(devices, script):
+        try:
+            for device in devices:
+                device.start()
+                await device.ready()
+
+            logger.log(logger.INFO, "Executing script")
+            await script(devices)
+            logger.log(logger.INFO, "Script executed successfully")
+
+            for device in devices:
+                await device.wait_for_idle()
+                device.stop()
+
+            logger.log(logger.INFO, "do_execute ended")
+
+        except TimeoutException:
+            pass
+
+        except Exception:
+            logger.log(logger.FATAL, "Error {}", traceback.format_exc())
+
+    @staticmethod
+    def execute_on_devices(devices, script, processes=None):
         """
         Voer een script uit op meerdere devices.
 
@@ -539,6 +1639,10 @@ class GenericDriver:
                 ]
         script : script
             Het uit te voeren script.
+        processes : int
+            Als dit opgegeven is, dan worden de devices over dit aantal
+            processen verdeeld. Het script krijgt dan DeviceProxy objecten,
+            zie asyncgcodecli.fleet.execute_sharded.
 
         Examples
         --------
@@ -555,41 +1659,102 @@ class GenericDriver:
                 ],
                 do_move_arm)
         """
+        if processes is not None:
+            from asyncgcodecli.fleet import execute_sharded
 
-        async def do_execute():
-            try:
-                for device in devices:
-                    device.start()
-                    await device.ready()
+            return execute_sharded(devices, script, processes)
 
-                logger.log(logger.INFO, "Executing script")
-                await script(devices)
-                logger.log(logger.INFO, "Script executed successfully")
+        asyncio.run(GenericDriver._execute_script(devices, script))
 
-                for device in devices:
-                    await device.wait_for_idle()
-                    device.stop()
+    def move_rapid(self, x=None, y=None, z=None, speed=10000):
+        return self.queue_command(GCodeMoveRapidCommand(x=x, y=y, z=z, speed=speed))
+
+    def move_linear(self, x=None, y=None, z=None, speed=10000):
+        return self.queue_command(GCodeMoveLinearCommand(x=x, y=y, z=z, speed=speed))
+
+    def move_path(self, points, speed=10000):
+        """
+        Beweeg in rechte lijnen langs een reeks punten.
 
-                logger.log(logger.INFO, "do_execute ended")
+        Parameters
+        ----------
+        points : list
+            Lijst van (x, y) of (x, y, z) punten.
+        speed : float
+            De snelheid.
 
-            except TimeoutException:
-                pass
+        Returns
+        -------
+        GCodeResult
+            Een future voor het resultaat van alle bewegingen samen.
+        """
+        return self.queue_batch(
+            [GCodeMoveLinearCommand(*point, speed=speed) for point in points]
+        )
 
-            except Exception:
-                logger.log(logger.FATAL, "Error {}", traceback.format_exc())
+    def move_polyline(self, points, speed=10000, tolerance=0.0, arc_tolerance=None):
+        """
+        Beweeg langs een lijn van punten.
 
-        asyncio.run(do_execute())
+        De lijn kan eerst vereenvoudigd worden: punten die minder dan
+        tolerance van de lijn afwijken worden weggelaten en reeksen
+        punten op een cirkel worden vervangen door een G2/G3 boog.
+        Dit scheelt veel kleine G1 opdrachten.
 
-    def move_rapid(self, x=None, y=None, z=None, speed=10000):
-        return self.queue_command(GCodeMoveRapidCommand(x=x, y=y, z=z, speed=speed))
+        Parameters
+        ----------
+        points : list
+            Lijst van (x, y) of (x, y, z) punten. Het eerste punt is de
+            huidige positie. Bogen worden alleen herkend waar z gelijk
+            blijft.
+        speed : float
+            De snelheid.
+        tolerance : float
+            De maximale afwijking bij het vereenvoudigen. 0 schakelt
+            vereenvoudigen uit.
+        arc_tolerance : float
+            De maximale afwijking van een boog. None schakelt
+            boogherkenning uit.
 
-    def move_linear(self, x=None, y=None, z=None, speed=10000):
-        return self.queue_command(GCodeMoveLinearCommand(x=x, y=y, z=z, speed=speed))
+        Returns
+        -------
+        GCodeResult
+            Een future voor het resultaat van alle bewegingen samen.
+        """
+        # numpy is slow to import, only load it when it is used
+        from asyncgcodecli.simplify import simplify_path
+
+        commands = []
+        start = points[0] if points else None
+        for segment in simplify_path(points, tolerance, arc_tolerance):
+            if segment[0] == "line":
+                x, y, *z = segment[1]
+                commands.append(
+                    GCodeMoveLinearCommand(x=x, y=y, z=z[0] if z else None, speed=speed)
+                )
+            else:
+                # an arc keeps the z of its start point
+                _, (x, y, *_), (i, j), clockwise = segment
+                commands.append(
+                    GCodeMoveArcCommand(
+                        x,
+                        y,
+                        i,
+                        j,
+                        clockwise=clockwise,
+                        speed=speed,
+                        start=(start[0], start[1]),
+                    )
+                )
+            start = segment[1]
+        return self.queue_batch(commands)
 
 
 class GRBLDriver(GenericDriver):
     """Stelt een op GRBL gebasseerd apparaat voor."""
 
+    banner = re.compile(r"Grbl \S+ \['\$' for help\]|@1")
+
     def __init__(self, port, *args, **kw):
         """
         Maak een nieuw GRBLDriver object.
@@ -602,6 +1767,9 @@ class GRBLDriver(GenericDriver):
         super().__init__(port, *args, **kw)
         self.limit_switch_on = False
 
+    def _prepare_resume(self):
+        return self.queue_command(GCodeGenericCommand("M5"))
+
     def _process_response(self, response):
         super()._process_response(response)
 
@@ -610,14 +1778,3 @@ class GRBLDriver(GenericDriver):
 
         if response == "@6 N0 V0":
             self.limit_switch_on = False
-
-        if response == "@1":
-            settings_command = GCodeGenericCommand("$$")
-            self.queue_command(settings_command)
-
-            async def wait_for_settings(settings_command):
-                await settings_command.gcode_result
-
-                self._ready_future.set_result(True)
-
-            asyncio.create_task(wait_for_settings(settings_command))
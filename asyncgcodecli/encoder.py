@@ -0,0 +1,119 @@
+"""Compact gcode encoding with modal state tracking."""
+
+__all__ = ["GCodeEncoder"]
+
+
+class GCodeEncoder:
+    """
+    Maakt zo kort mogelijke gcode regels.
+
+    De encoder onthoudt de modale toestand van het apparaat (bewegingsmode,
+    positie en snelheid) en laat woorden weg die niet veranderd zijn.
+    Getallen worden zonder overbodige nullen verstuurd.
+
+    Als het apparaat een regel weigert, vergeet de driver de modale
+    toestand, de volgende regel is dan weer volledig. Regels die al
+    verstuurd waren na de geweigerde regel zijn gecodeerd alsof die wel
+    uitgevoerd was, met error_policy "continue" kunnen zij dus een
+    verkeerde positie of snelheid hebben. Gebruik "pause" of "abort"
+    als dat niet mag.
+
+    Parameters
+    ----------
+    precision : dict
+        Aantal decimalen per as, bijvoorbeeld {"X": 3, "F": 0}. Assen die
+        niet genoemd worden krijgen 2 decimalen, het middelpunt van een
+        boog (I en J) krijgt er 3.
+    separator : bytes
+        Scheidingsteken tussen de woorden. GRBL accepteert ook b"".
+
+    Example
+    -------
+
+    Gebruik een encoder voor een plotter::
+
+        plotter = Plotter("/dev/ttyUSB0", encoder=GCodeEncoder())
+    """
+
+    def __init__(self, precision=None, separator=b" "):
+        # GRBL checks that the arc radius at the start and end agree to
+        # 0.005 mm, the centre needs more precision than the end point
+        self.precision = {"I": 3, "J": 3}
+        if precision is not None:
+            self.precision.update(precision)
+        self.separator = separator
+        self.reset()
+
+    def reset(self):
+        """Vergeet de modale toestand, bijvoorbeeld na een reset."""
+        self.motion = None
+        self.position = {}
+        self.feed = None
+        self.absolute = True
+
+    def format(self, axis, value):
+        """Formatteer een getal voor een as zonder overbodige nullen."""
+        result = b"%.*f" % (self.precision.get(axis, 2), value)
+        if b"." in result:
+            result = result.rstrip(b"0").rstrip(b".")
+        if result == b"-0":
+            result = b"0"
+        return result
+
+    def move(self, motion, axes, speed=None):
+        """
+        Encodeer een G0/G1 beweging.
+
+        Parameters
+        ----------
+        motion : bytes
+            b"G0" of b"G1".
+        axes : list
+            Lijst van (as, waarde) paren, waarde mag None zijn.
+        speed : float
+            De snelheid of None.
+        """
+        words = []
+        if motion != self.motion:
+            words.append(motion)
+            self.motion = motion
+
+        for axis, value in axes:
+            if value is None:
+                continue
+            formatted = self.format(axis, value)
+            if not self.absolute or self.position.get(axis) != formatted:
+                words.append(axis.encode() + formatted)
+                self.position[axis] = formatted
+
+        if speed is not None:
+            formatted = self.format("F", speed)
+            if formatted != self.feed:
+                words.append(b"F" + formatted)
+                self.feed = formatted
+
+        # a line without words would not be acknowledged
+        if not words:
+            words.append(motion)
+
+        return self.separator.join(words) + b"\r"
+
+    def arc(self, clockwise, x, y, i, j, speed=None):
+        """Encodeer een G2/G3 boog, doel en middelpunt worden altijd verstuurd."""
+        motion = b"G2" if clockwise else b"G3"
+        words = [] if motion == self.motion else [motion]
+        self.motion = motion
+
+        for axis, value in (("X", x), ("Y", y), ("I", i), ("J", j)):
+            formatted = self.format(axis, value)
+            words.append(axis.encode() + formatted)
+            if axis in "XY":
+                self.position[axis] = formatted
+
+        if speed is not None:
+            formatted = self.format("F", speed)
+            if formatted != self.feed:
+                words.append(b"F" + formatted)
+                self.feed = formatted
+
+        return self.separator.join(words) + b"\r"
@@ -0,0 +1,331 @@
+"""Run devices in a pool of worker processes."""
+
+__all__ = ["DeviceProxy", "execute_sharded"]
+
+import asyncio
+import inspect
+import multiprocessing
+import pickle
+import queue
+import threading
+import traceback
+import asyncgcodecli.logger as logger
+from asyncgcodecli.driver import (
+    GCodeDeviceConnectEvent,
+    ResponseReveivedEvent,
+    GenericDriver,
+)
+
+
+class _Channel:
+    """
+    Batched messages over a multiprocessing pipe.
+
+    Messages that are sent during one iteration of the event loop are
+    collected and sent as a single list. A thread writes them, a blocking
+    send on the event loop could deadlock when both processes fill their
+    pipe and neither reads.
+    """
+
+    def __init__(self, connection, handler):
+        self.connection = connection
+        self.closed = asyncio.Event()
+        self.__handler = handler
+        self.__outbox = []
+        self.__writes = queue.SimpleQueue()
+        self.__loop = asyncio.get_running_loop()
+        self.__loop.add_reader(connection.fileno(), self.__on_readable)
+        self.__writer = threading.Thread(target=self.__write_all, daemon=True)
+        self.__writer.start()
+
+    def send(self, message):
+        if not self.__outbox:
+            self.__loop.call_soon(self.__flush)
+        self.__outbox.append(message)
+
+    def __flush(self):
+        outbox = self.__outbox
+        self.__outbox = []
+        if outbox and not self.closed.is_set():
+            self.__writes.put(outbox)
+
+    def __write_all(self):
+        while True:
+            outbox = self.__writes.get()
+            if outbox is None:
+                return
+            try:
+                self.connection.send(outbox)
+            except (BrokenPipeError, OSError):
+                self.__loop.call_soon_threadsafe(self.close)
+                return
+
+    def __on_readable(self):
+        try:
+            while self.connection.poll():
+                for message in self.connection.recv():
+                    self.__handler(message)
+        except (EOFError, OSError):
+            self.close()
+
+    def close(self):
+        if not self.closed.is_set():
+            self.__flush()
+            self.__writes.put(None)
+            self.__loop.remove_reader(self.connection.fileno())
+            self.closed.set()
+
+    async def wait_written(self, timeout=5):
+        """Wait until the writer thread sent everything before close."""
+        await self.__loop.run_in_executor(None, self.__writer.join, timeout)
+
+
+class _Worker:
+    """The part that runs inside a worker process."""
+
+    def __init__(self, devices):
+        self.devices = devices
+        self.channel = None
+        self.event_tasks = []
+
+    def handle(self, message):
+        kind = message[0]
+        if kind == "call":
+            _, call_id, index, name, args, kw = message
+            try:
+                result = getattr(self.devices[index], name)(*args, **kw)
+            except Exception as e:
+                self.channel.send(("error", call_id, _picklable(e)))
+                return
+
+            if inspect.isawaitable(result):
+                asyncio.ensure_future(self.reply(call_id, result))
+            else:
+                self.channel.send(("result", call_id, _result_value(result)))
+
+        elif kind == "get":
+            _, call_id, index, name = message
+            try:
+                value = getattr(self.devices[index], name)
+            except Exception as e:
+                self.channel.send(("error", call_id, _picklable(e)))
+                return
+            self.channel.send(("result", call_id, _result_value(value)))
+
+        elif kind == "shutdown":
+            self.channel.close()
+
+    async def reply(self, call_id, awaitable):
+        try:
+            result = await awaitable
+        except Exception as e:
+            self.channel.send(("error", call_id, _picklable(e)))
+        else:
+            self.channel.send(("result", call_id, _result_value(result)))
+
+    async def forward_events(self, index, queue):
+        while True:
+            event = await queue.get()
+            # command events refer to objects that only live in this process
+            if isinstance(event, (GCodeDeviceConnectEvent, ResponseReveivedEvent)):
+                self.channel.send(("event", index, event))
+
+    async def run(self, connection):
+        self.channel = _Channel(connection, self.handle)
+        for index, device in enumerate(self.devices):
+            queue = asyncio.Queue()
+            device.set_event_queue(queue)
+            self.event_tasks.append(
+                asyncio.ensure_future(self.forward_events(index, queue))
+            )
+
+        await self.channel.closed.wait()
+        await self.channel.wait_written()
+
+        for task in self.event_tasks:
+            task.cancel()
+        for device in self.devices:
+            device.stop()
+
+
+def _picklable(exception):
+    try:
+        pickle.dumps(exception)
+        return exception
+    except Exception:
+        return RuntimeError(
+            "".join(traceback.format_exception_only(type(exception), exception))
+        )
+
+
+def _result_value(result):
+    # futures and other process local objects can not cross the pipe
+    try:
+        pickle.dumps(result)
+        return result
+    except Exception:
+        return None
+
+
+def _worker_main(connection, devices):
+    try:
+        asyncio.run(_Worker(devices).run(connection))
+    except KeyboardInterrupt:
+        pass
+    except Exception:
+        logger.log(logger.FATAL, "Worker error {}", traceback.format_exc())
+
+
+class DeviceProxy:
+    """
+    Stelt een device voor dat in een ander proces draait.
+
+    Elke methode van het device kan aangeroepen worden. Het resultaat is
+    altijd een future, ook voor methodes die in het device direct een
+    waarde teruggeven. Attributen en properties (status, settings,
+    position) worden met get gelezen. Events van het device (connect en
+    ontvangen regels) komen in de queue ``events``.
+    """
+
+    def __init__(self, shard, index):
+        self._shard = shard
+        self._index = index
+        self.events = asyncio.Queue()
+
+    def get(self, name):
+        """
+        Lees een attribuut of property van het device.
+
+        Returns
+        -------
+        asyncio.Future
+            Een future voor de waarde in het worker proces.
+        """
+        return self._shard.get(self._index, name)
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+
+        attribute = getattr(type(self._shard.devices[self._index]), name, None)
+        if isinstance(attribute, property) or not callable(attribute):
+            # a call would return a future instead of the value
+            raise AttributeError(
+                "{} is not a method, use await proxy.get({!r})".format(name, name)
+            )
+
+        def call(*args, **kw):
+            return self._shard.call(self._index, name, args, kw)
+
+        return call
+
+
+class _Shard:
+    """Parent side of one worker process."""
+
+    def __init__(self, devices):
+        self.devices = devices
+        self.proxies = []
+        self.channel = None
+        self.process = None
+        self.__connection = None
+        self.__calls = {}
+        self.__next_call_id = 0
+
+    def spawn(self):
+        self.__connection, child = multiprocessing.Pipe()
+        self.process = multiprocessing.Process(
+            target=_worker_main, args=(child, self.devices), daemon=True
+        )
+        self.process.start()
+        child.close()
+
+    def connect(self):
+        self.channel = _Channel(self.__connection, self.handle)
+        self.proxies = [DeviceProxy(self, i) for i in range(len(self.devices))]
+
+    def __request(self, kind, *message):
+        future = asyncio.get_running_loop().create_future()
+        call_id = self.__next_call_id
+        self.__next_call_id += 1
+        self.__calls[call_id] = future
+        self.channel.send((kind, call_id) + message)
+        return future
+
+    def call(self, index, name, args, kw):
+        return self.__request("call", index, name, args, kw)
+
+    def get(self, index, name):
+        return self.__request("get", index, name)
+
+    def handle(self, message):
+        kind = message[0]
+        if kind == "event":
+            self.proxies[message[1]].events.put_nowait(message[2])
+            return
+
+        future = self.__calls.pop(message[1], None)
+        if future is None or future.done():
+            return
+        if kind == "result":
+            future.set_result(message[2])
+        else:
+            future.set_exception(message[2])
+
+    async def shutdown(self):
+        self.channel.send(("shutdown",))
+        # the worker answers the calls before it, such as stop, and closes
+        # the pipe when it exits
+        try:
+            await asyncio.wait_for(self.channel.closed.wait(), 5)
+        except asyncio.TimeoutError:
+            self.channel.close()
+        await self.channel.wait_written()
+        for future in self.__calls.values():
+            if not future.done():
+                future.set_exception(ConnectionError("worker stopped"))
+        await asyncio.get_running_loop().run_in_executor(None, self.process.join, 5)
+
+
+def execute_sharded(devices, script, processes=None):
+    """
+    Voer een script uit op devices die over meerdere processen verdeeld zijn.
+
+    Elk proces heeft een eigen event loop met de drivers van zijn devices.
+    Het script draait in het hoofdproces en krijgt DeviceProxy objecten
+    in plaats van de devices zelf. Zo kan het script dezelfde vorm houden
+    als bij execute_on_devices.
+
+    Parameters
+    ----------
+    devices : list
+        De devices. Ze worden naar de worker processen gekopieerd en
+        mogen daarom nog niet gestart zijn.
+    script : script
+        Het uit te voeren script.
+    processes : int
+        Het aantal worker processen, standaard het aantal cores.
+    """
+    processes = min(processes or multiprocessing.cpu_count(), len(devices)) or 1
+
+    # round robin, so identical devices are spread evenly
+    shards = [_Shard(devices[i::processes]) for i in range(processes)]
+    for shard in shards:
+        shard.spawn()
+
+    async def do_execute():
+        for shard in shards:
+            shard.connect()
+
+        # put the proxies back in the order of the devices
+        proxies = [None] * len(devices)
+        for i, shard in enumerate(shards):
+            proxies[i::processes] = shard.proxies
+
+        try:
+            await GenericDriver._execute_script(proxies, script)
+        finally:
+            for shard in shards:
+                await shard.shutdown()
+
+    asyncio.run(do_execute())
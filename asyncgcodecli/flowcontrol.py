@@ -0,0 +1,184 @@
+"""Flow control policies for sending commands to a device."""
+
+__all__ = [
+    "FlowControl",
+    "StopAndWait",
+    "CharacterCounting",
+    "WindowedFlowControl",
+]
+
+import collections
+import math
+import time
+
+
+class FlowControl:
+    """
+    Basis class voor flow control.
+
+    Een flow control object bepaalt of de driver de volgende opdracht al
+    mag versturen. Elke driver heeft een eigen flow control object.
+    """
+
+    def __init__(self, *args, **kw):
+        super().__init__(*args, **kw)
+        self.reset()
+
+    def reset(self):
+        """Begin opnieuw, bijvoorbeeld na een reset van het apparaat."""
+        self.in_flight = 0
+
+    def can_send(self, command, size):
+        """True als een opdracht van size bytes verstuurd mag worden."""
+        return True
+
+    def on_send(self, command, size):
+        """Wordt aangeroepen nadat een opdracht verstuurd is."""
+        self.in_flight += 1
+
+    def on_confirm(self, command, size, result):
+        """Wordt aangeroepen als het antwoord op een opdracht binnen is."""
+        self.in_flight -= 1
+
+
+class StopAndWait(FlowControl):
+    """Verstuur pas een opdracht als het antwoord op de vorige binnen is."""
+
+    def can_send(self, command, size):
+        return self.in_flight == 0
+
+
+class CharacterCounting(FlowControl):
+    """
+    GRBL character counting.
+
+    Houdt bij hoeveel bytes er in de ontvangstbuffer van het apparaat
+    staan en verstuurt zoveel opdrachten als er in de buffer passen.
+
+    Parameters
+    ----------
+    buffer_size : int
+        De grootte van de ontvangstbuffer van het apparaat.
+    """
+
+    def __init__(self, buffer_size=128, *args, **kw):
+        self.buffer_size = buffer_size
+        super().__init__(*args, **kw)
+
+    def reset(self):
+        super().reset()
+        self.free = self.buffer_size
+
+    def can_send(self, command, size):
+        # a command that is larger than the buffer can only go alone
+        return size <= self.free or self.in_flight == 0
+
+    def on_send(self, command, size):
+        super().on_send(command, size)
+        self.free -= size
+
+    def on_confirm(self, command, size, result):
+        super().on_confirm(command, size, result)
+        self.free += size
+
+
+class WindowedFlowControl(CharacterCounting):
+    """
+    Houd maximaal N opdrachten tegelijk onderweg.
+
+    Geschikt voor apparaten die hun antwoorden in volgorde geven maar
+    geen character counting ondersteunen. Als adaptive True is, dan wordt
+    N aangepast aan de gemeten round-trip tijd: zolang de round-trip tijd
+    dicht bij de kleinst gemeten tijd blijft wordt N groter, als het
+    apparaat opdrachten begint op te sparen (de round-trip tijd loopt op)
+    of als er fouten komen wordt N kleiner.
+
+    Parameters
+    ----------
+    window : int
+        Het (begin)aantal opdrachten dat tegelijk onderweg mag zijn.
+    buffer_size : int
+        Als opgegeven wordt ook op bytes geteld, net als bij
+        CharacterCounting.
+    adaptive : bool
+        Pas het aantal automatisch aan.
+    min_window : int
+        Het kleinste aantal bij automatisch aanpassen.
+    max_window : int
+        Het grootste aantal bij automatisch aanpassen.
+    """
+
+    def __init__(
+        self,
+        window=4,
+        buffer_size=None,
+        adaptive=True,
+        min_window=1,
+        max_window=32,
+        *args,
+        **kw
+    ):
+        self.initial_window = window
+        self.adaptive = adaptive
+        self.min_window = min_window
+        self.max_window = max_window
+        super().__init__(buffer_size, *args, **kw)
+
+    def reset(self):
+        super().reset()
+        if self.buffer_size is None:
+            self.free = math.inf
+        self.window = self.initial_window
+        self.min_rtt = None
+        self.rtt = None
+        self.__sent_at = {}
+        self.__acked = 0
+
+    def can_send(self, command, size):
+        if self.in_flight >= self.window:
+            return False
+        return super().can_send(command, size)
+
+    def on_send(self, command, size):
+        super().on_send(command, size)
+        if self.adaptive:
+            # a streamed program sends many lines as one command
+            sent_at = self.__sent_at.get(command.id)
+            if sent_at is None:
+                sent_at = self.__sent_at[command.id] = collections.deque()
+            sent_at.append(time.monotonic())
+
+    def on_confirm(self, command, size, result):
+        window_full = self.in_flight >= self.window
+        super().on_confirm(command, size, result)
+        if not self.adaptive:
+            return
+
+        sent_at = None
+        queue = self.__sent_at.get(command.id)
+        if queue:
+            sent_at = queue.popleft()
+            if not queue:
+                del self.__sent_at[command.id]
+        if result.get("result") != "ok":
+            self.window = max(self.min_window, self.window // 2)
+            self.__acked = 0
+            return
+        if sent_at is None:
+            return
+
+        rtt = time.monotonic() - sent_at
+        self.rtt = rtt if self.rtt is None else 0.875 * self.rtt + 0.125 * rtt
+        if self.min_rtt is None or rtt < self.min_rtt:
+            self.min_rtt = rtt
+
+        if self.rtt > 2 * self.min_rtt:
+            # the device is queueing commands, more in flight only adds latency
+            self.window = max(self.min_window, self.window - 1)
+            self.__acked = 0
+        elif window_full:
+            # grow by one for every full window of replies
+            self.__acked += 1
+            if self.__acked >= self.window:
+                self.window = min(self.max_window, self.window + 1)
+                self.__acked = 0
@@ -6,24 +6,213 @@ import asyncio
 import asyncgcodecli.logger as logger
 from asyncgcodecli.driver import (
     GenericDriver,
+    GCodeGenericCommand,
+    GCodeJogCommand,
+    GCodeStreamCommand,
     GCodeSetSpindleCommand,
     GCodeWaitCommand,
     GCodeHomeCommand,
     TimeoutException,
 )
+from asyncgcodecli.pathoptimizer import optimize_strokes
 
 
 class Plotter(GenericDriver):
-    def __init__(self, port, *args, **kw):
+    def __init__(
+        self,
+        port,
+        *args,
+        pen_up_position=400,
+        pen_down_position=900,
+        pen_settle_time=None,
+        servo_speed=500,
+        **kw
+    ):
+        """
+        Maak een nieuw Plotter object.
+
+        Parameters
+        ----------
+        port : string
+            De naam van de usb port.
+        pen_up_position : float
+            Servostand (S-waarde) voor pen omhoog.
+        pen_down_position : float
+            Servostand (S-waarde) voor pen omlaag.
+        pen_settle_time : float
+            Vaste wachttijd in seconden na het bewegen van de pen. Als
+            None, dan wordt de wachttijd berekend uit de servo-afstand
+            en servo_speed.
+        servo_speed : float
+            Snelheid van de servo in S-eenheden per seconde.
+        """
         super().__init__(port, advanced_flow_control=True, *args, **kw)
+        self.pen_up_position = pen_up_position
+        self.pen_down_position = pen_down_position
+        self.pen_settle_time = pen_settle_time
+        self.servo_speed = servo_speed
+        self.pen_is_down = None
+        self.__pen_position = None
+
+    def __forget_pen(self):
+        self.pen_is_down = None
+        self.__pen_position = None
+
+    def _process_server_reset(self):
+        super()._process_server_reset()
+
+        # after a reset the servo position is unknown
+        self.__forget_pen()
+
+    def __check_raw_gcode(self, command):
+        # raw gcode may move the servo (M3/S), the next pen_up or pen_down
+        # must then be sent. Status and settings requests do not. A jog
+        # with z moves the pen as well.
+        if (
+            isinstance(command, GCodeStreamCommand)
+            or (
+                isinstance(command, GCodeGenericCommand)
+                and not command.gcode.startswith((b"?", b"$"))
+            )
+            or (isinstance(command, GCodeJogCommand) and command.z is not None)
+        ):
+            self.__forget_pen()
+
+    def _enqueue_command(self, command):
+        self.__check_raw_gcode(command)
+        super()._enqueue_command(command)
+
+    def queue_batch(self, commands):
+        for command in commands:
+            self.__check_raw_gcode(command)
+        return super().queue_batch(commands)
+
+    def abort(self, exception=None):
+        # a pen command may be withdrawn before it was sent
+        super().abort(exception)
+        self.__forget_pen()
+
+    def _prepare_resume(self):
+        return self.pen_up()
+
+    def _settle_time(self, position):
+        if self.pen_settle_time is not None:
+            return self.pen_settle_time
+
+        if self.__pen_position is None:
+            travel = abs(self.pen_down_position - self.pen_up_position)
+        else:
+            travel = abs(position - self.__pen_position)
+
+        return travel / self.servo_speed
+
+    def _move_pen(self, down):
+        if self.pen_is_down is down:
+            return self._last_result()
+
+        position = self.pen_down_position if down else self.pen_up_position
+        settle_time = self._settle_time(position)
+
+        self.pen_is_down = down
+        self.__pen_position = position
+
+        result = self.queue_command(GCodeSetSpindleCommand(position))
+        if settle_time > 0:
+            result = self.queue_command(GCodeWaitCommand(settle_time))
+        return result
 
     def pen_up(self):
-        self.queue_command(GCodeSetSpindleCommand(400))
-        return self.queue_command(GCodeWaitCommand(1))
+        """
+        Zet de pen omhoog.
+
+        Als de pen al omhoog staat, dan wordt er niets verstuurd.
+
+        Returns
+        -------
+        GCodeResult
+            Een future voor het resultaat.
+        """
+        return self._move_pen(False)
 
     def pen_down(self):
-        self.queue_command(GCodeSetSpindleCommand(900))
-        return self.queue_command(GCodeWaitCommand(1))
+        """
+        Zet de pen omlaag.
+
+        Als de pen al omlaag staat, dan wordt er niets verstuurd.
+
+        Returns
+        -------
+        GCodeResult
+            Een future voor het resultaat.
+        """
+        return self._move_pen(True)
+
+    def draw_strokes(
+        self,
+        strokes,
+        speed=10000,
+        optimize=True,
+        reverse=True,
+        start=(0, 0),
+        tolerance=0.0,
+        arc_tolerance=None,
+    ):
+        """
+        Teken een verzameling lijnen.
+
+        Elke lijn wordt met de pen omlaag getekend. Tussen de lijnen
+        wordt de pen omhoog gezet en met een snelle beweging naar het
+        begin van de volgende lijn gegaan.
+
+        Parameters
+        ----------
+        strokes : list
+            Lijst van lijnen, elke lijn is een lijst van (x, y) punten.
+        speed : float
+            De tekensnelheid.
+        optimize : bool
+            Als True wordt de volgorde van de lijnen eerst geoptimaliseerd
+            zodat er zo weinig mogelijk met de pen omhoog bewogen wordt.
+        reverse : bool
+            Als True mogen lijnen ook omgekeerd getekend worden.
+        start : tuple
+            De positie van de pen voor de eerste lijn.
+        tolerance : float
+            De maximale afwijking bij het vereenvoudigen van de lijnen,
+            zie move_polyline.
+        arc_tolerance : float
+            De maximale afwijking bij het herkennen van bogen, zie
+            move_polyline.
+
+        Returns
+        -------
+        GCodeResult
+            Een future voor het resultaat van de laatste opdracht.
+        """
+        if optimize:
+            optimized = optimize_strokes(strokes, start=start, reverse=reverse)
+            logger.log(
+                logger.INFO,
+                "Pen-up travel {:.1f} -> {:.1f} ({:.1f} saved)",
+                (
+                    optimized.travel_before,
+                    optimized.travel_after,
+                    optimized.travel_saved,
+                ),
+            )
+            strokes = optimized.strokes
+
+        for stroke in strokes:
+            if len(stroke) == 0:
+                continue
+            self.pen_up()
+            self.move_rapid(stroke[0][0], stroke[0][1])
+            self.pen_down()
+            self.move_polyline(
+                stroke, speed=speed, tolerance=tolerance, arc_tolerance=arc_tolerance
+            )
+
+        return self.pen_up()
 
     def home(self):
         # self.queue_command(GCodeGenericCommand("$27=2.000"))
@@ -0,0 +1,257 @@
+"""One I/O thread that serves many serial ports with a selector."""
+
+__all__ = ["SerialIOHub"]
+
+import asyncio
+import os
+import re
+import selectors
+import threading
+import time
+import traceback
+import serial
+import asyncgcodecli.logger as logger
+from asyncgcodecli.driver import GCodeDeviceConnectEvent, ResponseReveivedEvent
+from asyncgcodecli.seriallink import SerialLink
+
+_LINE_END = re.compile(rb"[\r\n]")
+
+
+class HubPort:
+    """
+    Een seriele poort die door een SerialIOHub bediend wordt.
+
+    Heeft dezelfde interface als SerialReceiveThread zodat de driver
+    niet hoeft te weten welke van de twee gebruikt wordt.
+    """
+
+    def __init__(self, hub, port, loop, link=None, probe=None):
+        self.event_queue = asyncio.Queue()
+        self.port = port
+        self.stop = False
+        self.link = link if link is not None else SerialLink()
+        self._loop = loop
+        self._hub = hub
+        self._probe = probe
+        self._serial = self.link.create_serial(timeout=0)
+        self._buffer = bytearray()
+        self._attempts = 0
+        self._next_attempt = 0.0
+
+    def start(self):
+        self._hub._add(self)
+
+    def close(self):
+        self.stop = True
+        self._hub._remove(self)
+
+    def write(self, gcode):
+        self._serial.write(gcode)
+        logger.log(logger.TRACE, "transmitted: {}", gcode.decode("utf-8", "replace"))
+
+    def _deliver(self, events):
+        # runs in the event loop, one call per batch of lines
+        for event in events:
+            if isinstance(event, ResponseReveivedEvent):
+                logger.log(logger.TRACE, "received: {}", event.response)
+            self.event_queue.put_nowait(event)
+
+    def _post_events(self, events):
+        if events:
+            try:
+                self._loop.call_soon_threadsafe(self._deliver, events)
+            except RuntimeError:
+                # the event loop is already closed
+                pass
+
+    def _split_lines(self, data):
+        self._buffer += data
+        lines = _LINE_END.split(self._buffer)
+        self._buffer = bytearray(lines.pop())
+        return [
+            ResponseReveivedEvent(line.decode("utf-8", "replace"))
+            for line in lines
+            if line
+        ]
+
+
+class SerialIOHub:
+    """
+    Bedien veel seriele poorten vanuit een enkele thread.
+
+    Zonder hub start elke driver een eigen thread die elke 10 ms de
+    seriele poort uitleest. Met een hub wachten alle poorten samen in
+    een selector (epoll op Linux), zodat er geen CPU gebruikt wordt als
+    er niets binnenkomt. Binnengekomen regels worden per poort in een
+    keer aan de event loop doorgegeven.
+
+    Werkt alleen op systemen waar seriele poorten een file descriptor
+    hebben (Linux en macOS).
+
+    Example
+    -------
+
+    Twee robotarmen met een gedeelde hub::
+
+        hub = SerialIOHub()
+        GenericDriver.execute_on_devices(
+            [
+                UArm("/dev/ttyUSB0", io_hub=hub),
+                UArm("/dev/ttyUSB1", io_hub=hub),
+            ],
+            move_script,
+        )
+    """
+
+    connect_attempts = 5
+    connect_interval = 1.0
+
+    def __init__(self):
+        self.__selector = selectors.DefaultSelector()
+        self.__lock = threading.Lock()
+        self.__pending = []
+        self.__connecting = []
+        self.__thread = None
+        self.__wakeup_read, self.__wakeup_write = os.pipe()
+        os.set_blocking(self.__wakeup_read, False)
+        self.__selector.register(self.__wakeup_read, selectors.EVENT_READ, None)
+
+    def open_port(self, port, loop, link=None, probe=None):
+        """Maak een poort aan die door deze hub bediend wordt."""
+        return HubPort(self, port, loop, link, probe)
+
+    def _add(self, hub_port):
+        logger.log(logger.INFO, "Connecting to {} ", (hub_port.port))
+        self.__schedule(("add", hub_port))
+
+        with self.__lock:
+            if self.__thread is None:
+                self.__thread = threading.Thread(target=self.__run, daemon=True)
+                self.__thread.start()
+
+    def _remove(self, hub_port):
+        self.__schedule(("remove", hub_port))
+
+    def __schedule(self, action):
+        with self.__lock:
+            self.__pending.append(action)
+        os.write(self.__wakeup_write, b"\0")
+
+    def __try_connect(self, hub_port, now):
+        try:
+            if hub_port._attempts > 0:
+                logger.log(
+                    logger.INFO,
+                    "Connecting to {} retry {}",
+                    (hub_port.port, hub_port._attempts),
+                )
+            hub_port._serial.port = hub_port.port
+            hub_port._serial.open()
+        except serial.SerialException:
+            hub_port._attempts += 1
+            hub_port._next_attempt = now + self.connect_interval
+            if hub_port._attempts >= self.connect_attempts:
+                hub_port._post_events([GCodeDeviceConnectEvent(False)])
+                logger.log(logger.INFO, "Timeout.")
+                logger.log(
+                    logger.FATAL,
+                    'Could not connect to device "{}". Timeout occured.',
+                    (hub_port.port),
+                )
+                return True
+            return False
+
+        hub_port.link.configure(hub_port._serial)
+        if hub_port._probe is None:
+            self.__register(hub_port, None)
+        else:
+            # probing takes seconds, do not hold up the other ports
+            threading.Thread(
+                target=self.__probe, args=(hub_port,), daemon=True
+            ).start()
+        return True
+
+    def __probe(self, hub_port):
+        try:
+            hub_port._serial.timeout = hub_port.link.timeout
+            banner = hub_port._probe(hub_port._serial)
+            hub_port._serial.timeout = 0
+        except (serial.SerialException, OSError):
+            # the port was closed while probing
+            banner = None
+        self.__schedule(("probed", hub_port, banner))
+
+    def __register(self, hub_port, banner):
+        self.__selector.register(
+            hub_port._serial.fileno(), selectors.EVENT_READ, hub_port
+        )
+        events = [GCodeDeviceConnectEvent(True)]
+        events += [ResponseReveivedEvent(line) for line in banner or []]
+        hub_port._post_events(events)
+        logger.log(logger.INFO, "Connected.")
+
+    def __close(self, hub_port):
+        if hub_port._serial.is_open:
+            try:
+                self.__selector.unregister(hub_port._serial.fileno())
+            except (KeyError, ValueError):
+                pass
+            hub_port._serial.close()
+        logger.log(logger.TRACE, "SerialIOHub stopped serving {}", hub_port.port)
+
+    def __process_pending(self):
+        with self.__lock:
+            pending = self.__pending
+            self.__pending = []
+
+        for action, hub_port, *extra in pending:
+            if action == "add":
+                if not hub_port.stop:
+                    self.__connecting.append(hub_port)
+            elif action == "probed":
+                if not hub_port.stop and hub_port._serial.is_open:
+                    self.__register(hub_port, *extra)
+            else:
+                if hub_port in self.__connecting:
+                    self.__connecting.remove(hub_port)
+                self.__close(hub_port)
+
+    def __read(self, hub_port):
+        if not hub_port._serial.is_open:
+            return
+
+        try:
+            data = hub_port._serial.read(hub_port._serial.in_waiting or 1)
+        except (serial.SerialException, OSError):
+            logger.log(logger.FATAL, "Connection lost! {}", traceback.format_exc())
+            self.__close(hub_port)
+            hub_port._post_events([GCodeDeviceConnectEvent(False)])
+            return
+
+        if data:
+            hub_port._post_events(hub_port._split_lines(data))
+
+    def __run(self):
+        while True:
+            self.__process_pending()
+
+            now = time.monotonic()
+            for hub_port in list(self.__connecting):
+                if hub_port._next_attempt <= now and self.__try_connect(hub_port, now):
+                    self.__connecting.remove(hub_port)
+
+            timeout = None
+            if self.__connecting:
+                timeout = max(
+                    min(p._next_attempt for p in self.__connecting) - now, 0
+                )
+
+            for key, _ in self.__selector.select(timeout):
+                if key.data is None:
+                    try:
+                        while os.read(self.__wakeup_read, 4096):
+                            pass
+                    except BlockingIOError:
+                        pass
+                else:
+                    self.__read(key.data)
@@ -0,0 +1,477 @@
+"""Long running jobs with checkpoints and resume."""
+
+__all__ = ["Job", "Checkpoint", "ModalState", "RestoreFailedException"]
+
+import collections
+import itertools
+import json
+import os
+import re
+import tempfile
+import time
+import asyncgcodecli.logger as logger
+from asyncgcodecli.driver import (
+    GCodeCommand,
+    GCodeGenericCommand,
+    CommandAbortedException,
+    DeviceResetException,
+)
+
+_WORD = re.compile(rb"([A-Z])\s*([-+]?[0-9]*\.?[0-9]+)")
+_COMMENT = re.compile(rb"\(.*?\)|;.*")
+
+# commands with axis words that are not a move to that position
+_NON_MOTION = {b"G4", b"G10", b"G28", b"G30", b"G53", b"G92"}
+
+
+def _number(value):
+    return float(value) if b"." in value else int(value)
+
+
+def _format(value):
+    if isinstance(value, float):
+        text = "%.4f" % value
+        return text.rstrip("0").rstrip(".")
+    return str(value)
+
+
+class RestoreFailedException(Exception):
+    """
+    De toestand kon bij het hervatten van een job niet hersteld worden.
+
+    Het apparaat weigerde een van de herstelregels. Het checkpoint is
+    niet veranderd, de job kan later opnieuw hervat worden.
+
+    Attributes
+    ----------
+    result : dict
+        Het resultaat van de regel die geweigerd werd.
+    """
+
+    def __init__(self, message="could not restore state", result=None):
+        super().__init__(message)
+        self.result = result
+
+
+class ModalState:
+    """
+    De modale toestand van een apparaat, bijgehouden uit verwerkte gcode.
+
+    Attributes
+    ----------
+    position : dict
+        De laatste positie per as, bijvoorbeeld {"X": 10.0, "Y": 5.0}.
+    motion : string
+        De bewegingsmode (G0, G1, G2 of G3).
+    absolute : bool
+        False na G91.
+    metric : bool
+        False na G20.
+    feed : float
+        De laatste snelheid (F).
+    spindle : string
+        M3, M4 of M5.
+    spindle_speed : float
+        De laatste S-waarde. Bij een plotter is dit de penstand.
+    """
+
+    def __init__(self):
+        self.position = {}
+        self.motion = None
+        self.absolute = True
+        self.metric = True
+        self.feed = None
+        self.spindle = None
+        self.spindle_speed = None
+
+    def update(self, gcode):
+        """Verwerk een gcode regel (bytes) die door het apparaat uitgevoerd is."""
+        gcode = _COMMENT.sub(b"", gcode.upper())
+        if gcode.startswith(b"$H"):
+            # homing, the position is no longer known
+            self.position = {}
+            return
+
+        words = _WORD.findall(gcode)
+        codes = {letter + _strip_zeros(value) for letter, value in words}
+        moves = not (codes & _NON_MOTION)
+
+        for letter, value in words:
+            if letter == b"G":
+                code = b"G" + _strip_zeros(value)
+                if code in (b"G0", b"G1", b"G2", b"G3"):
+                    self.motion = code.decode()
+                elif code == b"G90":
+                    self.absolute = True
+                elif code == b"G91":
+                    self.absolute = False
+                elif code == b"G20":
+                    self.metric = False
+                elif code == b"G21":
+                    self.metric = True
+            elif letter == b"M":
+                code = b"M" + _strip_zeros(value)
+                if code in (b"M3", b"M4", b"M5"):
+                    self.spindle = code.decode()
+            elif letter == b"F":
+                self.feed = _number(value)
+            elif letter == b"S":
+                self.spindle_speed = _number(value)
+            elif letter in b"XYZ" and moves:
+                axis = letter.decode()
+                value = _number(value)
+                if self.absolute:
+                    self.position[axis] = value
+                elif axis in self.position:
+                    self.position[axis] += value
+
+    def restore_gcode(self, safe_z=None):
+        """
+        Geef de gcode regels die deze toestand herstellen.
+
+        Eerst gaat Z naar een veilige hoogte en dan met een snelle
+        beweging naar de laatste positie in het vlak. Daarna start de
+        spindel en zakt Z met de laatste snelheid naar de opgeslagen
+        hoogte. Het apparaat moet dus eerst in een veilige toestand staan
+        (spindel uit, pen omhoog).
+
+        Parameters
+        ----------
+        safe_z : float
+            De veilige hoogte in werkcoordinaten. Als None, dan gaat Z
+            naar machine nul (G53), bij GRBL de hoogste stand.
+        """
+        lines = ["G21" if self.metric else "G20", "G90"]
+        z = self.position.get("Z")
+        if z is not None:
+            if safe_z is None:
+                lines.append("G53 G0 Z0")
+            else:
+                lines.append("G0 Z" + _format(safe_z))
+        axes = sorted(item for item in self.position.items() if item[0] != "Z")
+        if axes:
+            lines.append(
+                "G0 " + " ".join(axis + _format(value) for axis, value in axes)
+            )
+        if self.spindle in ("M3", "M4"):
+            line = self.spindle
+            if self.spindle_speed is not None:
+                line += " S" + _format(self.spindle_speed)
+            lines.append(line)
+        if z is not None:
+            # down into the work at the cutting speed, not with a rapid
+            if self.feed is not None:
+                lines.append("G1 Z" + _format(z) + " F" + _format(self.feed))
+            else:
+                lines.append("G0 Z" + _format(z))
+        if not self.absolute:
+            lines.append("G91")
+
+        # G2/G3 need axis words, restore them with the next arc
+        line = self.motion if self.motion in ("G0", "G1") else ""
+        if self.feed is not None:
+            line += " F" + _format(self.feed)
+        if line.strip():
+            lines.append(line.strip())
+        return lines
+
+    def to_dict(self):
+        return {
+            "position": self.position,
+            "motion": self.motion,
+            "absolute": self.absolute,
+            "metric": self.metric,
+            "feed": self.feed,
+            "spindle": self.spindle,
+            "spindle_speed": self.spindle_speed,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        state = cls()
+        state.position = dict(data.get("position") or {})
+        state.motion = data.get("motion")
+        state.absolute = data.get("absolute", True)
+        state.metric = data.get("metric", True)
+        state.feed = data.get("feed")
+        state.spindle = data.get("spindle")
+        state.spindle_speed = data.get("spindle_speed")
+        return state
+
+
+def _strip_zeros(value):
+    # G01 and G1 are the same code
+    if b"." in value:
+        return value
+    return value.lstrip(b"0") or b"0"
+
+
+class Checkpoint:
+    """
+    De voortgang van een job.
+
+    Attributes
+    ----------
+    index : int
+        Het aantal opdrachten vanaf het begin van de job dat verwerkt is.
+    state : ModalState
+        De modale toestand na die opdrachten.
+    """
+
+    def __init__(self, index=0, state=None):
+        self.index = index
+        self.state = state if state is not None else ModalState()
+
+    @classmethod
+    def load(cls, path):
+        """Lees een checkpoint, None als er geen (geldig) bestand is."""
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            return cls(int(data["index"]), ModalState.from_dict(data["state"]))
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, KeyError, TypeError):
+            logger.log(logger.WARNING, "Ignoring damaged checkpoint {}", path)
+            return None
+
+    def save(self, path):
+        """Schrijf het checkpoint zo dat het een stroomstoring overleeft."""
+        directory = os.path.dirname(path) or "."
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump({"index": self.index, "state": self.state.to_dict()}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+
+class Job:
+    """
+    Een lange reeks opdrachten die na een reset hervat kan worden.
+
+    Tijdens het uitvoeren wordt regelmatig een checkpoint geschreven met
+    het aantal verwerkte opdrachten en de modale toestand (positie,
+    snelheid, spindel of pen). Als het apparaat halverwege gereset wordt
+    of de verbinding wegvalt, dan geeft run een DeviceResetException.
+    Een nieuwe aanroep van run met resume=True zet de toestand terug en
+    gaat verder na de laatst verwerkte opdracht.
+
+    Parameters
+    ----------
+    commands : iterable
+        De opdrachten: gcode regels (str of bytes) of GCodeCommand
+        objecten. Mag ook een functie zijn die een nieuwe iterable
+        teruggeeft, zo kunnen ook generators hervat worden.
+    checkpoint_path : string
+        Het checkpoint bestand. Als None, dan wordt alleen checkpoint
+        bijgehouden zonder het op te slaan.
+    checkpoint_interval : float
+        Minimale tijd in seconden tussen het schrijven van checkpoints.
+    window : int
+        Het aantal opdrachten dat vooruit in de wachtrij gezet wordt.
+    spindle_delay : float
+        Wachttijd na het herstellen van de spindel (of pen).
+    safe_z : float
+        De hoogte waarop bij het hervatten naar de laatste positie bewogen
+        wordt, zie ModalState.restore_gcode. Als None, dan machine Z nul.
+
+    Example
+    -------
+
+    Een plot die na een reset hervat kan worden::
+
+        job = Job.from_file("drawing.gcode", checkpoint_path="drawing.ckpt")
+        try:
+            await job.run(plotter)
+        except DeviceResetException:
+            await plotter.ready()
+            await job.run(plotter, resume=True)
+    """
+
+    def __init__(
+        self,
+        commands,
+        checkpoint_path=None,
+        checkpoint_interval=1.0,
+        window=256,
+        spindle_delay=1.0,
+        safe_z=None,
+    ):
+        self.commands = commands
+        self.checkpoint_path = checkpoint_path
+        self.checkpoint_interval = checkpoint_interval
+        self.window = window
+        self.spindle_delay = spindle_delay
+        self.safe_z = safe_z
+        self.checkpoint = Checkpoint()
+
+    @classmethod
+    def from_file(cls, path, **kw):
+        """Maak een job die de regels van een gcode bestand streamt."""
+
+        def lines():
+            with open(path, "rb") as f:
+                for line in f:
+                    yield line.rstrip(b"\r\n")
+
+        return cls(lines, **kw)
+
+    def __iterate(self):
+        if callable(self.commands):
+            return iter(self.commands())
+        return iter(self.commands)
+
+    def __save(self):
+        if self.checkpoint_path is not None:
+            self.checkpoint.save(self.checkpoint_path)
+
+    def load_checkpoint(self):
+        """Lees het checkpoint van een eerdere run, None als er geen is."""
+        if self.checkpoint_path is None:
+            return self.checkpoint if self.checkpoint.index > 0 else None
+        return Checkpoint.load(self.checkpoint_path)
+
+    @staticmethod
+    def _to_command(item):
+        if isinstance(item, GCodeCommand):
+            if not item.send:
+                return item
+            # already sent in an earlier run, send a fresh copy
+            item = item.command()
+        if isinstance(item, bytes):
+            item = item.decode("utf-8")
+        gcode = re.sub(r"\(.*?\)|;.*", "", item).strip()
+        return GCodeGenericCommand(gcode) if gcode else None
+
+    def __restore(self, device, state):
+        device._prepare_resume()
+        lines = state.restore_gcode(self.safe_z)
+        for line in lines:
+            device._enqueue_command(GCodeGenericCommand(line))
+            if line.startswith(("M3", "M4")) and self.spindle_delay > 0:
+                device._enqueue_command(
+                    GCodeGenericCommand("G4 P" + _format(self.spindle_delay))
+                )
+        return device._last_result()
+
+    async def run(self, device, resume=False):
+        """
+        Voer de job uit.
+
+        Parameters
+        ----------
+        device : GenericDriver
+            Het apparaat.
+        resume : bool
+            Ga verder vanaf het laatste checkpoint, als dat er is.
+
+        Returns
+        -------
+        dict
+            {"result": "ok"} of, als er opdrachten een fout gaven,
+            {"result": "error", "errors": [(index, resultaat), ...]}.
+
+        Raises
+        ------
+        DeviceResetException
+            Als het apparaat gereset is of de verbinding wegviel. Het
+            checkpoint is dan bijgewerkt.
+        RestoreFailedException
+            Als het apparaat bij resume een herstelregel weigerde.
+        CommandAbortedException
+            Na een abort van het apparaat, ook door de error_policy. Het
+            checkpoint is dan bijgewerkt.
+        """
+        checkpoint = self.load_checkpoint() if resume else None
+        if checkpoint is None:
+            checkpoint = Checkpoint()
+        self.checkpoint = checkpoint
+        state = checkpoint.state
+
+        commands = self.__iterate()
+        if checkpoint.index > 0:
+            logger.log(logger.INFO, "Resuming job at command {}", checkpoint.index)
+            # skip what is already done, this also works for streams
+            commands = itertools.islice(commands, checkpoint.index, None)
+            result = await self.__restore(device, state)
+            if result["result"] != "ok":
+                raise RestoreFailedException("could not restore state", result)
+
+        errors = []
+        pending = collections.deque()
+        last_save = time.monotonic()
+
+        def record(index, command, result):
+            if result["result"] != "ok":
+                errors.append((index, result))
+            else:
+                state.update(command.command())
+
+        def take_confirmed():
+            nonlocal last_save
+            while pending:
+                index, command = pending[0]
+                if command is not None:
+                    if command.error is not None:
+                        raise command.error
+                    if not command.confirmed:
+                        break
+                    record(index, command, command.result)
+                pending.popleft()
+                checkpoint.index = index + 1
+
+            if time.monotonic() - last_save >= self.checkpoint_interval:
+                self.__save()
+                last_save = time.monotonic()
+
+        async def drain(max_pending):
+            # wait for the newest command that has to finish, one future
+            # for many commands instead of one per command
+            take_confirmed()
+            while len(pending) > max_pending:
+                waiting = None
+                for _, command in itertools.islice(
+                    pending, len(pending) - max_pending
+                ):
+                    if command is not None and not command.confirmed:
+                        waiting = command
+                if waiting is not None:
+                    await waiting.gcode_result
+                take_confirmed()
+
+        try:
+            for index, item in enumerate(commands, checkpoint.index):
+                command = self._to_command(item)
+                if command is not None:
+                    device._enqueue_command(command)
+                pending.append((index, command))
+
+                if len(pending) >= self.window:
+                    await drain(self.window // 2)
+
+            await drain(0)
+        except (DeviceResetException, CommandAbortedException):
+            # replies can arrive out of order, keep what was confirmed
+            while pending:
+                index, command = pending[0]
+                if command is not None:
+                    if not command.confirmed:
+                        break
+                    record(index, command, command.result)
+                pending.popleft()
+                checkpoint.index = index + 1
+            self.__save()
+            raise
+
+        if self.checkpoint_path is not None and os.path.exists(self.checkpoint_path):
+            # finished, a later resume must start from the beginning
+            os.remove(self.checkpoint_path)
+
+        if errors:
+            return {
+                "result": "error",
+                "error_code": errors[0][1].get("error_code"),
+                "errors": errors,
+            }
+        return {"result": "ok", "error_code": 0}
@@ -0,0 +1,162 @@
+"""Interactive jogging with a velocity input."""
+
+__all__ = ["Jogger"]
+
+import asyncio
+import math
+import time
+import asyncgcodecli.logger as logger
+
+
+class Jogger:
+    """
+    Laat een apparaat joggen met een snelheid die steeds kan veranderen.
+
+    Bedoeld voor een joystick of toetsenbord. De beweging wordt in korte
+    jogs ($J=) van interval seconden opgedeeld en er worden nooit meer
+    dan depth jogs vooruit gepland. Een verandering van de snelheid is
+    dus binnen ongeveer depth * interval seconden te zien. Bij loslaten
+    (snelheid 0) of omkeren van de richting wordt het jog cancel teken
+    gestuurd en stopt het apparaat direct.
+
+    Parameters
+    ----------
+    device : GenericDriver
+        Een GRBL apparaat, bijvoorbeeld een Plotter. Apparaten zonder
+        jog cancel (jog_cancel_code None, zoals de UArm) worden
+        geweigerd met een ValueError.
+    max_speed : float
+        De maximale snelheid in mm/min.
+    interval : float
+        De duur van een jog in seconden.
+    depth : int
+        Het aantal jogs dat vooruit gepland mag zijn.
+
+    Example
+    -------
+
+    Jog met een joystick die (x, y) waarden tussen -1 en 1 geeft::
+
+        async def velocities():
+            async for x, y in joystick():
+                yield (x * 3000, y * 3000, 0)
+
+        await Jogger(plotter, max_speed=3000).run(velocities())
+    """
+
+    def __init__(self, device, max_speed=3000, interval=0.025, depth=2):
+        if getattr(device, "jog_cancel_code", None) is None:
+            raise ValueError("{} can not jog".format(type(device).__name__))
+        self.device = device
+        self.max_speed = max_speed
+        self.interval = interval
+        self.depth = depth
+        self.velocity = (0.0, 0.0, 0.0)
+        self.__planned_until = 0.0
+        self.__moving = None
+        self.__running = False
+        self.__wake = None
+
+    def set_velocity(self, x=0.0, y=0.0, z=0.0):
+        """
+        Stel de snelheid per as in mm/min in.
+
+        Een snelheid boven max_speed wordt in dezelfde richting verkleind.
+        """
+        speed = math.sqrt(x * x + y * y + z * z)
+        if speed > self.max_speed:
+            scale = self.max_speed / speed
+            x, y, z = x * scale, y * scale, z * scale
+        self.velocity = (x, y, z)
+        if self.__wake is not None:
+            self.__wake.set()
+
+    def release(self):
+        """Stop direct, zoals bij het loslaten van de joystick."""
+        self.set_velocity(0.0, 0.0, 0.0)
+        self.__cancel()
+
+    def stop(self):
+        """Stop direct en beeindig run."""
+        self.__running = False
+        self.release()
+
+    def __cancel(self):
+        if self.__moving is not None:
+            self.device.jog_cancel()
+            self.__moving = None
+            self.__planned_until = 0.0
+
+    def __send_step(self, velocity, now):
+        speed = math.sqrt(sum(v * v for v in velocity))
+        # the distance covered in one interval, speeds are per minute
+        x, y, z = (v * self.interval / 60 for v in velocity)
+        self.device.jog(
+            x=x if x else None,
+            y=y if y else None,
+            z=z if z else None,
+            speed=speed,
+        )
+        self.__moving = velocity
+        self.__planned_until = max(self.__planned_until, now) + self.interval
+
+    async def __follow(self, velocities):
+        async for velocity in velocities:
+            if velocity is None or not any(velocity):
+                self.release()
+            else:
+                self.set_velocity(*velocity)
+        self.stop()
+
+    async def run(self, velocities=None):
+        """
+        Jog tot stop aangeroepen wordt.
+
+        Parameters
+        ----------
+        velocities : async iterable
+            Als opgegeven, de snelheden (x, y, z) in mm/min. run stopt
+            als de iterable op is. Anders wordt de snelheid met
+            set_velocity ingesteld.
+        """
+        self.__running = True
+        self.__wake = asyncio.Event()
+        follow = None
+        if velocities is not None:
+            follow = asyncio.ensure_future(self.__follow(velocities))
+
+        try:
+            while self.__running:
+                self.__wake.clear()
+                velocity = self.velocity
+                if not any(velocity):
+                    self.__cancel()
+                    await self.__wake.wait()
+                    continue
+
+                moving = self.__moving
+                if moving is not None and (
+                    sum(a * b for a, b in zip(moving, velocity)) <= 0
+                ):
+                    # reversing, do not finish the jogs in the other direction
+                    self.__cancel()
+
+                now = time.monotonic()
+                ahead = self.__planned_until - now
+                if ahead < (self.depth - 1) * self.interval:
+                    self.__send_step(velocity, now)
+                    continue
+
+                # wait until a jog is done or the input changes
+                try:
+                    await asyncio.wait_for(
+                        self.__wake.wait(),
+                        ahead - (self.depth - 1) * self.interval,
+                    )
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            self.__cancel()
+            if follow is not None:
+                follow.cancel()
+            logger.log(logger.DEBUG, "Jogging stopped")
@@ -0,0 +1,250 @@
+"""Optimize the order of pen strokes to minimize pen-up travel."""
+
+__all__ = ["optimize_strokes", "path_travel", "PathOptimizerResult"]
+
+import math
+
+
+class PathOptimizerResult:
+    """
+    Het resultaat van optimize_strokes.
+
+    Attributes
+    ----------
+    strokes : list
+        De lijnen in de nieuwe volgorde en richting.
+    travel_before : float
+        Afstand met de pen omhoog voor de optimalisatie.
+    travel_after : float
+        Afstand met de pen omhoog na de optimalisatie.
+    """
+
+    def __init__(self, strokes, travel_before, travel_after):
+        self.strokes = strokes
+        self.travel_before = travel_before
+        self.travel_after = travel_after
+
+    @property
+    def travel_saved(self):
+        return self.travel_before - self.travel_after
+
+
+def path_travel(strokes, start=(0, 0)):
+    """
+    Bereken de afstand die met de pen omhoog wordt afgelegd.
+
+    Parameters
+    ----------
+    strokes : list
+        Lijst van lijnen, elke lijn is een lijst van (x, y) punten.
+    start : tuple
+        De positie van de pen voor de eerste lijn.
+
+    Returns
+    -------
+    float
+        De totale afstand tussen de lijnen.
+    """
+    travel = 0.0
+    x, y = start[0], start[1]
+    for stroke in strokes:
+        travel += math.hypot(stroke[0][0] - x, stroke[0][1] - y)
+        x, y = stroke[-1][0], stroke[-1][1]
+    return travel
+
+
+class _EndpointGrid:
+    """Uniform grid over the stroke endpoints for nearest neighbour search."""
+
+    def __init__(self, starts, ends, reverse):
+        points = starts + ends if reverse else starts
+        min_x = min(p[0] for p in points)
+        min_y = min(p[1] for p in points)
+        max_x = max(p[0] for p in points)
+        max_y = max(p[1] for p in points)
+
+        # aim for a couple of endpoints per cell
+        area = max((max_x - min_x) * (max_y - min_y), 1e-9)
+        self.cell_size = max(math.sqrt(2 * area / len(points)), 1e-6)
+        self.min_x = min_x
+        self.min_y = min_y
+
+        self.cells = {}
+        for index, point in enumerate(starts):
+            self.cells.setdefault(self.cell(point), []).append((index, False))
+        if reverse:
+            for index, point in enumerate(ends):
+                self.cells.setdefault(self.cell(point), []).append((index, True))
+
+    def cell(self, point):
+        return (
+            int((point[0] - self.min_x) // self.cell_size),
+            int((point[1] - self.min_y) // self.cell_size),
+        )
+
+    def remove(self, index, starts, ends):
+        for key, entry in (
+            (self.cell(starts[index]), (index, False)),
+            (self.cell(ends[index]), (index, True)),
+        ):
+            entries = self.cells.get(key)
+            if entries is not None and entry in entries:
+                entries.remove(entry)
+                if not entries:
+                    del self.cells[key]
+
+    def _scan(self, keys, starts, ends, x, y, best):
+        cells = self.cells
+        hypot = math.hypot
+        for key in keys:
+            entries = cells.get(key)
+            if entries is None:
+                continue
+            for index, reversed_ in entries:
+                point = ends[index] if reversed_ else starts[index]
+                distance = hypot(point[0] - x, point[1] - y)
+                if best is None or distance < best[0]:
+                    best = (distance, index, reversed_)
+        return best
+
+    def nearest(self, x, y, starts, ends):
+        cx, cy = self.cell((x, y))
+        size = self.cell_size
+
+        # distance from the query point to the border of its own cell
+        fx = x - self.min_x - cx * size
+        fy = y - self.min_y - cy * size
+        margin = min(fx, fy, size - fx, size - fy)
+
+        best = self._scan([(cx, cy)], starts, ends, x, y, None)
+        ring = 0
+        while best is None or best[0] > margin + ring * size:
+            ring += 1
+            if (2 * ring + 1) ** 2 > 4 * len(self.cells):
+                # only a few cells left, scanning them directly is cheaper
+                return self._scan(list(self.cells), starts, ends, x, y, best)
+
+            keys = []
+            for i in range(-ring, ring + 1):
+                keys.append((cx + i, cy - ring))
+                keys.append((cx + i, cy + ring))
+            for i in range(-ring + 1, ring):
+                keys.append((cx - ring, cy + i))
+                keys.append((cx + ring, cy + i))
+            best = self._scan(keys, starts, ends, x, y, best)
+
+        return best
+
+
+def _nearest_neighbour_order(starts, ends, reverse, start):
+    grid = _EndpointGrid(starts, ends, reverse)
+    order = []
+    x, y = start[0], start[1]
+
+    for _ in range(len(starts)):
+        _, index, reversed_ = grid.nearest(x, y, starts, ends)
+        grid.remove(index, starts, ends)
+        order.append((index, reversed_))
+        x, y = starts[index] if reversed_ else ends[index]
+
+    return order
+
+
+def _two_opt(order, starts, ends, start, window, passes):
+    """
+    Windowed 2-opt on the stroke order.
+
+    Reversing a run of strokes and flipping each of them only changes the
+    two connecting travel moves, so every candidate is evaluated in O(1).
+    """
+    count = len(order)
+    s = [ends[i] if r else starts[i] for i, r in order]
+    e = [starts[i] if r else ends[i] for i, r in order]
+    hypot = math.hypot
+
+    for _ in range(passes):
+        improved = False
+        for i in range(-1, count - 1):
+            a = start if i < 0 else e[i]
+            for j in range(i + 1, min(count, i + 1 + window)):
+                b = s[i + 1]
+                c = e[j]
+                before = hypot(b[0] - a[0], b[1] - a[1])
+                after = hypot(c[0] - a[0], c[1] - a[1])
+                if j + 1 < count:
+                    d = s[j + 1]
+                    before += hypot(d[0] - c[0], d[1] - c[1])
+                    after += hypot(d[0] - b[0], d[1] - b[1])
+
+                if after < before - 1e-9:
+                    section = slice(i + 1, j + 1)
+                    order[section] = [(k, not r) for k, r in reversed(order[section])]
+                    s[section], e[section] = e[section][::-1], s[section][::-1]
+                    improved = True
+        if not improved:
+            break
+
+    return order
+
+
+def optimize_strokes(strokes, start=(0, 0), reverse=True, window=10, passes=2):
+    """
+    Optimaliseer de volgorde van lijnen.
+
+    Zoekt telkens de dichtstbijzijnde volgende lijn (via een grid over
+    de begin- en eindpunten) en verbetert de volgorde daarna met 2-opt.
+    Zo wordt de afstand die met de pen omhoog wordt afgelegd zo klein
+    mogelijk.
+
+    Parameters
+    ----------
+    strokes : list
+        Lijst van lijnen, elke lijn is een lijst van (x, y) punten.
+    start : tuple
+        De positie van de pen voor de eerste lijn.
+    reverse : bool
+        Als True mogen lijnen ook omgekeerd getekend worden.
+    window : int
+        Het aantal lijnen dat 2-opt vooruit kijkt. 0 schakelt 2-opt uit.
+    passes : int
+        Het maximum aantal 2-opt rondes.
+
+    Returns
+    -------
+    PathOptimizerResult
+        De lijnen in de nieuwe volgorde met de afgelegde afstanden.
+
+    Example
+    -------
+
+    Teken een aantal lijnen in een efficiente volgorde::
+
+        result = optimize_strokes(strokes)
+        for stroke in result.strokes:
+            ...
+    """
+    strokes = [stroke for stroke in strokes if len(stroke) > 0]
+    travel_before = path_travel(strokes, start)
+    if not strokes:
+        return PathOptimizerResult([], travel_before, travel_before)
+
+    starts = [(stroke[0][0], stroke[0][1]) for stroke in strokes]
+    ends = [(stroke[-1][0], stroke[-1][1]) for stroke in strokes]
+
+    order = _nearest_neighbour_order(starts, ends, reverse, start)
+
+    # without reversing strokes the 2-opt move is not a local change
+    if reverse and window > 0:
+        order = _two_opt(order, starts, ends, start, window, passes)
+
+    result = [
+        list(reversed(strokes[index])) if reversed_ else strokes[index]
+        for index, reversed_ in order
+    ]
+    travel_after = path_travel(result, start)
+
+    # never make things worse than the input order
+    if travel_after > travel_before:
+        return PathOptimizerResult(strokes, travel_before, travel_before)
+
+    return PathOptimizerResult(result, travel_before, travel_after)
@@ -0,0 +1,361 @@
+"""Raster images to gcode for laser engraving."""
+
+__all__ = ["raster_gcode", "engrave"]
+
+import array
+import asyncgcodecli.logger as logger
+from asyncgcodecli.compiler import CompiledProgram
+
+try:
+    import numpy
+except ImportError:  # pragma: no cover
+    numpy = None
+
+if numpy is not None:
+    # 4x4 ordered dither thresholds in (0, 1)
+    _BAYER = (
+        numpy.array(
+            [[0, 8, 2, 10], [12, 4, 14, 6], [3, 11, 1, 9], [15, 7, 13, 5]],
+            dtype=numpy.float64,
+        )
+        + 0.5
+    ) / 16
+
+
+def _format(value):
+    text = b"%.3f" % value
+    text = text.rstrip(b"0").rstrip(b".")
+    return b"0" if text == b"-0" else text
+
+
+class _Raster:
+    """Turns the rows of an image into laser power runs."""
+
+    def __init__(
+        self,
+        image,
+        pixel_size,
+        origin,
+        gamma,
+        invert,
+        levels,
+        dither,
+        min_power,
+        max_power,
+    ):
+        if numpy is None:
+            raise ImportError("raster engraving needs numpy")
+        image = numpy.asarray(image)
+        if image.ndim != 2:
+            raise ValueError("expected a grayscale image (2 dimensional array)")
+        self.image = image
+        self.pixel_size = pixel_size
+        self.origin = origin
+        self.gamma = gamma
+        self.invert = invert
+        self.levels = levels
+        self.dither = dither
+        self.min_power = min_power
+        self.max_power = max_power
+        if numpy.issubdtype(image.dtype, numpy.integer):
+            self.scale = float(numpy.iinfo(image.dtype).max)
+        else:
+            self.scale = 1.0
+
+    def power(self, index):
+        """The S value of every pixel of a row, 0 is off."""
+        darkness = numpy.clip(self.image[index] / self.scale, 0.0, 1.0)
+        if self.invert:
+            darkness = 1.0 - darkness
+        if self.gamma != 1.0:
+            darkness = darkness**self.gamma
+
+        if self.levels is not None:
+            steps = self.levels - 1
+            if self.dither:
+                threshold = _BAYER[index % 4][numpy.arange(len(darkness)) % 4]
+            else:
+                threshold = 0.5
+            darkness = numpy.floor(darkness * steps + threshold) / steps
+
+        power = self.min_power + darkness * (self.max_power - self.min_power)
+        return numpy.where(darkness > 0, numpy.rint(power), 0).astype(numpy.int64)
+
+    def runs(self, index):
+        """Runs of equal power as (first, end, power) arrays, None if blank."""
+        power = self.power(index)
+        lit = numpy.flatnonzero(power)
+        if len(lit) == 0:
+            return None
+        first, last = lit[0], lit[-1] + 1
+        power = power[first:last]
+        changes = numpy.flatnonzero(numpy.diff(power)) + 1
+        starts = numpy.concatenate(([0], changes))
+        ends = numpy.concatenate((changes, [len(power)]))
+        return starts + first, ends + first, power[starts]
+
+
+class _Scanner:
+    """
+    Turns the runs of a raster into gcode lines, one row at a time.
+
+    Remembers the modal state of the device (power, feed, whether z was
+    sent and the laser is on) so words that did not change are left out.
+    """
+
+    def __init__(self, raster, speed, overscan, min_gap, z, laser_switch):
+        self.raster = raster
+        self.speed = speed
+        self.speed_word = b" F" + _format(speed)
+        self.overscan = overscan
+        self.gap = min_gap / raster.pixel_size if min_gap is not None else None
+        self.z = z
+        self.switch = laser_switch
+        self.height = raster.image.shape[0]
+        self.power = None
+        self.feed = None
+        self.z_sent = False
+        self.lit = False
+
+    def __laser(self, lines, lit):
+        # a laser without power control is switched for every burning run
+        if self.switch is not None and lit != self.lit:
+            lines.append(self.switch[0] if lit else self.switch[1])
+            self.lit = lit
+
+    def __move(self, lines, x, power, rapid=False):
+        self.__laser(lines, power > 0 and not rapid)
+        if rapid:
+            lines.append(b"G0 X" + _format(x))
+            return
+        line = b"G1 X" + _format(x)
+        if self.switch is None and power != self.power:
+            line += b" S%d" % power
+            self.power = power
+        if self.feed != self.speed:
+            line += self.speed_word
+            self.feed = self.speed
+        lines.append(line)
+
+    def row(self, index, reverse):
+        """The lines of row index (0 is the top), empty for a blank row."""
+        runs = self.raster.runs(index)
+        if runs is None:
+            return []
+        starts, ends, powers = runs
+        pixel_size = self.raster.pixel_size
+        x0, y0 = self.raster.origin
+        y = y0 + (self.height - 1 - index) * pixel_size
+        if reverse:
+            starts, ends, powers = ends[::-1], starts[::-1], powers[::-1]
+            direction = -1
+        else:
+            direction = 1
+
+        lines = []
+        overscan = self.overscan
+        start_x = x0 + starts[0] * pixel_size
+        self.__laser(lines, False)
+        line = b"G0 X" + _format(start_x - direction * overscan) + b" Y" + _format(y)
+        if self.z is not None and not self.z_sent:
+            line += b" Z" + _format(self.z)
+            self.z_sent = True
+        lines.append(line)
+        if overscan:
+            self.__move(lines, start_x, 0)
+
+        for start, end, power in zip(starts.tolist(), ends.tolist(), powers.tolist()):
+            x = x0 + end * pixel_size
+            # long blank stretches are crossed with a rapid move
+            rapid = power == 0 and self.gap is not None and abs(end - start) >= self.gap
+            self.__move(lines, x, power, rapid)
+
+        if overscan:
+            self.__move(lines, x0 + ends[-1] * pixel_size + direction * overscan, 0)
+        return lines
+
+    def finish(self):
+        """The lines after the last row, a switched laser is turned off."""
+        lines = []
+        self.__laser(lines, False)
+        return lines
+
+
+def _rows(
+    image,
+    pixel_size=0.1,
+    origin=(0.0, 0.0),
+    speed=1000,
+    gamma=1.0,
+    invert=True,
+    levels=None,
+    dither=True,
+    min_power=0,
+    max_power=255,
+    bidirectional=True,
+    overscan=0.0,
+    min_gap=1.0,
+    z=None,
+    laser_switch=None,
+):
+    if laser_switch is not None and levels is None:
+        levels = 2
+    raster = _Raster(
+        image, pixel_size, origin, gamma, invert, levels, dither, min_power, max_power
+    )
+    scanner = _Scanner(raster, speed, overscan, min_gap, z, laser_switch)
+    reverse = False
+    for index in range(scanner.height):
+        lines = scanner.row(index, reverse)
+        if lines:
+            if bidirectional:
+                reverse = not reverse
+            yield lines
+    lines = scanner.finish()
+    if lines:
+        yield lines
+
+
+def raster_gcode(image, **kw):
+    """
+    Zet een grijswaarden afbeelding om in gcode voor een laser.
+
+    De afbeelding wordt regel voor regel afgetast, om en om heen en
+    terug. Pixels met dezelfde laserkracht worden samengevoegd tot een
+    G1 opdracht, de S waarde staat er alleen bij als die verandert. Lege
+    stukken aan het begin en eind van een regel en lege regels worden
+    overgeslagen, lange lege stukken binnen een regel worden met G0
+    overgestoken.
+
+    Parameters
+    ----------
+    image : numpy.ndarray
+        De afbeelding, 2 dimensionaal. Gehele getallen lopen van 0 tot
+        het maximum van het type (255 voor uint8), anders van 0 tot 1.
+    pixel_size : float
+        De grootte van een pixel in mm.
+    origin : tuple
+        De (x, y) positie van de linker onderhoek in mm.
+    speed : float
+        De snelheid tijdens het branden in mm/min.
+    gamma : float
+        De laserkracht is donkerte ** gamma.
+    invert : bool
+        Als True branden donkere pixels (de normale situatie).
+    levels : int
+        Het aantal stappen in de laserkracht, bijvoorbeeld 2 voor een
+        laser die alleen aan of uit kan. None voor alle waarden tussen
+        min_power en max_power.
+    dither : bool
+        Verdeel de tussenliggende grijswaarden met geordende dithering
+        over de stappen. Alleen bij levels.
+    min_power : int
+        De S waarde van de lichtste pixel die nog brandt.
+    max_power : int
+        De S waarde van een zwarte pixel.
+    bidirectional : bool
+        Tast om en om heen en terug af.
+    overscan : float
+        Afstand in mm die de laser uit voor en na een regel aflegt,
+        zodat hij op snelheid is tijdens het branden.
+    min_gap : float
+        Lege stukken van minstens deze lengte in mm worden met G0
+        overgestoken. None om altijd G1 S0 te gebruiken.
+    z : float
+        De hoogte van de laser, wordt bij de eerste beweging meegestuurd.
+    laser_switch : tuple
+        (aan, uit) opdrachten voor een laser zonder vermogensregeling.
+        De laser wordt dan voor elk stuk dat brandt aangezet en daarna
+        weer uit, er worden geen S waarden gebruikt. levels is dan
+        standaard 2.
+
+    Returns
+    -------
+    generator
+        De gcode regels (bytes), regel voor regel berekend.
+    """
+    for lines in _rows(image, **kw):
+        yield from lines
+
+
+def _program(lines):
+    data = bytearray()
+    offsets = array.array("Q", [0])
+    for line in lines:
+        data += line
+        data += b"\r"
+        offsets.append(len(data))
+    return CompiledProgram(memoryview(bytes(data)), offsets)
+
+
+async def engrave(
+    device, image, laser_on=b"M4 S0", laser_off=b"M5", chunk_size=16384, **kw
+):
+    """
+    Graveer een afbeelding met een laser.
+
+    De gcode wordt regel voor regel berekend en in stukken van ongeveer
+    chunk_size bytes via stream_program verstuurd. Er staan nooit meer
+    dan twee stukken klaar, het geheugengebruik blijft dus beperkt, ook
+    voor grote afbeeldingen.
+
+    Parameters
+    ----------
+    device : GenericDriver
+        Het apparaat.
+    image : numpy.ndarray
+        De afbeelding, zie raster_gcode.
+    laser_on : bytes
+        De opdracht die de laser inschakelt, voor de eerste regel.
+    laser_off : bytes
+        De opdracht die de laser uitschakelt, na de laatste regel.
+    chunk_size : int
+        De grootte van een stuk in bytes.
+
+    Overige argumenten gaan naar raster_gcode.
+
+    Returns
+    -------
+    dict
+        Het resultaat, met "errors" als (regel, resultaat) paren als er
+        regels een fout gaven. De regels tellen vanaf de eerste gcode
+        regel, inclusief laser_on.
+    """
+    results = []
+
+    def send(lines):
+        program = _program(lines)
+        results.append((len(program), device.stream_program(program)))
+
+    chunk = [laser_on] if laser_on else []
+    size = 0
+    for lines in _rows(image, **kw):
+        chunk += lines
+        size += sum(len(line) + 1 for line in lines)
+        if size >= chunk_size:
+            # one chunk is streamed while the next one is made
+            await device.wait_queue_space(1)
+            send(chunk)
+            chunk = []
+            size = 0
+    if laser_off:
+        chunk.append(laser_off)
+    if chunk:
+        await device.wait_queue_space(1)
+        send(chunk)
+
+    errors = []
+    index = 0
+    for count, result in results:
+        result = await result
+        for line, error in result.get("errors", []):
+            errors.append((index + line, error))
+        index += count
+    logger.log(logger.DEBUG, "Engraved {} lines", index)
+    if errors:
+        return {
+            "result": "error",
+            "error_code": errors[0][1].get("error_code"),
+            "errors": errors,
+        }
+    return {"result": "ok", "error_code": 0}
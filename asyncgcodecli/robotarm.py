@@ -2,14 +2,114 @@
 
 __all__ = ["RobotArm"]
 
+import asyncio
 import math
-from asyncgcodecli.driver import GRBLDriver
+from asyncgcodecli.driver import GRBLDriver, GCodeMoveLinearCommand
+
+
+def _joint_angles(x: float, y: float, z: float):
+    # https://paulbourke.net/geometry/circlesphere/
+    l1 = 200
+    l2 = 200
+
+    lxy = math.sqrt(math.pow(x, 2) + math.pow(y, 2))
+
+    d = math.sqrt(math.pow(lxy, 2) + math.pow(z, 2))
+    a = (math.pow(l1, 2) - math.pow(l2, 2) + math.pow(d, 2)) / (2 * d)
+    h = math.sqrt(math.pow(l1, 2) - math.pow(a, 2))
+
+    p2y = a * lxy / d
+    p2z = a * z / d
+
+    pjz = p2z + h * lxy / d
+    pjy = p2y - h * z / d
+
+    _angle0 = math.atan2(x, y) * 180 / math.pi
+    _angle1 = math.atan2(pjy, pjz) * 180 / math.pi
+    _angle2 = math.atan2(z - pjz, lxy - pjy) * 180 / math.pi
+
+    return [_angle0, _angle1, _angle2]
+
+
+def _segment_count(start, end, segment_length):
+    return max(1, math.ceil(math.dist(start, end) / segment_length))
+
+
+def _plan_linear_move(
+    start,
+    end,
+    speed,
+    acceleration=None,
+    max_joint_speeds=None,
+    segment_length=1.0,
+    first=1,
+    last=None,
+    cartesian=True,
+):
+    """
+    Split a straight move in segments with a joint space feed each.
+
+    The feed of a segment is chosen so that the tool covers the segment
+    in the time it takes at the cartesian speed, the speed profile of a
+    trapezoid with the given acceleration that starts and ends at rest.
+    A segment is slowed down further when a joint would exceed its
+    maximum speed. Without cartesian the feed is the speed itself.
+
+    Only segments first up to and including last are returned, so a long
+    move can be planned in parts. Returns a list of (angles, feed).
+    """
+    length = math.dist(start, end)
+    steps = _segment_count(start, end, segment_length)
+    if last is None:
+        last = steps
+    # speeds are per minute like F, the acceleration is per second^2
+    accel = None if acceleration is None else acceleration * 3600
+
+    def point(i):
+        return [a + (b - a) * i / steps for a, b in zip(start, end)]
+
+    segments = []
+    previous = _joint_angles(*point(first - 1))
+    for i in range(first, last + 1):
+        angles = _joint_angles(*point(i))
+        deltas = [abs(b - a) for a, b in zip(previous, angles)]
+        joint_length = math.sqrt(sum(delta * delta for delta in deltas))
+        previous = angles
+        if joint_length == 0:
+            continue
+        if not cartesian:
+            segments.append((angles, speed))
+            continue
+
+        v = speed
+        if accel is not None:
+            # the speed halfway the segment
+            s = length * (i - 0.5) / steps
+            v = min(v, math.sqrt(2 * accel * s), math.sqrt(2 * accel * (length - s)))
+
+        duration = (length / steps) / v
+        if max_joint_speeds is not None:
+            for delta, max_speed in zip(deltas, max_joint_speeds):
+                if max_speed:
+                    duration = max(duration, delta / max_speed)
+
+        segments.append((angles, joint_length / duration))
+    return segments
 
 
 class RobotArm(GRBLDriver):
     """Stelt een RobotArm voor."""
 
-    def __init__(self, port, *args, **kw):
+    def __init__(
+        self,
+        port,
+        *args,
+        feed_mode="joint",
+        acceleration=None,
+        max_joint_speeds=None,
+        segment_length=1.0,
+        **kw
+    ):
         """
         Maak een nieuw RobotArm object.
 
@@ -17,33 +117,38 @@ class RobotArm(GRBLDriver):
         ----------
         port : string
             De naam van de usb port.
+        feed_mode : string
+            "joint": de snelheid van move_linear is de F van de
+            hoekbewegingen, de snelheid van de arm hangt dan af van de
+            stand. "cartesian": elk stukje van de beweging krijgt een F
+            zodat de arm zelf met de gevraagde snelheid beweegt.
+        acceleration : float
+            Alleen bij "cartesian": de maximale versnelling van de arm in
+            mm/s^2. Een beweging begint en eindigt dan rustig. None laat
+            het versnellen aan de firmware over.
+        max_joint_speeds : list
+            Alleen bij "cartesian": maximale snelheid per gewricht in
+            graden per minuut. Als None, dan worden $110-$112 uit de
+            instellingen van het apparaat gebruikt.
+        segment_length : float
+            Alleen bij "cartesian": de lengte in mm van de stukjes waarin
+            een beweging opgedeeld wordt.
         """
         super().__init__(port, *args, **kw)
         self.lastXYZ = None
+        self.feed_mode = feed_mode
+        self.acceleration = acceleration
+        self.max_joint_speeds = max_joint_speeds
+        self.segment_length = segment_length
 
     def convertToXYZtoAngles(self, x: float, y: float, z: float):
+        return _joint_angles(x, y, z)
 
-        # https://paulbourke.net/geometry/circlesphere/
-        l1 = 200
-        l2 = 200
-
-        lxy = math.sqrt(math.pow(x, 2) + math.pow(y, 2))
-
-        d = math.sqrt(math.pow(lxy, 2) + math.pow(z, 2))
-        a = (math.pow(l1, 2) - math.pow(l2, 2) + math.pow(d, 2)) / (2 * d)
-        h = math.sqrt(math.pow(l1, 2) - math.pow(a, 2))
-
-        p2y = a * lxy / d
-        p2z = a * z / d
-
-        pjz = p2z + h * lxy / d
-        pjy = p2y - h * z / d
-
-        _angle0 = math.atan2(x, y) * 180 / math.pi
-        _angle1 = math.atan2(pjy, pjz) * 180 / math.pi
-        _angle2 = math.atan2(z - pjz, lxy - pjy) * 180 / math.pi
-
-        return [_angle0, _angle1, _angle2]
+    def _joint_speed_limits(self):
+        if self.max_joint_speeds is not None:
+            return self.max_joint_speeds
+        limits = [float(self.settings.get(key, 0)) for key in ("110", "111", "112")]
+        return limits if any(limits) else None
 
     def move_linear(
         self, x: float, y: float, z: float, speed: float = 100, interpolate=True
@@ -54,6 +159,19 @@ class RobotArm(GRBLDriver):
         if self.lastXYZ is None or interpolate is False:
             angles = self.convertToXYZtoAngles(*newXYZ)
             lastMove = super().move_linear(*angles, speed)
+        elif self.feed_mode == "cartesian":
+            segments = _plan_linear_move(
+                self.lastXYZ,
+                newXYZ,
+                speed,
+                self.acceleration,
+                self._joint_speed_limits(),
+                self.segment_length,
+            )
+            for angles, feed in segments:
+                lastMove = super().move_linear(*angles, feed)
+            if lastMove is None:
+                lastMove = self._last_result()
         else:
             len = math.sqrt(math.pow(x, 2) + math.pow(y, 2) + math.pow(z, 2))
             numSteps = min(math.ceil(len * 1000 / speed), math.ceil(len))
@@ -70,3 +188,123 @@ class RobotArm(GRBLDriver):
         self.lastXYZ = newXYZ
 
         return lastMove
+
+    async def move_path_async(
+        self,
+        points,
+        speed=100,
+        executor=None,
+        chunk_size=64,
+        max_pending=256,
+        prefetch=2,
+    ):
+        """
+        Beweeg in rechte lijnen langs een reeks punten.
+
+        De inverse kinematica wordt in stukken van chunk_size segmenten
+        in een executor berekend, terwijl de arm de vorige stukken al
+        uitvoert. De event loop (en andere devices) blijven zo vlot
+        reageren. Een stuk wordt pas in de wachtrij gezet als er niet
+        meer dan max_pending opdrachten op verwerking wachten.
+
+        Parameters
+        ----------
+        points : list
+            Lijst van (x, y, z) punten.
+        speed : float
+            De snelheid, zie feed_mode.
+        executor : concurrent.futures.Executor
+            Waar de stukken berekend worden, None voor de standaard
+            thread pool van de event loop. Met een ProcessPoolExecutor
+            worden meerdere stukken tegelijk berekend.
+        chunk_size : int
+            Het aantal segmenten per stuk.
+        max_pending : int
+            Het maximale aantal onverwerkte opdrachten in de wachtrij.
+        prefetch : int
+            Het aantal stukken dat vooruit berekend wordt. Bij 2 wordt
+            het volgende stuk berekend terwijl het vorige verstuurd wordt,
+            geef bij een ProcessPoolExecutor het aantal processen.
+
+        Returns
+        -------
+        dict
+            Het resultaat van de hele beweging, met "errors" als (index,
+            resultaat) paren als er opdrachten een fout gaven.
+
+        Example
+        -------
+
+        Beweeg langs een lange spiraal::
+
+            await arm.move_path_async(spiral_points, speed=3000)
+        """
+        if prefetch < 1:
+            raise ValueError("prefetch must be at least 1")
+        loop = asyncio.get_running_loop()
+        cartesian = self.feed_mode == "cartesian"
+        limits = self._joint_speed_limits() if cartesian else None
+        points = [list(point) for point in points]
+        results = []
+
+        if points and self.lastXYZ is None:
+            # the position is not known, go to the first point directly
+            angles = _joint_angles(*points[0])
+            command = GCodeMoveLinearCommand(*angles, speed=speed)
+            results.append((1, self.queue_batch([command])))
+            self.lastXYZ = points[0]
+            points = points[1:]
+
+        def chunks():
+            start = self.lastXYZ
+            for end in points:
+                steps = _segment_count(start, end, self.segment_length)
+                for first in range(1, steps + 1, chunk_size):
+                    yield (
+                        start,
+                        end,
+                        speed,
+                        self.acceleration if cartesian else None,
+                        limits,
+                        self.segment_length,
+                        first,
+                        min(first + chunk_size - 1, steps),
+                        cartesian,
+                    )
+                start = end
+
+        planned = []
+        tasks = chunks()
+        while True:
+            # plan ahead while the previous chunks are executed
+            for task in tasks:
+                planned.append(loop.run_in_executor(executor, _plan_linear_move, *task))
+                if len(planned) >= prefetch:
+                    break
+            if not planned:
+                break
+
+            segments = await planned.pop(0)
+            await self.wait_queue_space(max_pending)
+            commands = [
+                GCodeMoveLinearCommand(*angles, speed=feed) for angles, feed in segments
+            ]
+            results.append((len(commands), self.queue_batch(commands)))
+
+        if points:
+            self.lastXYZ = points[-1]
+
+        errors = []
+        index = 0
+        for count, result in results:
+            result = await result
+            for i, error in result.get("errors", []):
+                errors.append((index + i, error))
+            index += count
+        if errors:
+            return {
+                "result": "error",
+                "error_code": errors[0][1].get("error_code"),
+                "errors": errors,
+            }
+        return {"result": "ok", "error_code": 0}
@@ -0,0 +1,426 @@
+"""Distribute jobs over a group of identical devices."""
+
+__all__ = ["Scheduler", "ScheduledJob"]
+
+import asyncio
+import bisect
+import itertools
+import time
+import traceback
+import asyncgcodecli.logger as logger
+from asyncgcodecli.driver import TimeoutException
+from asyncgcodecli.job import Job
+from asyncgcodecli.simulator import simulate
+
+
+class ScheduledJob:
+    """
+    Een job in de wachtrij van een Scheduler.
+
+    Attributes
+    ----------
+    name : string
+        De naam van de job, voor de logging.
+    estimate : float
+        De geschatte duur in seconden, None als onbekend.
+    state : string
+        "queued", "running", "done" of "failed".
+    timeout : float
+        De maximale duur van een poging in seconden, None voor geen
+        limiet.
+    attempts : int
+        Het aantal keer dat de job gestart is.
+    device : int
+        De index van het device dat de job als laatste uitvoerde.
+    result : object
+        Het resultaat van het script of van Job.run.
+    error : Exception
+        De fout van de laatste mislukte poging.
+    duration : float
+        De duur van de laatste poging in seconden.
+    """
+
+    def __init__(self, work, estimate, name, timeout=None):
+        self.work = work
+        self.estimate = estimate
+        self.name = name
+        self.timeout = timeout
+        self.state = "queued"
+        self.attempts = 0
+        self.device = None
+        self.result = None
+        self.error = None
+        self.duration = None
+        self.failed_on = set()
+
+    def __repr__(self):
+        return "<ScheduledJob {} {}>".format(self.name, self.state)
+
+
+def _estimate(work, settings):
+    # only a job that can be iterated again can be simulated up front
+    if not isinstance(work, Job):
+        return None
+    commands = work.commands
+    if callable(commands):
+        commands = commands()
+    elif not isinstance(commands, (list, tuple)):
+        return None
+    return simulate(commands, settings).total_time
+
+
+def _succeeded(result):
+    # scripts return nothing, a GCodeResult or the dict of Job.run
+    return not isinstance(result, dict) or result.get("result", "ok") == "ok"
+
+
+class Scheduler:
+    """
+    Verdeelt een wachtrij van jobs over een groep gelijke devices.
+
+    Elk device pakt zodra het vrij is de volgende job uit de wachtrij,
+    zo staat er geen device stil zolang er werk is. De langste jobs
+    (volgens de schatting) gaan eerst, dan eindigen de devices ongeveer
+    tegelijk. Een mislukte job wordt opnieuw geprobeerd op een device
+    waarop hij nog niet mislukt is, ook als hij te lang duurde. Een
+    device dat een paar jobs achter elkaar laat mislukken wordt niet
+    meer gebruikt.
+
+    Parameters
+    ----------
+    devices : list
+        De devices. Ze worden door de scheduler gestart en gestopt.
+    max_attempts : int
+        Hoe vaak een job geprobeerd wordt.
+    max_device_failures : int
+        Na zoveel mislukte jobs op rij wordt een device niet meer
+        gebruikt.
+    ready_timeout : float
+        Hoe lang er na een reset of verbroken verbinding gewacht wordt tot
+        een device weer ready is.
+    job_timeout : float
+        De maximale duur van een job in seconden, inclusief het wachten
+        tot het device stilstaat, voor jobs zonder eigen timeout. Een job
+        die te lang duurt wordt afgebroken, het device krijgt een soft
+        reset en de job gaat terug in de wachtrij. None voor geen limiet.
+    settings : dict
+        Instellingen voor het schatten van de duur van Job objecten, zie
+        simulate. Standaard de instellingen van GRBL.
+
+    Example
+    -------
+
+    Een map met tekeningen op een rij plotters::
+
+        scheduler = Scheduler([Plotter(port) for port in ports])
+        for path in glob.glob("drawings/*.gcode"):
+            scheduler.submit(Job.from_file(path), name=path)
+        report = scheduler.execute()
+        print("{:.0%}".format(report["utilization"]))
+    """
+
+    def __init__(
+        self,
+        devices,
+        max_attempts=3,
+        max_device_failures=3,
+        ready_timeout=30.0,
+        job_timeout=None,
+        settings=None,
+    ):
+        self.devices = list(devices)
+        self.max_attempts = max_attempts
+        self.max_device_failures = max_device_failures
+        self.ready_timeout = ready_timeout
+        self.job_timeout = job_timeout
+        self.settings = settings
+        self.jobs = []
+        self.__queue = []
+        self.__sequence = itertools.count()
+        self.__running = 0
+        self.__changed = None
+        self.__online = [False] * len(self.devices)
+        self.__starting = [False] * len(self.devices)
+        self.__busy = [0.0] * len(self.devices)
+        self.__completed = [0] * len(self.devices)
+        self.__failures = [0] * len(self.devices)
+        self.__failures_in_row = [0] * len(self.devices)
+        self.__started = None
+        self.__finished = None
+
+    def submit(self, work, estimate=None, name=None, timeout=None):
+        """
+        Zet een job in de wachtrij, ook tijdens het uitvoeren.
+
+        Parameters
+        ----------
+        work : Job of script
+            Een Job, of een async functie die het device als argument
+            krijgt.
+        estimate : float
+            De verwachte duur in seconden. Voor een Job met een lijst
+            opdrachten of een functie (zoals Job.from_file) wordt die
+            anders met simulate geschat.
+        name : string
+            Naam voor de logging.
+        timeout : float
+            De maximale duur van de job in seconden, standaard
+            job_timeout.
+
+        Returns
+        -------
+        ScheduledJob
+            De job in de wachtrij.
+        """
+        if estimate is None:
+            estimate = _estimate(work, self.settings)
+        if name is None:
+            name = "job {}".format(len(self.jobs))
+        if timeout is None:
+            timeout = self.job_timeout
+        job = ScheduledJob(work, estimate, name, timeout)
+        self.jobs.append(job)
+        self.__enqueue(job)
+        return job
+
+    def __enqueue(self, job):
+        job.state = "queued"
+        # longest first, jobs without an estimate in submission order
+        key = (-(job.estimate or 0.0), next(self.__sequence))
+        bisect.insort(self.__queue, (key, job))
+        self.__wake()
+
+    def __wake(self):
+        if self.__changed is not None:
+            changed, self.__changed = self.__changed, asyncio.Event()
+            changed.set()
+
+    def __take(self, index):
+        # a device that is still starting will take the job soon
+        usable = {
+            i
+            for i in range(len(self.devices))
+            if self.__online[i] or self.__starting[i]
+        }
+        for position, (_, job) in enumerate(self.__queue):
+            # a job that failed everywhere may try again anywhere
+            if index not in job.failed_on or usable <= job.failed_on:
+                del self.__queue[position]
+                return job
+        return None
+
+    async def __next_job(self, index):
+        while self.__online[index]:
+            job = self.__take(index)
+            if job is not None:
+                return job
+            if not self.__queue and self.__running == 0:
+                return None
+            # wait for a new job or a job that fails elsewhere
+            await self.__changed.wait()
+        return None
+
+    async def __recover(self, index, device):
+        try:
+            await asyncio.wait_for(device.ready(), self.ready_timeout)
+            return True
+        except (TimeoutException, asyncio.TimeoutError):
+            logger.log(logger.ERROR, "Device {} did not recover", index)
+            return False
+
+    @staticmethod
+    def __stop(device, exception):
+        # the device may still be moving, throw away what it has left
+        device.abort(exception)
+        if device.soft_reset is not None:
+            device.reset()
+        else:
+            # it finishes what was sent, nothing more follows
+            device.resume()
+
+    async def __execute(self, index, device, job):
+        job.state = "running"
+        job.attempts += 1
+        job.device = index
+        job.error = None
+        self.__running += 1
+        logger.log(
+            logger.INFO,
+            "Starting {} on device {} (attempt {})",
+            (job.name, index, job.attempts),
+        )
+
+        async def attempt():
+            if isinstance(job.work, Job):
+                result = await job.work.run(device)
+            else:
+                result = await job.work(device)
+            await device.wait_for_idle()
+            return result
+
+        start = time.monotonic()
+        try:
+            job.result = await asyncio.wait_for(attempt(), job.timeout)
+            succeeded = _succeeded(job.result)
+        except asyncio.CancelledError:
+            raise
+        except asyncio.TimeoutError:
+            logger.log(
+                logger.ERROR,
+                "{} took more than {} s on device {}",
+                (job.name, job.timeout, index),
+            )
+            job.error = TimeoutException("job timed out")
+            succeeded = False
+            self.__stop(device, job.error)
+        except Exception as e:
+            logger.log(
+                logger.ERROR, "{} failed: {}", (job.name, traceback.format_exc())
+            )
+            job.error = e
+            succeeded = False
+        finally:
+            job.duration = time.monotonic() - start
+            self.__busy[index] += job.duration
+
+        try:
+            await self.__settle(index, device, job, succeeded)
+        finally:
+            # the job counts as running until it is requeued, otherwise an
+            # idle device could stop while the job still needs one
+            self.__running -= 1
+            self.__wake()
+
+    async def __settle(self, index, device, job, succeeded):
+        if succeeded:
+            job.state = "done"
+            self.__completed[index] += 1
+            self.__failures_in_row[index] = 0
+        else:
+            job.failed_on.add(index)
+            self.__failures[index] += 1
+            self.__failures_in_row[index] += 1
+            if self.__failures_in_row[index] >= self.max_device_failures:
+                logger.log(
+                    logger.ERROR,
+                    "Device {} failed {} jobs in a row, not using it any more",
+                    (index, self.__failures_in_row[index]),
+                )
+                self.__online[index] = False
+            elif job.error is not None and not await self.__recover(index, device):
+                self.__online[index] = False
+
+            if job.attempts < self.max_attempts:
+                self.__enqueue(job)
+            else:
+                logger.log(logger.ERROR, "Giving up on {}", job.name)
+                job.state = "failed"
+
+    async def __worker(self, index, device):
+        try:
+            self.__starting[index] = True
+            device.start()
+            self.__online[index] = await self.__recover(index, device)
+            self.__starting[index] = False
+            self.__wake()
+            while True:
+                job = await self.__next_job(index)
+                if job is None:
+                    break
+                await self.__execute(index, device, job)
+        except Exception:
+            logger.log(
+                logger.FATAL, "Device {} error {}", (index, traceback.format_exc())
+            )
+        finally:
+            self.__online[index] = False
+            self.__starting[index] = False
+            device.stop()
+            self.__wake()
+
+    async def run(self):
+        """
+        Voer alle jobs uit en wacht tot de wachtrij leeg is.
+
+        Returns
+        -------
+        dict
+            Het verslag, zie utilization.
+        """
+        self.__changed = asyncio.Event()
+        self.__started = time.monotonic()
+        self.__finished = None
+        try:
+            await asyncio.gather(
+                *[
+                    self.__worker(index, device)
+                    for index, device in enumerate(self.devices)
+                ]
+            )
+        finally:
+            self.__finished = time.monotonic()
+            self.__changed = None
+
+        # no device is left for these
+        for _, job in self.__queue:
+            job.state = "failed"
+        self.__queue = []
+
+        report = self.utilization()
+        logger.log(
+            logger.INFO,
+            "{} jobs done, {} failed, utilization {:.0%}",
+            (report["completed"], report["failed"], report["utilization"]),
+        )
+        return report
+
+    def execute(self):
+        """Voer alle jobs uit in een nieuwe event loop, zie run."""
+        return asyncio.run(self.run())
+
+    def utilization(self):
+        """
+        Geef een verslag van de uitvoering tot nu toe.
+
+        Returns
+        -------
+        dict
+            Met "elapsed" (seconden), "completed", "failed" en "queued"
+            (aantal jobs), "utilization" (de gemiddelde fractie van de
+            tijd dat de devices bezig waren) en "devices": per device een
+            dict met "jobs", "failures", "busy", "utilization" en
+            "online".
+        """
+        if self.__started is None:
+            elapsed = 0.0
+        else:
+            elapsed = (self.__finished or time.monotonic()) - self.__started
+
+        devices = []
+        for index in range(len(self.devices)):
+            busy = self.__busy[index]
+            devices.append(
+                {
+                    "jobs": self.__completed[index],
+                    "failures": self.__failures[index],
+                    "busy": busy,
+                    "utilization": busy / elapsed if elapsed > 0 else 0.0,
+                    "online": self.__online[index],
+                }
+            )
+
+        def count(state):
+            return sum(1 for job in self.jobs if job.state == state)
+
+        return {
+            "elapsed": elapsed,
+            "completed": count("done"),
+            "failed": count("failed"),
+            "queued": count("queued"),
+            "utilization": (
+                sum(device["utilization"] for device in devices) / len(devices)
+                if devices
+                else 0.0
+            ),
+            "devices": devices,
+        }
@@ -0,0 +1,185 @@
+"""Settings for the serial connection to a device."""
+
+__all__ = ["SerialLink"]
+
+import re
+import time
+import serial
+import asyncgcodecli.logger as logger
+
+_LINE_END = re.compile(rb"[\r\n]")
+
+
+class SerialLink:
+    """
+    Instellingen van de seriele verbinding.
+
+    Parameters
+    ----------
+    baudrate : int
+        De baudrate. Wordt gebruikt als er niet geprobeerd wordt of als
+        geen van de probe_baudrates werkt.
+    timeout : float
+        Leestimeout in seconden van de ontvangst thread.
+    write_timeout : float
+        Schrijftimeout in seconden, None wacht onbeperkt.
+    rtscts : bool
+        Hardware flow control met RTS/CTS.
+    xonxoff : bool
+        Software flow control met XON/XOFF.
+    read_buffer_size : int
+        Grootte van de ontvangstbuffer van het besturingssysteem. Alleen
+        op platformen die dit ondersteunen (Windows).
+    write_buffer_size : int
+        Grootte van de zendbuffer van het besturingssysteem. Alleen op
+        platformen die dit ondersteunen (Windows).
+    low_latency : bool
+        Zet de poort in low latency mode zodat ontvangen bytes direct
+        doorgegeven worden. Alleen op Linux.
+    probe_baudrates : list
+        Baudrates om te proberen, de snelste eerst. De eerste waarop
+        het apparaat een geldige begroeting stuurt wordt gebruikt.
+    probe_timeout : float
+        Hoe lang er per baudrate op de begroeting gewacht wordt.
+
+    Example
+    -------
+
+    Een plotter met firmware die tot 1 Mbaud aankan::
+
+        link = SerialLink(
+            probe_baudrates=[1000000, 500000, 250000, 115200],
+            low_latency=True,
+        )
+        plotter = Plotter("/dev/ttyUSB0", serial_link=link)
+    """
+
+    def __init__(
+        self,
+        baudrate=115200,
+        timeout=0.01,
+        write_timeout=None,
+        rtscts=False,
+        xonxoff=False,
+        read_buffer_size=None,
+        write_buffer_size=None,
+        low_latency=False,
+        probe_baudrates=None,
+        probe_timeout=1.5,
+    ):
+        self.baudrate = baudrate
+        self.timeout = timeout
+        self.write_timeout = write_timeout
+        self.rtscts = rtscts
+        self.xonxoff = xonxoff
+        self.read_buffer_size = read_buffer_size
+        self.write_buffer_size = write_buffer_size
+        self.low_latency = low_latency
+        self.probe_baudrates = probe_baudrates
+        self.probe_timeout = probe_timeout
+
+    def create_serial(self, timeout=None):
+        """Maak een (nog niet geopend) serial.Serial object."""
+        return serial.Serial(
+            None,
+            baudrate=self.baudrate,
+            timeout=self.timeout if timeout is None else timeout,
+            write_timeout=self.write_timeout,
+            rtscts=self.rtscts,
+            xonxoff=self.xonxoff,
+        )
+
+    def configure(self, connection):
+        """Pas de instellingen toe die een geopende poort nodig hebben."""
+        if self.read_buffer_size is not None or self.write_buffer_size is not None:
+            if hasattr(connection, "set_buffer_size"):
+                connection.set_buffer_size(
+                    rx_size=self.read_buffer_size or 4096,
+                    tx_size=self.write_buffer_size,
+                )
+            else:
+                logger.log(
+                    logger.WARNING,
+                    "Buffer sizes are not supported for {}",
+                    (connection.port),
+                )
+
+        if self.low_latency:
+            try:
+                connection.set_low_latency_mode(True)
+            except (AttributeError, ValueError, OSError):
+                logger.log(
+                    logger.WARNING,
+                    "Low latency mode is not supported for {}",
+                    (connection.port),
+                )
+
+    def probe(self, connection, banner, wakeup=None):
+        """
+        Zoek de snelste baudrate waarop het apparaat antwoordt.
+
+        Parameters
+        ----------
+        connection : serial.Serial
+            De geopende poort.
+        banner : re.Pattern
+            Een regel die hieraan voldoet is een geldige begroeting. De
+            driver geeft zijn eigen banner, zodat het apparaat ook klaar
+            is na een begroeting die de probe goedkeurt.
+        wakeup : bytes
+            Wordt verstuurd om het apparaat opnieuw te laten begroeten,
+            bijvoorbeeld een soft reset. Als None, dan wordt het apparaat
+            gereset met de DTR lijn.
+
+        Returns
+        -------
+        list
+            De regels die ontvangen zijn op de gekozen baudrate, de
+            begroeting is de laatste. None als geen enkele baudrate werkt,
+            de poort staat dan weer op de standaard baudrate.
+        """
+        for baudrate in self.probe_baudrates or []:
+            logger.log(
+                logger.TRACE, "Probing {} at {} baud", (connection.port, baudrate)
+            )
+            connection.baudrate = baudrate
+            connection.reset_input_buffer()
+            if wakeup is None:
+                connection.dtr = False
+                time.sleep(0.1)
+                connection.dtr = True
+            else:
+                connection.write(wakeup)
+
+            lines = self.__read_banner(connection, banner)
+            if lines is not None:
+                logger.log(
+                    logger.INFO,
+                    "Using {} baud for {}",
+                    (baudrate, connection.port),
+                )
+                return lines
+
+        connection.baudrate = self.baudrate
+        return None
+
+    def __read_banner(self, connection, banner):
+        buffer = bytearray()
+        lines = []
+        deadline = time.monotonic() + self.probe_timeout
+        while time.monotonic() < deadline:
+            buffer += connection.read(connection.in_waiting or 1)
+            parts = _LINE_END.split(buffer)
+            buffer = bytearray(parts.pop())
+            for part in parts:
+                if not part:
+                    continue
+                try:
+                    line = part.decode("utf-8")
+                except UnicodeDecodeError:
+                    # garbage, most likely the wrong baudrate
+                    return None
+                lines.append(line)
+                if banner.fullmatch(line):
+                    return lines
+        return None
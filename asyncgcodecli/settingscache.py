@@ -0,0 +1,112 @@
+"""Persistent cache of device settings."""
+
+__all__ = ["SettingsCache"]
+
+import hashlib
+import json
+import os
+import tempfile
+import asyncgcodecli.logger as logger
+
+
+def _checksum(settings):
+    data = json.dumps(settings, sort_keys=True).encode("utf-8")
+    return hashlib.sha1(data).hexdigest()
+
+
+class SettingsCache:
+    """
+    Bewaart de instellingen ($$) van apparaten op schijf.
+
+    Na een reset stuurt een apparaat zijn begroeting en vraagt de driver
+    alle instellingen op voordat ready() klaar is. Met een cache is
+    ready() direct klaar met de bewaarde instellingen en worden ze op de
+    achtergrond ververst. Een entry hoort bij een poort en de begroeting
+    (firmware versie) en wordt alleen gebruikt als de checksum klopt.
+
+    Parameters
+    ----------
+    path : string
+        Het cache bestand. Standaard settings.json in de cache map van
+        de gebruiker.
+
+    Example
+    -------
+
+    Gebruik een cache voor een plotter::
+
+        plotter = Plotter("/dev/ttyUSB0", settings_cache=SettingsCache())
+    """
+
+    def __init__(self, path=None):
+        if path is None:
+            cache_home = os.environ.get("XDG_CACHE_HOME") or os.path.join(
+                os.path.expanduser("~"), ".cache"
+            )
+            path = os.path.join(cache_home, "asyncgcodecli", "settings.json")
+        self.path = path
+
+    def __read(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                entries = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        return entries if isinstance(entries, dict) else {}
+
+    @staticmethod
+    def __key(port, firmware):
+        return "{}|{}".format(port, firmware)
+
+    def load(self, port, firmware):
+        """
+        Geef de bewaarde instellingen of None.
+
+        Parameters
+        ----------
+        port : string
+            De poort van het apparaat.
+        firmware : string
+            De begroeting van het apparaat.
+        """
+        entry = self.__read().get(self.__key(port, firmware))
+        if not isinstance(entry, dict):
+            return None
+
+        settings = entry.get("settings")
+        if not isinstance(settings, dict) or entry.get("checksum") != _checksum(
+            settings
+        ):
+            logger.log(logger.WARNING, "Ignoring damaged settings cache for {}", port)
+            return None
+        return settings
+
+    def store(self, port, firmware, settings):
+        """
+        Bewaar de instellingen van een apparaat.
+
+        Returns
+        -------
+        bool
+            True als de instellingen anders waren dan in de cache.
+        """
+        entries = self.__read()
+        key = self.__key(port, firmware)
+        checksum = _checksum(settings)
+        old = entries.get(key)
+        if isinstance(old, dict) and old.get("checksum") == checksum:
+            return False
+
+        entries[key] = {"checksum": checksum, "settings": dict(settings)}
+
+        directory = os.path.dirname(self.path) or "."
+        try:
+            os.makedirs(directory, exist_ok=True)
+            # write and rename, so other processes never see half a file
+            fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(entries, f, indent=1, sort_keys=True)
+            os.replace(tmp_path, self.path)
+        except OSError:
+            logger.log(logger.WARNING, "Could not write settings cache {}", self.path)
+        return True
@@ -0,0 +1,346 @@
+"""Polyline simplification and arc fitting."""
+
+__all__ = ["simplify_polyline", "fit_arcs", "simplify_path"]
+
+import math
+
+try:
+    import numpy
+except ImportError:  # pragma: no cover
+    numpy = None
+
+
+# below this many points the Python loops are faster, numpy costs more to
+# set up than it saves on small arrays
+_NUMPY_MIN_POINTS = 32
+
+
+def _position(point):
+    """(x, y), or (x, y, z) if the point has a z."""
+    if len(point) > 2:
+        return (point[0], point[1], point[2])
+    return (point[0], point[1])
+
+
+def _farthest_python(points, first, last):
+    ax, ay = points[first][0], points[first][1]
+    bx, by = points[last][0], points[last][1]
+    has_z = len(points[first]) > 2
+    az = points[first][2] if has_z else 0.0
+    dx = bx - ax
+    dy = by - ay
+    dz = points[last][2] - az if has_z else 0.0
+    length2 = dx * dx + dy * dy + dz * dz
+
+    farthest = first
+    max_distance = -1.0
+    for index in range(first + 1, last):
+        px = points[index][0] - ax
+        py = points[index][1] - ay
+        pz = points[index][2] - az if has_z else 0.0
+        if length2 == 0:
+            distance = math.hypot(px, py, pz)
+        else:
+            t = min(max((px * dx + py * dy + pz * dz) / length2, 0.0), 1.0)
+            distance = math.hypot(px - t * dx, py - t * dy, pz - t * dz)
+        if distance > max_distance:
+            farthest = index
+            max_distance = distance
+    return farthest, max_distance
+
+
+def _farthest_numpy(xy, first, last):
+    a = xy[first]
+    d = xy[last] - a
+    p = xy[first + 1 : last] - a
+    length2 = float(d @ d)
+    if length2 != 0:
+        t = numpy.clip(p @ d / length2, 0.0, 1.0)
+        p = p - t[:, None] * d
+    distances = numpy.hypot(p[:, 0], p[:, 1])
+    if p.shape[1] > 2:
+        distances = numpy.hypot(distances, p[:, 2])
+    index = int(numpy.argmax(distances))
+    return first + 1 + index, float(distances[index])
+
+
+def _coordinates(points):
+    """The points as a numpy array of x, y (and z), None without numpy."""
+    if numpy is None or len(points) < _NUMPY_MIN_POINTS:
+        return None
+    return numpy.asarray(points, dtype=float)[:, :3]
+
+
+def _farthest(points, xyz, first, last):
+    if xyz is not None and last - first >= _NUMPY_MIN_POINTS:
+        return _farthest_numpy(xyz, first, last)
+    return _farthest_python(points, first, last)
+
+
+def simplify_polyline(points, tolerance):
+    """
+    Vereenvoudig een lijn met het Ramer-Douglas-Peucker algoritme.
+
+    Parameters
+    ----------
+    points : list
+        Lijst van (x, y) of (x, y, z) punten.
+    tolerance : float
+        De maximale afwijking van de vereenvoudigde lijn.
+
+    Returns
+    -------
+    list
+        De overgebleven punten. Het eerste en laatste punt blijven
+        altijd behouden.
+    """
+    count = len(points)
+    if count < 3 or tolerance <= 0:
+        return list(points)
+
+    xyz = _coordinates(points)
+    keep = [False] * count
+    keep[0] = keep[-1] = True
+    stack = [(0, count - 1)]
+    while stack:
+        first, last = stack.pop()
+        if last - first < 2:
+            continue
+        index, distance = _farthest(points, xyz, first, last)
+        if distance > tolerance:
+            keep[index] = True
+            stack.append((first, index))
+            stack.append((index, last))
+
+    return [point for point, kept in zip(points, keep) if kept]
+
+
+def _circle(p1, p2, p3):
+    """Center and radius of the circle through three points."""
+    ax, ay = p1[0], p1[1]
+    bx, by = p2[0], p2[1]
+    cx, cy = p3[0], p3[1]
+    d = 2 * (ax * (by - cy) + bx * (cy - ay) + cx * (ay - by))
+    if abs(d) < 1e-12:
+        return None
+
+    a2 = ax * ax + ay * ay
+    b2 = bx * bx + by * by
+    c2 = cx * cx + cy * cy
+    ux = (a2 * (by - cy) + b2 * (cy - ay) + c2 * (ay - by)) / d
+    uy = (a2 * (cx - bx) + b2 * (ax - cx) + c2 * (bx - ax)) / d
+    return ux, uy, math.hypot(ax - ux, ay - uy)
+
+
+def _arc_fits(points, xyz, first, last, center, tolerance, clockwise):
+    """Check that points first..last lie on the arc within tolerance."""
+    ux, uy, radius = center
+    if xyz is not None and last - first >= _NUMPY_MIN_POINTS:
+        p = xyz[first : last + 1]
+        dx = p[:, 0] - ux
+        dy = p[:, 1] - uy
+        if numpy.any(numpy.abs(numpy.hypot(dx, dy) - radius) > tolerance):
+            return False
+
+        # the angle must advance monotonically in the arc direction
+        angles = numpy.arctan2(dy, dx)
+        steps = numpy.mod(numpy.diff(angles), 2 * math.pi)
+        if clockwise:
+            steps = 2 * math.pi - steps
+        if numpy.any(steps > math.pi) or float(steps.sum()) >= 1.9 * math.pi:
+            return False
+
+        # sagitta of each chord, the arc may not bulge away from the points
+        chords = numpy.hypot(numpy.diff(p[:, 0]), numpy.diff(p[:, 1])) / 2
+        sagitta = radius - numpy.sqrt(numpy.maximum(radius**2 - chords**2, 0.0))
+        if numpy.any(sagitta > tolerance):
+            return False
+
+        # an arc is flat, z may not change along it
+        return p.shape[1] < 3 or float(numpy.ptp(p[:, 2])) <= tolerance
+
+    has_z = len(points[first]) > 2
+    if has_z:
+        heights = [points[index][2] for index in range(first, last + 1)]
+        if max(heights) - min(heights) > tolerance:
+            return False
+
+    sweep = 0.0
+    previous = None
+    for index in range(first, last + 1):
+        dx = points[index][0] - ux
+        dy = points[index][1] - uy
+        if abs(math.hypot(dx, dy) - radius) > tolerance:
+            return False
+        angle = math.atan2(dy, dx)
+        if previous is not None:
+            step = (angle - previous) % (2 * math.pi)
+            if clockwise:
+                step = 2 * math.pi - step
+            if step > math.pi:
+                return False
+            sweep += step
+            chord = math.hypot(
+                points[index][0] - points[index - 1][0],
+                points[index][1] - points[index - 1][1],
+            )
+            half = chord / 2
+            if radius - math.sqrt(max(radius**2 - half**2, 0.0)) > tolerance:
+                return False
+        previous = angle
+    return sweep < 1.9 * math.pi
+
+
+def _fit_arc(points, xyz, first, last, tolerance, max_radius):
+    """The center and direction of an arc over first..last, None if none fits."""
+    p1 = points[first]
+    p3 = points[last]
+    p2 = points[(first + last) // 2]
+    center = _circle(p1, p2, p3)
+    if center is None or center[2] > max_radius:
+        return None
+    cross = (p2[0] - p1[0]) * (p3[1] - p2[1]) - (p2[1] - p1[1]) * (p3[0] - p2[0])
+    clockwise = cross < 0
+    if not _arc_fits(points, xyz, first, last, center, tolerance, clockwise):
+        return None
+    return center, clockwise
+
+
+def _longest_arc(points, xyz, first, tolerance, min_points, max_radius):
+    """The last point and fit of the longest arc from first, None if none."""
+    count = len(points)
+    good = first + min_points - 1
+    if good >= count:
+        return None
+    best = _fit_arc(points, xyz, first, good, tolerance, max_radius)
+    if best is None:
+        return None
+
+    # grow in doubling steps, then bisect between the last fit and the first
+    # miss. Each check costs the length of the arc, trying every end point
+    # would make long arcs quadratic.
+    bad = count
+    step = 1
+    while good + step < count:
+        fit = _fit_arc(points, xyz, first, good + step, tolerance, max_radius)
+        if fit is None:
+            bad = good + step
+            break
+        good += step
+        best = fit
+        step *= 2
+    while bad - good > 1:
+        middle = (good + bad) // 2
+        fit = _fit_arc(points, xyz, first, middle, tolerance, max_radius)
+        if fit is None:
+            bad = middle
+        else:
+            good = middle
+            best = fit
+    return good, best
+
+
+def fit_arcs(points, tolerance, min_points=4, max_radius=10000):
+    """
+    Vervang reeksen punten door cirkelbogen.
+
+    Parameters
+    ----------
+    points : list
+        Lijst van (x, y) of (x, y, z) punten. Het eerste punt is de
+        beginpositie. Een boog ligt in het xy vlak, de punten van een
+        boog moeten dus (binnen tolerance) dezelfde z hebben.
+    tolerance : float
+        De maximale afwijking van de boog ten opzichte van de punten.
+    min_points : int
+        Het minimum aantal punten dat een boog moet vervangen.
+    max_radius : float
+        Bogen met een grotere straal worden als rechte lijn gelaten.
+
+    Returns
+    -------
+    list
+        Lijst van segmenten. Een segment is ("line", punt) of
+        ("arc", punt, (i, j), clockwise), waarbij punt het eindpunt
+        (x, y) of (x, y, z) is en i en j de afstand van het beginpunt
+        tot het middelpunt zijn, net als bij UArm.arc.
+    """
+    count = len(points)
+    xyz = _coordinates(points)
+
+    segments = []
+    first = 0
+    while first < count - 1:
+        arc = _longest_arc(points, xyz, first, tolerance, min_points, max_radius)
+
+        if arc is not None:
+            # points that hardly bulge away from the chord form a straight line
+            last = arc[0]
+            if _farthest(points, xyz, first, last)[1] <= tolerance:
+                arc = None
+
+        if arc is None:
+            segments.append(("line", _position(points[first + 1])))
+            first += 1
+        else:
+            last, ((ux, uy, _), clockwise) = arc
+            start = points[first]
+            segments.append(
+                (
+                    "arc",
+                    _position(points[last]),
+                    (ux - start[0], uy - start[1]),
+                    clockwise,
+                )
+            )
+            first = last
+
+    return segments
+
+
+def simplify_path(points, tolerance=0.0, arc_tolerance=None):
+    """
+    Bereid een lijn voor om te versturen.
+
+    Past eerst (optioneel) boogherkenning toe en vereenvoudigt daarna
+    de overgebleven rechte stukken met Ramer-Douglas-Peucker.
+
+    Parameters
+    ----------
+    points : list
+        Lijst van (x, y) of (x, y, z) punten. Het eerste punt is de
+        beginpositie.
+    tolerance : float
+        De maximale afwijking voor het vereenvoudigen van rechte stukken.
+    arc_tolerance : float
+        De maximale afwijking voor bogen. None schakelt boogherkenning uit.
+
+    Returns
+    -------
+    list
+        Lijst van segmenten, zie fit_arcs.
+    """
+    if len(points) < 2:
+        return []
+
+    if arc_tolerance is None:
+        segments = [("line", _position(p)) for p in points[1:]]
+    else:
+        segments = fit_arcs(points, arc_tolerance)
+
+    if tolerance <= 0:
+        return segments
+
+    result = []
+    run = [_position(points[0])]
+    for segment in segments:
+        if segment[0] == "line":
+            run.append(segment[1])
+            continue
+
+        result.extend(("line", p) for p in simplify_polyline(run, tolerance)[1:])
+        result.append(segment)
+        run = [segment[1]]
+
+    result.extend(("line", p) for p in simplify_polyline(run, tolerance)[1:])
+    return result
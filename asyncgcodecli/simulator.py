@@ -0,0 +1,693 @@
+"""Offline job time estimation with a GRBL style motion planner."""
+
+__all__ = ["simulate", "simulate_file", "SimulationResult"]
+
+import itertools
+import math
+import re
+
+try:
+    import numpy
+except ImportError:  # pragma: no cover
+    numpy = None
+
+from asyncgcodecli.driver import GCodeCommand
+
+_WORD = re.compile(r"([A-Z])\s*([-+]?[0-9]*\.?[0-9]+)")
+_COMMENT = re.compile(r"\(.*?\)|;.*")
+
+_MOTION = {"G0": 0, "G1": 1, "G2": 2, "G3": 3}
+_NUMBER = r"[ \t]*([-+]?[0-9]*\.?[0-9]+)[ \t]*"
+# a straight move with nothing else, the bulk of most jobs
+_SIMPLE = (
+    r"[ \t]*(?:G0?([01])(?![0-9.]))?[ \t]*(?:X{0})?(?:Y{0})?(?:Z{0})?(?:F{0})?"
+).format(_NUMBER)
+_SIMPLE_MOVE = re.compile(_SIMPLE + "$")
+# splits a chunk of lines in simple moves and other lines (last group)
+_SIMPLE_LINES = re.compile(r"(?m)^(?:" + _SIMPLE + r"$|(.*))$")
+
+# lines per chunk when parsing with numpy
+_CHUNK = 65536
+# shorter runs of simple moves are not worth the numpy overhead
+_MIN_RUN = 16
+# G01 and G1 are the same code
+_CODES = {
+    letter + prefix + str(number): letter + str(number)
+    for letter in "GM"
+    for number in range(100)
+    for prefix in ("", "0")
+}
+
+# GRBL defaults, used for settings the device did not report
+_DEFAULT_SETTINGS = {
+    "11": 0.010,  # junction deviation (mm)
+    "12": 0.002,  # arc tolerance (mm)
+    "110": 500.0,  # max rate x (mm/min)
+    "111": 500.0,
+    "112": 500.0,
+    "120": 10.0,  # acceleration x (mm/s^2)
+    "121": 10.0,
+    "122": 10.0,
+}
+
+
+def _setting(settings, key):
+    try:
+        return float(settings[key])
+    except (KeyError, TypeError, ValueError):
+        return _DEFAULT_SETTINGS[key]
+
+
+class SimulationResult:
+    """
+    Het resultaat van een simulatie.
+
+    Attributes
+    ----------
+    total_time : float
+        De geschatte tijd in seconden, inclusief wachttijden.
+    motion_time : float
+        De tijd die aan bewegen besteed wordt.
+    dwell_time : float
+        De tijd van G4 opdrachten.
+    length : float
+        De totale afgelegde weg in mm.
+    segment_times : list
+        De tijd per segment (numpy array als numpy beschikbaar is). Bogen
+        worden net als in GRBL in korte rechte segmenten verdeeld.
+    segment_lines : list
+        Per segment de index van de regel waar het uit komt.
+    line_count : int
+        Het aantal verwerkte regels.
+    """
+
+    def __init__(
+        self, segment_times, segment_lines, lengths, dwells, dwell_lines, line_count
+    ):
+        self.segment_times = segment_times
+        self.segment_lines = segment_lines
+        self.dwell_times = dwells
+        self.dwell_lines = dwell_lines
+        self.line_count = line_count
+        total = numpy.sum if numpy is not None else sum
+        self.motion_time = float(total(segment_times))
+        self.dwell_time = float(total(dwells))
+        self.total_time = self.motion_time + self.dwell_time
+        self.length = float(total(lengths))
+
+    def line_times(self):
+        """Geef de geschatte tijd per regel van de invoer."""
+        if numpy is not None:
+            times = numpy.bincount(
+                numpy.asarray(self.segment_lines, dtype=numpy.int64),
+                weights=self.segment_times,
+                minlength=self.line_count,
+            )
+            numpy.add.at(times, self.dwell_lines, self.dwell_times)
+            return times
+
+        times = [0.0] * self.line_count
+        for line, time in zip(self.segment_lines, self.segment_times):
+            times[line] += time
+        for line, time in zip(self.dwell_lines, self.dwell_times):
+            times[line] += time
+        return times
+
+    def __repr__(self):
+        return (
+            "SimulationResult(total_time={:.1f}s, segments={}, length={:.0f}mm)"
+        ).format(self.total_time, len(self.segment_times), self.length)
+
+
+class _Parser:
+    """Zet gcode regels om in rechte segmenten."""
+
+    def __init__(self, settings, default_feed):
+        self.arc_tolerance = _setting(settings, "12")
+        self.default_feed = default_feed
+        self.position = [0.0, 0.0, 0.0]
+        self.absolute = True
+        self.scale = 1.0
+        self.motion = 0
+        self.feed = None
+
+        # one entry per segment, moved to numpy blocks every now and then
+        self.starts = []
+        self.ends = []
+        self.feeds = []
+        self.stops = []
+        self.lines = []
+        self.__blocks = []
+        self.dwells = []
+        self.dwell_lines = []
+        self.__cursor = (0.0, 0.0, 0.0)
+        self.__stop = True
+
+    def __flush(self):
+        if self.starts:
+            self.__blocks.append(
+                (
+                    numpy.array(self.starts, dtype=float),
+                    numpy.array(self.ends, dtype=float),
+                    numpy.array(self.feeds, dtype=float),
+                    numpy.array(self.stops, dtype=bool),
+                    numpy.array(self.lines, dtype=numpy.int64),
+                )
+            )
+            self.starts = []
+            self.ends = []
+            self.feeds = []
+            self.stops = []
+            self.lines = []
+
+    def segments(self):
+        """Geef (starts, ends, feeds, stops, lines), numpy arrays of lijsten."""
+        if numpy is None:
+            return self.starts, self.ends, self.feeds, self.stops, self.lines
+
+        self.__flush()
+        if not self.__blocks:
+            return None
+        return tuple(
+            numpy.concatenate(column) for column in zip(*self.__blocks)
+        )
+
+    def feed_chunk(self, chunk, first_line):
+        """Verwerk veel regels tegelijk, alleen met numpy."""
+        chunk = [line.rstrip("\r\n") for line in chunk]
+        rows = _SIMPLE_LINES.findall("\n".join(chunk).upper())
+        columns = list(zip(*rows))
+        other = [index for index, rest in enumerate(columns[5]) if rest]
+
+        begin = 0
+        for end in other + [len(chunk)]:
+            if end - begin >= _MIN_RUN and (self.motion < 2 or columns[0][begin]):
+                self.__simple_run(
+                    [column[begin:end] for column in columns], first_line + begin
+                )
+            else:
+                for index in range(begin, end):
+                    self.feed_line(chunk[index], first_line + index)
+            if end < len(chunk):
+                self.feed_line(chunk[end], first_line + end)
+            begin = end + 1
+
+    def __simple_run(self, columns, first_line):
+        def column(index):
+            nan = math.nan
+            return numpy.array(
+                [float(value) if value else nan for value in columns[index]]
+            )
+
+        def fill_forward(values, initial):
+            known = ~numpy.isnan(values)
+            last = numpy.where(known, numpy.arange(len(values)), -1)
+            numpy.maximum.accumulate(last, out=last)
+            return numpy.where(last >= 0, values[numpy.maximum(last, 0)], initial)
+
+        scale = self.scale
+        axes = [column(1) * scale, column(2) * scale, column(3) * scale]
+        moves = ~(numpy.isnan(axes[0]) & numpy.isnan(axes[1]) & numpy.isnan(axes[2]))
+        motion = fill_forward(column(0), self.motion)
+        feed = fill_forward(
+            column(4), numpy.nan if self.feed is None else self.feed
+        )
+
+        for index, values in enumerate(axes):
+            if self.absolute:
+                axes[index] = fill_forward(values, self.position[index])
+            else:
+                axes[index] = self.position[index] + numpy.cumsum(
+                    numpy.nan_to_num(values)
+                )
+
+        self.motion = int(motion[-1])
+        if not numpy.isnan(feed[-1]):
+            self.feed = float(feed[-1])
+        self.position = [float(values[-1]) for values in axes]
+
+        ends = numpy.stack(axes, axis=1)[moves]
+        if len(ends) == 0:
+            return
+        starts = numpy.concatenate(([self.__cursor], ends[:-1]))
+        keep = numpy.any(ends != starts, axis=1)
+        if not keep.any():
+            return
+
+        feeds = numpy.where(
+            numpy.isnan(feed), self.default_feed, feed * scale
+        )
+        feeds = numpy.where(motion == 0, numpy.inf, feeds)[moves][keep]
+        stops = numpy.zeros(int(keep.sum()), dtype=bool)
+        stops[0] = self.__stop
+        lines = (first_line + numpy.flatnonzero(moves))[keep]
+
+        self.__flush()
+        self.__blocks.append((starts[keep], ends[keep], feeds, stops, lines))
+        self.__cursor = tuple(float(v) for v in ends[keep][-1])
+        self.__stop = False
+
+    def add_segment(self, end, feed, line):
+        if end == self.__cursor:
+            # GRBL drops blocks without motion
+            return
+        self.starts.append(self.__cursor)
+        self.ends.append(end)
+        self.__cursor = end
+        self.feeds.append(feed)
+        self.stops.append(self.__stop)
+        self.lines.append(line)
+        self.__stop = False
+
+    def add_arc(self, target, words, clockwise, feed, line):
+        x0, y0, z0 = self.position
+        cx = x0 + words.get("I", 0.0) * self.scale
+        cy = y0 + words.get("J", 0.0) * self.scale
+        radius = math.hypot(x0 - cx, y0 - cy)
+        start_angle = math.atan2(y0 - cy, x0 - cx)
+        travel = math.atan2(target[1] - cy, target[0] - cx) - start_angle
+        if clockwise:
+            if travel >= -1e-9:
+                travel -= 2 * math.pi
+        elif travel <= 1e-9:
+            travel += 2 * math.pi
+
+        # same segment count as GRBL's mc_arc
+        tolerance = self.arc_tolerance
+        if radius > tolerance:
+            count = int(
+                abs(0.5 * travel * radius)
+                / math.sqrt(tolerance * (2 * radius - tolerance))
+            )
+        else:
+            count = 0
+        for k in range(1, count):
+            angle = start_angle + travel * k / count
+            self.add_segment(
+                (
+                    cx + radius * math.cos(angle),
+                    cy + radius * math.sin(angle),
+                    z0 + (target[2] - z0) * k / count,
+                ),
+                feed,
+                line,
+            )
+        self.add_segment(tuple(target), feed, line)
+
+    def feed_line(self, gcode, line):
+        # this runs for every line of the job, keep the common case short
+        if ";" in gcode or "(" in gcode:
+            gcode = _COMMENT.sub("", gcode)
+        gcode = gcode.upper()
+
+        m = _SIMPLE_MOVE.match(gcode)
+        if m is not None:
+            motion, x, y, z, feed = m.groups()
+            if motion is not None:
+                self.motion = int(motion)
+            if feed is not None:
+                self.feed = float(feed)
+            if x is None and y is None and z is None:
+                return
+            if self.motion < 2:
+                self.__simple_move(x, y, z, line)
+                return
+
+        words = _WORD.findall(gcode)
+        if not words:
+            if gcode.strip().startswith("$H"):
+                # homing ends at the origin of the machine, time unknown
+                self.position = [0.0, 0.0, 0.0]
+                self.__cursor = (0.0, 0.0, 0.0)
+                self.__stop = True
+            return
+
+        axes = None
+        codes = None
+        for letter, value in words:
+            if letter in "XYZ":
+                if axes is None:
+                    axes = {}
+                axes[letter] = float(value)
+            elif letter == "G" or letter == "M":
+                code = _CODES.get(letter + value)
+                if code is None:
+                    code = letter + str(float(value)).rstrip("0").rstrip(".")
+                motion = _MOTION.get(code)
+                if motion is not None:
+                    self.motion = motion
+                elif codes is None:
+                    codes = [code]
+                else:
+                    codes.append(code)
+            elif letter == "F":
+                self.feed = float(value)
+            elif axes is None:
+                axes = {letter: float(value)}
+            else:
+                axes[letter] = float(value)
+
+        if codes is not None and self.__modal_codes(codes, axes, line):
+            return
+        if axes is None or not ("X" in axes or "Y" in axes or "Z" in axes):
+            return
+
+        scale = self.scale
+        target = list(self.position)
+        for index, axis in enumerate("XYZ"):
+            if axis in axes:
+                value = axes[axis] * scale
+                target[index] = value if self.absolute else target[index] + value
+
+        motion = self.motion
+        if motion == 0:
+            feed = math.inf
+        elif self.feed is not None:
+            feed = self.feed * scale
+        else:
+            feed = self.default_feed
+
+        if motion >= 2:
+            self.add_arc(target, axes, motion == 2, feed, line)
+        else:
+            self.add_segment(tuple(target), feed, line)
+        self.position = target
+
+    def __simple_move(self, x, y, z, line):
+        scale = self.scale
+        position = self.position
+        if self.absolute:
+            if x is not None:
+                position[0] = float(x) * scale
+            if y is not None:
+                position[1] = float(y) * scale
+            if z is not None:
+                position[2] = float(z) * scale
+        else:
+            if x is not None:
+                position[0] += float(x) * scale
+            if y is not None:
+                position[1] += float(y) * scale
+            if z is not None:
+                position[2] += float(z) * scale
+
+        end = (position[0], position[1], position[2])
+        if end == self.__cursor:
+            return
+        if self.motion == 0:
+            feed = math.inf
+        elif self.feed is not None:
+            feed = self.feed * scale
+        else:
+            feed = self.default_feed
+        self.starts.append(self.__cursor)
+        self.ends.append(end)
+        self.feeds.append(feed)
+        self.stops.append(self.__stop)
+        self.lines.append(line)
+        self.__cursor = end
+        self.__stop = False
+
+    def __modal_codes(self, codes, words, line):
+        """Verwerk G- en M-codes anders dan G0-G3, True als de regel klaar is."""
+        dwell = False
+        for code in codes:
+            if code == "G90":
+                self.absolute = True
+            elif code == "G91":
+                self.absolute = False
+            elif code == "G20":
+                self.scale = 25.4
+            elif code == "G21":
+                self.scale = 1.0
+            elif code == "G4":
+                dwell = True
+            elif code[0] == "M":
+                # spindle and coolant changes synchronize the planner
+                self.__stop = True
+
+        words = words or {}
+        if dwell:
+            self.dwells.append(words.get("P", 0.0))
+            self.dwell_lines.append(line)
+            self.__stop = True
+            return True
+
+        if "G92" in codes:
+            # new coordinate offset, the machine does not move
+            for index, axis in enumerate("XYZ"):
+                if axis in words:
+                    self.position[index] = words[axis] * self.scale
+            self.__cursor = tuple(self.position)
+            self.__stop = True
+            return True
+
+        for code in ("G10", "G28", "G30", "G53"):
+            if code in codes:
+                # not a planned move, or the target is not known here
+                self.__stop = True
+                return True
+        return False
+
+
+def _plan_numpy(segments, settings, lookahead):
+    starts, ends, feeds, stops, _ = segments
+    delta = ends - starts
+    lengths = numpy.sqrt((delta * delta).sum(axis=1))
+    unit = delta / lengths[:, None]
+
+    max_rate = numpy.array([_setting(settings, k) for k in ("110", "111", "112")])
+    max_accel = numpy.array([_setting(settings, k) for k in ("120", "121", "122")])
+    max_rate = max_rate / 60.0
+
+    def limit_by_axis(limits, vectors):
+        magnitude = numpy.abs(vectors)
+        with numpy.errstate(divide="ignore"):
+            ratio = numpy.where(magnitude > 1e-12, limits / magnitude, numpy.inf)
+        return ratio.min(axis=1)
+
+    feeds = feeds / 60.0
+    nominal = numpy.minimum(feeds, limit_by_axis(max_rate, unit))
+    accel = limit_by_axis(max_accel, unit)
+    nominal2 = nominal * nominal
+
+    # junction speed, as in GRBL's planner_buffer_line
+    junction_deviation = _setting(settings, "11")
+    prev_unit = numpy.empty_like(unit)
+    prev_unit[0] = 0.0
+    prev_unit[1:] = unit[:-1]
+    cos_theta = -(prev_unit * unit).sum(axis=1)
+    junction_vec = unit - prev_unit
+    norm = numpy.sqrt((junction_vec * junction_vec).sum(axis=1))
+    junction_vec /= numpy.where(norm > 0, norm, 1.0)[:, None]
+    junction_accel = limit_by_axis(max_accel, junction_vec)
+    sin_theta_d2 = numpy.sqrt(numpy.clip(0.5 * (1.0 - cos_theta), 0.0, 1.0))
+    with numpy.errstate(divide="ignore", invalid="ignore"):
+        junction2 = (
+            junction_accel * junction_deviation * sin_theta_d2 / (1.0 - sin_theta_d2)
+        )
+    junction2 = numpy.where(cos_theta > 0.999999, 0.0, junction2)
+    junction2 = numpy.where(cos_theta < -0.999999, numpy.inf, junction2)
+    entry2 = numpy.minimum(junction2, nominal2)
+    entry2[1:] = numpy.minimum(entry2[1:], nominal2[:-1])
+    entry2[stops] = 0.0
+
+    reach = 2.0 * accel * lengths
+    cumulative = numpy.concatenate(([0.0], numpy.cumsum(reach)))
+
+    # the planner can only look ahead so many blocks, it must be able to
+    # stop at the end of the last one it knows
+    if lookahead is not None:
+        last = numpy.minimum(numpy.arange(len(reach)) + lookahead, len(reach))
+        entry2 = numpy.minimum(entry2, cumulative[last] - cumulative[:-1])
+
+    # backward pass: entry[i] <= entry[i + 1] + reach[i], exit of the last is 0
+    # solved for all blocks at once as a cumulative minimum
+    bound = numpy.append(entry2, 0.0) + cumulative
+    backward = numpy.minimum.accumulate(bound[::-1])[::-1] - cumulative
+    entry2 = numpy.minimum(entry2, backward[:-1])
+
+    # forward pass: entry[i + 1] <= entry[i] + reach[i]
+    forward = numpy.minimum.accumulate(entry2 - cumulative[:-1]) + cumulative[:-1]
+    entry2 = numpy.maximum(numpy.minimum(entry2, forward), 0.0)
+    exit2 = numpy.append(entry2[1:], 0.0)
+
+    # trapezoid (or triangle) per block
+    v0 = numpy.sqrt(entry2)
+    v1 = numpy.sqrt(exit2)
+    with numpy.errstate(divide="ignore", invalid="ignore"):
+        accelerate = (nominal2 - entry2) / (2 * accel)
+        decelerate = (nominal2 - exit2) / (2 * accel)
+        cruise = lengths - accelerate - decelerate
+        trapezoid = (
+            (nominal - v0) / accel + (nominal - v1) / accel + cruise / nominal
+        )
+        peak = numpy.sqrt(
+            numpy.maximum((reach + entry2 + exit2) / 2.0, numpy.maximum(entry2, exit2))
+        )
+        triangle = (peak - v0) / accel + (peak - v1) / accel
+    times = numpy.where(cruise >= 0, trapezoid, triangle)
+    return times, lengths
+
+
+def _plan_python(segments, settings, lookahead):
+    max_rate = [_setting(settings, k) / 60.0 for k in ("110", "111", "112")]
+    max_accel = [_setting(settings, k) for k in ("120", "121", "122")]
+    junction_deviation = _setting(settings, "11")
+
+    def limit_by_axis(limits, vector):
+        return min(
+            (limit / abs(v) for limit, v in zip(limits, vector) if abs(v) > 1e-12),
+            default=math.inf,
+        )
+
+    starts, ends, feeds, stops, _ = segments
+    count = len(ends)
+    lengths = [0.0] * count
+    nominal = [0.0] * count
+    accel = [0.0] * count
+    entry2 = [0.0] * count
+    prev_unit = (0.0, 0.0, 0.0)
+    prev_nominal2 = 0.0
+    for i, (start, end) in enumerate(zip(starts, ends)):
+        delta = [e - p for e, p in zip(end, start)]
+        length = math.sqrt(sum(d * d for d in delta))
+        unit = [d / length for d in delta]
+        lengths[i] = length
+        nominal[i] = min(feeds[i] / 60.0, limit_by_axis(max_rate, unit))
+        accel[i] = limit_by_axis(max_accel, unit)
+        nominal2 = nominal[i] ** 2
+
+        cos_theta = -sum(a * b for a, b in zip(prev_unit, unit))
+        if stops[i] or cos_theta > 0.999999:
+            junction2 = 0.0
+        elif cos_theta < -0.999999:
+            junction2 = math.inf
+        else:
+            vector = [a - b for a, b in zip(unit, prev_unit)]
+            norm = math.sqrt(sum(v * v for v in vector))
+            vector = [v / norm for v in vector]
+            sin_theta_d2 = math.sqrt(0.5 * (1.0 - cos_theta))
+            junction2 = (
+                limit_by_axis(max_accel, vector)
+                * junction_deviation
+                * sin_theta_d2
+                / (1.0 - sin_theta_d2)
+            )
+        entry2[i] = min(junction2, nominal2, prev_nominal2)
+        prev_unit = unit
+        prev_nominal2 = nominal2
+
+    reach = [2.0 * a * length for a, length in zip(accel, lengths)]
+    if lookahead is not None:
+        window = 0.0
+        for i in range(count - 1, -1, -1):
+            window += reach[i]
+            if i + lookahead < count:
+                window -= reach[i + lookahead]
+            entry2[i] = min(entry2[i], window)
+
+    next_entry2 = 0.0
+    for i in range(count - 1, -1, -1):
+        entry2[i] = min(entry2[i], next_entry2 + reach[i])
+        next_entry2 = entry2[i]
+    for i in range(1, count):
+        entry2[i] = min(entry2[i], entry2[i - 1] + reach[i - 1])
+
+    times = [0.0] * count
+    for i in range(count):
+        a = accel[i]
+        exit2 = entry2[i + 1] if i + 1 < count else 0.0
+        v0 = math.sqrt(entry2[i])
+        v1 = math.sqrt(exit2)
+        vn = nominal[i]
+        cruise = lengths[i] - (2 * vn * vn - entry2[i] - exit2) / (2 * a)
+        if cruise >= 0:
+            times[i] = (vn - v0) / a + (vn - v1) / a + cruise / vn
+        else:
+            peak2 = (reach[i] + entry2[i] + exit2) / 2.0
+            peak = math.sqrt(max(peak2, entry2[i], exit2))
+            times[i] = (peak - v0) / a + (peak - v1) / a
+    return times, lengths
+
+
+def _as_text(command):
+    if isinstance(command, str):
+        return command
+    if isinstance(command, GCodeCommand):
+        command = command.command()
+    return command.decode("utf-8", "replace")
+
+
+def simulate(commands, settings=None, lookahead=15, default_feed=None):
+    """
+    Schat hoe lang een reeks opdrachten duurt.
+
+    Rekent net als GRBL met trapeziumvormige snelheidsprofielen, de
+    maximale snelheid en versnelling per as ($110-$112, $120-$122), de
+    junction deviation ($11) en de boogtolerantie ($12). Wachttijden (G4)
+    tellen mee. Met numpy worden miljoenen segmenten in enkele seconden
+    doorgerekend.
+
+    Parameters
+    ----------
+    commands : iterable
+        Gcode regels (str of bytes) of GCodeCommand objecten.
+    settings : dict
+        De instellingen van het apparaat, bijvoorbeeld device.settings.
+        Ontbrekende instellingen krijgen de standaardwaarde van GRBL.
+    lookahead : int
+        Het aantal blokken in de planner van het apparaat, None voor
+        onbeperkt.
+    default_feed : float
+        Snelheid (mm/min) voor G1 zonder eerdere F. Standaard de
+        maximale snelheid.
+
+    Returns
+    -------
+    SimulationResult
+        De geschatte tijd in totaal, per segment en per regel.
+
+    Example
+    -------
+
+    Schat de duur van een tekening::
+
+        result = simulate(open("drawing.gcode"), plotter.settings)
+        print("{:.0f} minuten".format(result.total_time / 60))
+    """
+    settings = settings or {}
+    parser = _Parser(settings, default_feed or math.inf)
+    line_count = 0
+    if numpy is not None:
+        commands = iter(commands)
+        while True:
+            chunk = [_as_text(c) for c in itertools.islice(commands, _CHUNK)]
+            if not chunk:
+                break
+            parser.feed_chunk(chunk, line_count)
+            line_count += len(chunk)
+    else:
+        for command in commands:
+            parser.feed_line(_as_text(command), line_count)
+            line_count += 1
+
+    segments = parser.segments()
+    if segments is None or len(segments[0]) == 0:
+        return SimulationResult(
+            [], [], [], parser.dwells, parser.dwell_lines, line_count
+        )
+
+    if numpy is not None:
+        times, lengths = _plan_numpy(segments, settings, lookahead)
+    else:
+        times, lengths = _plan_python(segments, settings, lookahead)
+    return SimulationResult(
+        times, segments[4], lengths, parser.dwells, parser.dwell_lines, line_count
+    )
+
+
+def simulate_file(path, settings=None, **kw):
+    """Schat de duur van een gcode bestand, zie simulate."""
+    with open(path, "r", encoding="utf-8", errors="replace") as f:
+        return simulate(f, settings, **kw)
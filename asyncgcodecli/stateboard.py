@@ -0,0 +1,265 @@
+"""Live device state in shared memory for monitoring processes."""
+
+__all__ = ["StateBoard", "StateBoardReader"]
+
+import asyncio
+import math
+import struct
+import time
+from multiprocessing import shared_memory
+import asyncgcodecli.logger as logger
+
+# magic, version, record size, number of records
+_HEADER = struct.Struct("<4sHHI52x")
+_MAGIC = b"AGSB"
+_VERSION = 1
+
+# sequence, flags, time, x, y, z, pending commands, status, port
+_RECORD = struct.Struct("<IIddddI4x16s48s16x")
+_SEQUENCE = struct.Struct("<I")
+
+FLAG_READY = 1
+FLAG_PAUSED = 2
+FLAG_POSITION = 4
+
+
+def _text(value, size):
+    # an unknown value stays empty
+    if value is None:
+        return b""
+    return str(value).encode("utf-8", "replace")[:size]
+
+
+def _open(name):
+    try:
+        # python 3.13+, the reader must not remove the block when it exits
+        return shared_memory.SharedMemory(name, track=False)
+    except TypeError:
+        pass
+    memory = shared_memory.SharedMemory(name)
+    try:
+        from multiprocessing import resource_tracker
+
+        resource_tracker.unregister(memory._name, "shared_memory")
+    except Exception:  # pragma: no cover
+        pass
+    return memory
+
+
+class StateBoard:
+    """
+    Publiceert de toestand van devices in gedeeld geheugen.
+
+    Elk device heeft een record met een vaste indeling, zodat andere
+    processen (een HMI, beeldverwerking) de toestand zo vaak als ze
+    willen kunnen lezen, zonder de driver te vragen. Een record wordt
+    met een volgnummer beschermd (seqlock): het nummer is oneven
+    tijdens het schrijven en wordt na het schrijven weer even. Een
+    lezer die voor en na het lezen hetzelfde even nummer ziet, heeft
+    een consistent record.
+
+    Indeling, little endian. Een header van 64 bytes: magic "AGSB",
+    versie (uint16), recordgrootte (uint16) en aantal records (uint32).
+    Daarna per device een record van 128 bytes: volgnummer (uint32),
+    flags (uint32, 1 ready, 2 gepauzeerd, 4 positie bekend), tijd
+    (double, time.time()), x, y, z (double), onverwerkte opdrachten
+    (uint32), 4 bytes opvulling, status (16 bytes) en port (48 bytes).
+    Een onbekende status of port is leeg.
+
+    Parameters
+    ----------
+    devices : list
+        De devices.
+    name : string
+        De naam van het gedeelde geheugen, None voor een unieke naam.
+    interval : float
+        Hoe vaak de toestand geschreven wordt, in seconden.
+    poll_status : float
+        Als opgegeven, vraag zo vaak (in seconden) de status en positie
+        op bij devices die dat kunnen (GRBL "?").
+
+    Example
+    -------
+
+    Publiceer de toestand van twee plotters::
+
+        async def script(plotters):
+            with StateBoard(plotters, name="plotters", poll_status=0.1):
+                ...
+
+    En lees hem in een ander proces::
+
+        board = StateBoardReader("plotters")
+        state = board.find("/dev/ttyUSB0")
+    """
+
+    def __init__(self, devices, name=None, interval=0.05, poll_status=None):
+        self.devices = list(devices)
+        self.interval = interval
+        self.poll_status = poll_status
+        size = _HEADER.size + _RECORD.size * len(self.devices)
+        self.memory = shared_memory.SharedMemory(name=name, create=True, size=size)
+        self.__sequences = [0] * len(self.devices)
+        self.__task = None
+        _HEADER.pack_into(
+            self.memory.buf, 0, _MAGIC, _VERSION, _RECORD.size, len(self.devices)
+        )
+        self.publish()
+        try:
+            self.start()
+        except RuntimeError:
+            # no running loop, publish or start are called later
+            pass
+
+    @property
+    def name(self):
+        """De naam waarmee een StateBoardReader het geheugen opent."""
+        return self.memory.name
+
+    def publish(self):
+        """Schrijf de toestand van alle devices nu."""
+        buf = self.memory.buf
+        now = time.time()
+        for index, device in enumerate(self.devices):
+            offset = _HEADER.size + index * _RECORD.size
+            flags = 0
+            if device.is_ready:
+                flags |= FLAG_READY
+            if device.paused:
+                flags |= FLAG_PAUSED
+            position = device.position
+            if position is not None:
+                flags |= FLAG_POSITION
+                x, y, z = (tuple(position) + (math.nan,) * 3)[:3]
+            else:
+                x = y = z = math.nan
+
+            sequence = self.__sequences[index] + 1
+            _SEQUENCE.pack_into(buf, offset, sequence)
+            _RECORD.pack_into(
+                buf,
+                offset,
+                sequence,
+                flags,
+                now,
+                x,
+                y,
+                z,
+                device.pending_commands,
+                _text(device.status, 16),
+                _text(device.port, 48),
+            )
+            sequence += 1
+            _SEQUENCE.pack_into(buf, offset, sequence)
+            self.__sequences[index] = sequence
+
+    async def run(self):
+        """Schrijf de toestand steeds opnieuw, tot close."""
+        next_poll = 0.0
+        while True:
+            if self.poll_status is not None and time.monotonic() >= next_poll:
+                next_poll = time.monotonic() + self.poll_status
+                for device in self.devices:
+                    device.query_status()
+            self.publish()
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        """Start run als taak in de event loop."""
+        if self.__task is None:
+            self.__task = asyncio.get_running_loop().create_task(self.run())
+
+    def close(self):
+        """Stop met publiceren en verwijder het gedeelde geheugen."""
+        if self.__task is not None:
+            self.__task.cancel()
+            self.__task = None
+        if self.memory is not None:
+            self.memory.close()
+            self.memory.unlink()
+            self.memory = None
+            logger.log(logger.DEBUG, "State board closed")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class StateBoardReader:
+    """
+    Leest een StateBoard, ook vanuit een ander proces.
+
+    Parameters
+    ----------
+    name : string
+        De naam van het StateBoard.
+    """
+
+    def __init__(self, name):
+        self.memory = _open(name)
+        magic, version, record_size, count = _HEADER.unpack_from(self.memory.buf)
+        if magic != _MAGIC or version != _VERSION or record_size != _RECORD.size:
+            self.memory.close()
+            raise ValueError("{} is not a state board".format(name))
+        self.count = count
+
+    def __len__(self):
+        return self.count
+
+    def read(self, index, retries=1000):
+        """
+        Lees het record van een device.
+
+        Returns
+        -------
+        dict
+            Met "port", "status", "ready", "paused", "position", "pending"
+            en "time". Port, status en position zijn None als ze onbekend
+            zijn. None als er na retries pogingen geen consistent record
+            gelezen kon worden.
+        """
+        buf = self.memory.buf
+        offset = _HEADER.size + index * _RECORD.size
+        for _ in range(retries):
+            data = bytes(buf[offset : offset + _RECORD.size])
+            sequence = _SEQUENCE.unpack_from(data)[0]
+            if sequence & 1 or sequence != _SEQUENCE.unpack_from(buf, offset)[0]:
+                # being written, try again
+                continue
+            _, flags, stamp, x, y, z, pending, status, port = _RECORD.unpack(data)
+            return {
+                "port": port.rstrip(b"\0").decode("utf-8", "replace") or None,
+                "status": status.rstrip(b"\0").decode("utf-8", "replace") or None,
+                "ready": bool(flags & FLAG_READY),
+                "paused": bool(flags & FLAG_PAUSED),
+                "position": (x, y, z) if flags & FLAG_POSITION else None,
+                "pending": pending,
+                "time": stamp,
+            }
+        return None
+
+    def read_all(self):
+        """Lees de records van alle devices."""
+        return [self.read(index) for index in range(self.count)]
+
+    def find(self, port):
+        """Lees het record van het device op een port, None als onbekend."""
+        for index in range(self.count):
+            state = self.read(index)
+            if state is not None and state["port"] == port:
+                return state
+        return None
+
+    def close(self):
+        """Sluit het gedeelde geheugen, het StateBoard blijft bestaan."""
+        if self.memory is not None:
+            self.memory.close()
+            self.memory = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,269 @@
+"""Network attached devices over TCP or telnet."""
+
+__all__ = ["TcpConnector"]
+
+import asyncio
+import re
+import socket
+import traceback
+from urllib.parse import urlsplit
+import asyncgcodecli.logger as logger
+from asyncgcodecli.driver import GCodeDeviceConnectEvent, ResponseReveivedEvent
+
+_LINE_END = re.compile(rb"[\r\n]")
+
+# telnet protocol bytes
+_IAC = 255
+_DONT = 254
+_DO = 253
+_WONT = 252
+_WILL = 251
+_SB = 250
+_SE = 240
+
+
+class _TelnetFilter:
+    """Haalt telnet opdrachten uit de ontvangen data en weigert alle opties."""
+
+    def __init__(self):
+        self.__state = None
+        self.__option_command = None
+
+    def feed(self, data):
+        """Geeft (data, antwoord) terug."""
+        result = bytearray()
+        reply = bytearray()
+        for byte in data:
+            state = self.__state
+            if state is None:
+                if byte == _IAC:
+                    self.__state = "iac"
+                else:
+                    result.append(byte)
+            elif state == "iac":
+                if byte == _IAC:
+                    result.append(_IAC)
+                    self.__state = None
+                elif byte in (_DO, _DONT, _WILL, _WONT):
+                    self.__option_command = byte
+                    self.__state = "option"
+                elif byte == _SB:
+                    self.__state = "sb"
+                else:
+                    self.__state = None
+            elif state == "option":
+                if self.__option_command == _DO:
+                    reply += bytes([_IAC, _WONT, byte])
+                elif self.__option_command == _WILL:
+                    reply += bytes([_IAC, _DONT, byte])
+                self.__state = None
+            elif state == "sb":
+                if byte == _IAC:
+                    self.__state = "sb-iac"
+            elif state == "sb-iac":
+                self.__state = None if byte == _SE else "sb"
+        return bytes(result), bytes(reply)
+
+
+class TcpPort:
+    """
+    Een verbinding met een apparaat via TCP.
+
+    Heeft dezelfde interface als SerialReceiveThread, maar draait geheel
+    in de event loop.
+    """
+
+    def __init__(self, connector, port, loop):
+        url = urlsplit(port)
+        if url.hostname is None or url.port is None:
+            raise ValueError('Expected "tcp://host:port", got "{}"'.format(port))
+
+        self.event_queue = asyncio.Queue()
+        self.port = port
+        self.stop = False
+        self.host = url.hostname
+        self.tcp_port = url.port
+        self._connector = connector
+        self._loop = loop
+        self.__telnet = url.scheme == "telnet"
+        self.__writer = None
+        self.__task = None
+
+    def start(self):
+        self.__task = self._loop.create_task(self.__run())
+
+    def close(self):
+        self.stop = True
+        if self.__writer is not None:
+            self.__writer.close()
+        if self.__task is not None:
+            self.__task.cancel()
+
+    def write(self, gcode):
+        if self.__writer is None or self.__writer.is_closing():
+            logger.log(
+                logger.WARNING, "Not connected to {}, dropped: {}", (self.port, gcode)
+            )
+            return
+        if self.__telnet:
+            gcode = gcode.replace(b"\xff", b"\xff\xff")
+        self.__writer.write(gcode)
+        logger.log(logger.TRACE, "transmitted: {}", gcode.decode("utf-8", "replace"))
+
+    def _post_event(self, event):
+        if isinstance(event, ResponseReveivedEvent):
+            logger.log(logger.TRACE, "received: {}", event.response)
+        self.event_queue.put_nowait(event)
+
+    async def __connect(self):
+        connector = self._connector
+        for attempt in range(connector.connect_attempts):
+            if self.stop:
+                return None, None
+            if attempt > 0:
+                logger.log(
+                    logger.INFO, "Connecting to {} retry {}", (self.port, attempt)
+                )
+            try:
+                reader, writer = await asyncio.wait_for(
+                    asyncio.open_connection(self.host, self.tcp_port),
+                    connector.connect_timeout,
+                )
+            except (OSError, asyncio.TimeoutError):
+                await asyncio.sleep(connector.connect_interval)
+                continue
+
+            connector._configure_socket(writer.get_extra_info("socket"))
+            return reader, writer
+        return None, None
+
+    async def __receive(self, reader):
+        buffer = bytearray()
+        telnet = _TelnetFilter() if self.__telnet else None
+        while not self.stop:
+            data = await reader.read(4096)
+            if not data:
+                return
+            if telnet is not None:
+                data, reply = telnet.feed(data)
+                if reply:
+                    self.__writer.write(reply)
+
+            buffer += data
+            lines = _LINE_END.split(buffer)
+            buffer = bytearray(lines.pop())
+            for line in lines:
+                if line:
+                    self._post_event(
+                        ResponseReveivedEvent(line.decode("utf-8", "replace"))
+                    )
+
+    async def __run(self):
+        logger.log(logger.INFO, "Connecting to {} ", (self.port))
+        while not self.stop:
+            reader, writer = await self.__connect()
+            if writer is None:
+                if not self.stop:
+                    self._post_event(GCodeDeviceConnectEvent(False))
+                    logger.log(logger.INFO, "Timeout.")
+                    logger.log(
+                        logger.FATAL,
+                        'Could not connect to device "{}". Timeout occured.',
+                        (self.port),
+                    )
+                return
+
+            self.__writer = writer
+            self._post_event(GCodeDeviceConnectEvent(True))
+            logger.log(logger.INFO, "Connected.")
+
+            try:
+                await self.__receive(reader)
+            except (OSError, asyncio.IncompleteReadError):
+                logger.log(logger.ERROR, "Connection lost! {}", traceback.format_exc())
+            finally:
+                writer.close()
+                self.__writer = None
+
+            if self.stop:
+                break
+            # commands in flight are lost, the driver fails them
+            self._post_event(GCodeDeviceConnectEvent(False))
+            if not self._connector.reconnect:
+                break
+            logger.log(logger.WARNING, "Connection to {} lost, reconnecting", self.port)
+
+        logger.log(logger.TRACE, "TcpPort for {} stopped", self.port)
+
+
+class TcpConnector:
+    """
+    Maakt verbindingen met apparaten via TCP of telnet.
+
+    Een driver met een port als "tcp://host:poort" of "telnet://host:poort"
+    gebruikt automatisch een TcpConnector met de standaard instellingen.
+    Voor andere instellingen kan een eigen TcpConnector als transport aan
+    de driver gegeven worden.
+
+    Parameters
+    ----------
+    connect_timeout : float
+        Hoe lang een verbindingspoging mag duren.
+    connect_attempts : int
+        Hoe vaak er geprobeerd wordt te verbinden.
+    connect_interval : float
+        Wachttijd tussen twee pogingen.
+    reconnect : bool
+        Opnieuw verbinden als de verbinding wegvalt.
+    keepalive : float
+        Als opgegeven worden TCP keepalives gestuurd na zoveel seconden
+        stilte, zodat een weggevallen verbinding opgemerkt wordt.
+
+    Example
+    -------
+
+    Twee grblHAL borden op het netwerk::
+
+        connector = TcpConnector(connect_timeout=2)
+        GenericDriver.execute_on_devices(
+            [
+                Plotter("tcp://192.168.1.20:23", transport=connector),
+                Plotter("tcp://192.168.1.21:23", transport=connector),
+            ],
+            draw_script,
+        )
+    """
+
+    def __init__(
+        self,
+        connect_timeout=5.0,
+        connect_attempts=5,
+        connect_interval=1.0,
+        reconnect=True,
+        keepalive=10.0,
+    ):
+        self.connect_timeout = connect_timeout
+        self.connect_attempts = connect_attempts
+        self.connect_interval = connect_interval
+        self.reconnect = reconnect
+        self.keepalive = keepalive
+
+    def open_port(self, port, loop, link=None, probe=None):
+        """Maak een verbinding aan, link en probe gelden alleen voor serieel."""
+        return TcpPort(self, port, loop)
+
+    def _configure_socket(self, sock):
+        if sock is None:
+            return
+        # every command is a small packet that is waited for
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        if self.keepalive is not None:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+            idle = max(int(self.keepalive), 1)
+            for option, value in (
+                ("TCP_KEEPIDLE", idle),
+                ("TCP_KEEPINTVL", idle),
+                ("TCP_KEEPCNT", 3),
+            ):
+                if hasattr(socket, option):
+                    sock.setsockopt(socket.IPPROTO_TCP, getattr(socket, option), value)
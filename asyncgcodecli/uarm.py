@@ -2,17 +2,33 @@
 
 __all__ = ["UArm"]
 
-import asyncio
+import re
 from asyncgcodecli.driver import (
     GenericDriver,
     GCodeGenericCommand,
 )
+from asyncgcodecli.flowcontrol import WindowedFlowControl
+
+
+_SEQUENCED_RESPONSE = re.compile(r"\$([0-9]+) (ok|E([0-9]+))(.*)")
 
 
 class UArm(GenericDriver):
     """Stelt een UArm voor."""
 
-    def __init__(self, port, *args, **kw):
+    sync_gcode = b"G2004 P0"
+    banner = re.compile(r"@1")
+    greeting = "@1"
+    # the UArm only greets after a reset through the DTR line
+    probe_wakeup = None
+    # no real-time commands, pause and abort only stop sending
+    feed_hold = None
+    cycle_start = None
+    soft_reset = None
+    status_query = None
+    jog_cancel_code = None
+
+    def __init__(self, port, *args, pipeline_window=None, **kw):
         """
         Maak een nieuw UArm object.
 
@@ -20,18 +36,90 @@ class UArm(GenericDriver):
         ----------
         port : string
             De naam van de usb port.
+        pipeline_window : int
+            Als dit opgegeven is, dan krijgt elke opdracht een volgnummer
+            (#n) en worden er maximaal zoveel opdrachten verstuurd
+            voordat het antwoord ($n ok) binnen is. Als None, dan wordt
+            er op het antwoord van elke opdracht gewacht.
         """
+        if pipeline_window is not None and "flow_control" not in kw:
+            kw["flow_control"] = WindowedFlowControl(
+                pipeline_window, buffer_size=128, adaptive=False
+            )
         super().__init__(port, *args, **kw)
+        self.pipeline_window = pipeline_window
         self.limit_switch_on = False
+        self.__next_sequence = 1
+        self.__sequenced = {}
+
+    def _process_server_reset(self):
+        super()._process_server_reset()
+        self.__sequenced = {}
+
+    def __forget_unsent(self):
+        # a command gets its number when it is encoded, which can be before
+        # the window has room for it. Commands that leave the queue without
+        # being sent are never answered.
+        self.__sequenced = {
+            sequence: command
+            for sequence, command in self.__sequenced.items()
+            if command.send and not command.confirmed
+        }
+
+    def _withdraw(self, command):
+        withdrawn = super()._withdraw(command)
+        if withdrawn:
+            self.__forget_unsent()
+        return withdrawn
+
+    def abort(self, exception=None):
+        super().abort(exception)
+        # sent commands stay, their answer still confirms them
+        self.__forget_unsent()
+
+    def _encode_command(self, command):
+        if (
+            self.pipeline_window is not None
+            and command.wire is None
+            and command.expect_ok
+        ):
+            wire = super()._encode_command(command)
+            sequence = self.__next_sequence
+            self.__next_sequence = sequence % 99999 + 1
+            self.__sequenced[sequence] = command
+            command.wire = b"#%d " % sequence + wire
+        return super()._encode_command(command)
+
+    def _process_sequenced_response(self, response):
+        m = _SEQUENCED_RESPONSE.match(response)
+        if m is None:
+            return False
+
+        command = self.__sequenced.pop(int(m[1]), None)
+        if command is None:
+            return True
+
+        if m[2] == "ok":
+            result = {"result": "ok", "error_code": 0}
+        else:
+            result = {"result": "error", "error_code": m[3]}
+        if m[4]:
+            result["response"] = m[4].strip()
+
+        self._confirm_command(result, command)
+        return True
 
     def _process_status(self, status):
         components = status.split(",")
-        self.__status = components[0]
+        self.setStatus(components[0])
 
     def _queue_get_status(self):
-        self.queue_command(GCodeGenericCommand("?", expect_ok=False))
+        self._enqueue_command(GCodeGenericCommand("?", expect_ok=False))
 
     def _process_response(self, response):
+        if self._process_sequenced_response(response):
+            return
+
         super()._process_response(response)
 
         if response == "@6 N0 V1":
@@ -40,17 +128,6 @@ class UArm(GenericDriver):
         if response == "@6 N0 V0":
             self.limit_switch_on = False
 
-        if response == "@1":
-            settings_command = GCodeGenericCommand("$$")
-            self.queue_command(settings_command)
-
-            async def wait_for_settings(settings_command):
-                await settings_command.gcode_result
-
-                self._ready_future.set_result(True)
-
-            asyncio.create_task(wait_for_settings(settings_command))
-
     def set_wrist(self, angle: float):
         """
         Draai de pompeenheid.
@@ -94,6 +171,41 @@ class UArm(GenericDriver):
         """
         return self.queue_command(GCodeGenericCommand("M2400 S{}".format(mode)))
 
+    async def engrave(self, image, z=0, **kw):
+        """
+        Graveer een afbeelding met de laser.
+
+        Zet de robotarm in laser mode en brandt de afbeelding regel voor
+        regel, zie asyncgcodecli.raster.raster_gcode voor de opties. De
+        laser van de UArm kan alleen aan of uit, hij wordt voor elk stuk
+        dat brandt aangezet en daarna weer uit.
+
+        Parameters
+        ----------
+        image : numpy.ndarray
+            De afbeelding in grijswaarden.
+        z : float
+            De hoogte van de laser.
+
+        Returns
+        -------
+        dict
+            Het resultaat van het graveren.
+        """
+        from asyncgcodecli.raster import engrave
+
+        self.set_mode(1)
+        # M2233 only switches the laser, it must be off while travelling
+        return await engrave(
+            self,
+            image,
+            laser_on=None,
+            laser_off=b"M2233 V0",
+            laser_switch=(b"M2233 V1", b"M2233 V0"),
+            z=z,
+            **kw
+        )
+
     def set_pump(self, on: bool):
         """
         Zet de pomp aan of uit.
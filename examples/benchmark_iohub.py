@@ -0,0 +1,92 @@
+"""Schaalbaarheid van SerialIOHub vergeleken met een thread per poort.
+
+Gebruikt pseudo-terminals (pty) in plaats van echte apparaten, dus dit
+werkt alleen op Linux en macOS.
+"""
+
+import asyncio
+import os
+import sys
+import time
+
+from asyncgcodecli.driver import SerialReceiveThread
+from asyncgcodecli.iohub import SerialIOHub
+import asyncgcodecli.logger as logger
+
+
+LINES_PER_PORT = 2000
+IDLE_TIME = 2.0
+
+
+async def wait_connected(ports):
+    for port in ports:
+        await port.event_queue.get()
+
+
+async def run(count, use_hub):
+    loop = asyncio.get_running_loop()
+    hub = SerialIOHub() if use_hub else None
+
+    masters = []
+    ports = []
+    for _ in range(count):
+        master, slave = os.openpty()
+        masters.append(master)
+        name = os.ttyname(slave)
+        if use_hub:
+            port = hub.open_port(name, loop)
+        else:
+            port = SerialReceiveThread(name, loop)
+        port.start()
+        ports.append(port)
+
+    await wait_connected(ports)
+
+    # idle: nothing is received, measure the cpu that is burned anyway
+    cpu = time.process_time()
+    await asyncio.sleep(IDLE_TIME)
+    idle_cpu = (time.process_time() - cpu) / IDLE_TIME
+
+    # throughput: every port receives LINES_PER_PORT "ok" lines
+    start = time.perf_counter()
+    cpu = time.process_time()
+    for master in masters:
+        os.write(master, b"ok\r\n" * LINES_PER_PORT)
+
+    for port in ports:
+        for _ in range(LINES_PER_PORT):
+            await port.event_queue.get()
+
+    elapsed = time.perf_counter() - start
+    busy_cpu = time.process_time() - cpu
+
+    for port in ports:
+        port.close()
+    await asyncio.sleep(0.1)
+    for master in masters:
+        os.close(master)
+
+    return idle_cpu, count * LINES_PER_PORT / elapsed, busy_cpu
+
+
+def main():
+    logger.set_log_level(logger.ERROR)
+    counts = [int(arg) for arg in sys.argv[1:]] or [1, 10, 40]
+
+    print("ports  mode    idle cpu  lines/s   cpu/line (us)")
+    for count in counts:
+        for use_hub in (False, True):
+            idle_cpu, rate, busy_cpu = asyncio.run(run(count, use_hub))
+            print(
+                "{:5}  {:6}  {:7.1%}  {:8.0f}  {:8.1f}".format(
+                    count,
+                    "hub" if use_hub else "thread",
+                    idle_cpu,
+                    rate,
+                    busy_cpu / (count * LINES_PER_PORT) * 1e6,
+                )
+            )
+
+
+if __name__ == "__main__":
+    main()
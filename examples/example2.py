@@ -11,27 +11,24 @@ async def move_script(uarms: UArm):
         uarm.set_mode(0)
 
     for _ in range(1, 5):
-        for uarm in uarms:
-            await uarm.sleep(0)
+        # both arms start each step at the same time
+        GenericDriver.synchronize(uarms)
 
         uarms[0].move_linear(150, -200, 150, 200)
         uarms[1].move_linear(150, 200, 150, 200)
 
-        for uarm in uarms:
-            await uarm.sleep(0)
+        GenericDriver.synchronize(uarms)
 
         uarms[0].move_linear(150, 0, 150, 200)
         uarms[1].move_linear(150, 0, 150, 200)
 
-    for uarm in uarms:
-        await uarm.sleep(0)
+    GenericDriver.synchronize(uarms)
 
     for uarm in uarms:
         # make a nice landing
         uarm.move_linear(150, 0, 20, 200)
 
-    for uarm in uarms:
-        await uarm.sleep(0)
+    await GenericDriver.synchronize(uarms)
 
     for uarm in uarms:
         # make a nice landing
@@ -0,0 +1,96 @@
+"""A transport without a device, the test gives the answers."""
+
+import asyncio
+
+import context  # noqa: F401
+from asyncgcodecli.driver import (
+    GCodeDeviceConnectEvent,
+    GenericDriver,
+    ResponseReveivedEvent,
+)
+
+GRBL_BANNER = GenericDriver.greeting
+
+
+class StubPort:
+    """
+    Keeps what is written.
+
+    With auto_ok every line is answered with "ok" at once, a status query
+    with an idle report first. Otherwise the test answers with reply. A soft
+    reset is answered with the banner, like GRBL does.
+    """
+
+    def __init__(self, banner=GRBL_BANNER, auto_ok=False):
+        self.event_queue = asyncio.Queue()
+        self.written = []
+        self.banner = banner
+        self.auto_ok = auto_ok
+        self.closed = False
+        self.__buffer = b""
+
+    def start(self):
+        self.event_queue.put_nowait(GCodeDeviceConnectEvent(True))
+        if self.banner is not None:
+            self.reply(self.banner)
+
+    def close(self):
+        self.closed = True
+
+    def write(self, data):
+        data = bytes(data)
+        self.written.append(data)
+        if data == GenericDriver.soft_reset and self.banner is not None:
+            self.reply(self.banner)
+        if not self.auto_ok or not data.endswith((b"\r", b"\n")):
+            return
+        self.__buffer += data
+        *lines, self.__buffer = self.__buffer.replace(b"\n", b"\r").split(b"\r")
+        for line in lines:
+            if line == b"?":
+                self.reply("<Idle|MPos:0.000,0.000,0.000|FS:0,0>")
+            if line:
+                self.reply("ok")
+
+    def reply(self, *responses):
+        for response in responses:
+            self.event_queue.put_nowait(ResponseReveivedEvent(response))
+
+    def lines(self):
+        """The written lines, real-time commands are written on their own."""
+        data = b"".join(
+            data for data in self.written if data.endswith((b"\r", b"\n"))
+        )
+        return data.replace(b"\n", b"\r").split(b"\r")[:-1]
+
+
+class StubTransport:
+    """Gives the driver a StubPort, see GenericDriver transport."""
+
+    def __init__(self, **kw):
+        self.kw = kw
+        self.port = None
+
+    def open_port(self, port, loop, link=None, probe=None):
+        self.port = StubPort(**self.kw)
+        return self.port
+
+
+async def settle(rounds=10):
+    """Let the driver handle everything that was posted."""
+    for _ in range(rounds):
+        await asyncio.sleep(0)
+
+
+async def start_device(device_type, *args, auto_ok=False, banner=GRBL_BANNER, **kw):
+    """Start a device on a StubPort and wait until it is ready."""
+    transport = StubTransport(banner=banner, auto_ok=auto_ok)
+    device = device_type("stub", *args, transport=transport, **kw)
+    device.start()
+    await settle()
+    if not auto_ok:
+        # the settings query
+        transport.port.reply("ok")
+    await asyncio.wait_for(device.ready(), 1)
+    transport.port.written.clear()
+    return device, transport.port
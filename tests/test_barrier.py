@@ -0,0 +1,68 @@
+"""Devices that wait for each other."""
+
+import asyncio
+
+import pytest
+
+from stubport import GRBL_BANNER, settle, start_device
+from asyncgcodecli.driver import DeviceResetException, GenericDriver
+
+MOVE_1 = b"G1 X1.00 F10000.00"
+MOVE_2 = b"G1 X2.00 F10000.00"
+
+
+async def _synchronized_pair():
+    devices, ports = zip(*[await start_device(GenericDriver) for _ in range(2)])
+    for device in devices:
+        device.move_linear(x=1)
+    result = GenericDriver.synchronize(devices)
+    for device in devices:
+        device.move_linear(x=2)
+    await settle()
+    return devices, ports, result
+
+
+def test_no_device_passes_the_barrier_alone():
+    async def run():
+        devices, (first, second), result = await _synchronized_pair()
+        # the dwell waits for the move before it
+        assert first.lines() == [MOVE_1]
+        first.reply("ok")
+        await settle()
+        assert first.lines() == [MOVE_1, b"G4 P0"]
+
+        # the first device is done, but waits for the second
+        first.reply("ok")
+        await settle()
+        assert first.lines() == [MOVE_1, b"G4 P0"]
+        assert not result.done()
+
+        second.reply("ok", "ok")
+        await settle()
+        assert result.result() == {"result": "ok", "error_code": 0}
+        # both continue
+        assert first.lines()[-1] == MOVE_2
+        assert second.lines() == [MOVE_1, b"G4 P0", MOVE_2]
+        for device in devices:
+            device.stop()
+
+    asyncio.run(run())
+
+
+def test_a_reset_releases_the_others():
+    async def run():
+        devices, (first, second), result = await _synchronized_pair()
+        first.reply("ok", "ok")
+        await settle()
+        assert not result.done()
+
+        # the second device restarts before it gets to the barrier
+        second.reply(GRBL_BANNER)
+        await settle()
+        with pytest.raises(DeviceResetException):
+            result.result()
+        assert first.lines() == [MOVE_1, b"G4 P0", MOVE_2]
+        for device in devices:
+            device.stop()
+
+    asyncio.run(run())
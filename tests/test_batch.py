@@ -0,0 +1,74 @@
+"""Groups of commands with one result."""
+
+import asyncio
+
+import pytest
+
+from stubport import GRBL_BANNER, settle, start_device
+from asyncgcodecli import DeviceResetException, GenericDriver
+
+
+def test_one_result_for_the_whole_path():
+    async def run():
+        device, port = await start_device(GenericDriver)
+        result = device.move_path([(1, 2), (3, 4, 5), (6, 7)], speed=100)
+        for _ in range(2):
+            await settle()
+            assert not result.done()
+            port.reply("ok")
+        await settle()
+        assert not result.done()
+        port.reply("ok")
+        await settle()
+        assert result.result() == {"result": "ok", "error_code": 0}
+        assert port.lines() == [
+            b"G1 X1.00 Y2.00 F100.00",
+            b"G1 X3.00 Y4.00 Z5.00 F100.00",
+            b"G1 X6.00 Y7.00 F100.00",
+        ]
+        device.stop()
+
+    asyncio.run(run())
+
+
+def test_errors_are_collected_by_index():
+    async def run():
+        device, port = await start_device(GenericDriver)
+        result = device.move_path([(1, 1), (2, 2), (3, 3)])
+        for reply in ("ok", "error:33", "ok"):
+            await settle()
+            port.reply(reply)
+        result = await asyncio.wait_for(result, 1)
+        device.stop()
+        return result
+
+    result = asyncio.run(run())
+    assert result["result"] == "error"
+    assert result["error_code"] == "33"
+    assert [index for index, _ in result["errors"]] == [1]
+
+
+def test_an_empty_batch_is_done_at_once():
+    async def run():
+        device, port = await start_device(GenericDriver)
+        result = device.queue_batch([])
+        assert result.result() == {"result": "ok", "error_code": 0}
+        device.stop()
+
+    asyncio.run(run())
+
+
+def test_a_reset_fails_the_batch():
+    async def run():
+        device, port = await start_device(GenericDriver)
+        result = device.move_path([(1, 1), (2, 2)])
+        await settle()
+        port.reply("ok")
+        await settle()
+        port.reply(GRBL_BANNER)
+        await settle()
+        with pytest.raises(DeviceResetException):
+            result.result()
+        device.stop()
+
+    asyncio.run(run())
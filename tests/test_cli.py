@@ -0,0 +1,97 @@
+"""The command line tool."""
+
+import os
+import subprocess
+import sys
+
+import pytest
+
+from stubport import StubTransport
+from asyncgcodecli import cli, driver
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# what the asyncgcodecli script does, and what it imported when it is done
+_SCRIPT = """
+import atexit
+import sys
+
+atexit.register(
+    lambda: print([name for name in ("asyncio", "serial") if name in sys.modules])
+)
+from asyncgcodecli.cli import main
+
+sys.exit(main())
+"""
+
+
+def test_as_many_files_as_ports_is_one_each():
+    assert cli._assign(["a", "b"], ["p1", "p2"]) == [("p1", ["a"]), ("p2", ["b"])]
+
+
+def test_otherwise_every_port_gets_all_files():
+    assert cli._assign(["a", "b", "c"], ["p1", "p2"]) == [
+        ("p1", ["a", "b", "c"]),
+        ("p2", ["a", "b", "c"]),
+    ]
+    assert cli._assign(["a"], ["p1", "p2"]) == [("p1", ["a"]), ("p2", ["a"])]
+
+
+def test_argument_errors(tmp_path, capsys):
+    path = tmp_path / "drawing.gcode"
+    path.write_text("G0 X1\n")
+    for argv in (
+        # no port
+        [str(path)],
+        # no file
+        ["-p", "COM1"],
+        [str(tmp_path / "missing.gcode"), "-p", "COM1"],
+        [str(path), "-p", "COM1", "--flow-control", "xon-xoff"],
+    ):
+        with pytest.raises(SystemExit) as exit:
+            cli.main(argv)
+        assert exit.value.code == 2
+    assert "missing.gcode does not exist" in capsys.readouterr().err
+
+
+@pytest.mark.parametrize("argv", [["--help"], ["-p", "COM1"]], ids=["help", "error"])
+def test_help_and_errors_do_not_load_the_drivers(argv):
+    done = subprocess.run(
+        [sys.executable, "-c", _SCRIPT] + argv,
+        capture_output=True,
+        text=True,
+        env=dict(os.environ, PYTHONPATH=ROOT),
+    )
+    assert done.returncode == (0 if argv == ["--help"] else 2)
+    assert done.stdout.splitlines()[-1] == "[]"
+
+
+def _stub_driver(monkeypatch, **kw):
+    """Let the tool stream to a StubPort instead of a serial port."""
+    ports = []
+
+    class StubDriver(driver.GenericDriver):
+        def __init__(self, port, **options):
+            transport = StubTransport(**kw)
+            ports.append(transport)
+            super().__init__(port, transport=transport, **options)
+
+    monkeypatch.setattr(driver, "GenericDriver", StubDriver)
+    return ports
+
+
+def test_exit_code_is_0_when_everything_is_sent(tmp_path, monkeypatch):
+    transports = _stub_driver(monkeypatch, auto_ok=True)
+    path = tmp_path / "drawing.gcode"
+    path.write_text("g0 x1 y2\n\nG1 X3 ; feed\n")
+    assert cli.main([str(path), "-p", "p1", "-p", "p2", "-q", "-l", "none"]) == 0
+    for transport in transports:
+        assert transport.port.lines() == [b"$$", b"G0X1Y2", b"G1X3"]
+
+
+def test_exit_code_is_1_when_a_device_does_not_answer(tmp_path, monkeypatch):
+    _stub_driver(monkeypatch, banner=None)
+    path = tmp_path / "drawing.gcode"
+    path.write_text("G0 X1\n")
+    argv = [str(path), "-p", "p1", "-q", "-l", "none", "-t", "0.1"]
+    assert cli.main(argv) == 1
@@ -0,0 +1,58 @@
+"""Ahead of time compilation of gcode."""
+
+import asyncio
+
+from asyncgcodecli import Plotter, UArm
+from asyncgcodecli.compiler import CompiledProgram, compile_gcode, record_script
+
+SOURCE = [
+    "g21 (metric)",
+    "",
+    "G1  x10 y-2.5 f1000 ; feed",
+    "M117 Hello World",
+    "#12 G0 X1 Y2",
+    "$h",
+]
+
+
+def _compile(tmp_path, source, **kw):
+    path = str(tmp_path / "program.gcb")
+    count = compile_gcode(source, path, **kw)
+    with CompiledProgram.open(path) as program:
+        lines = list(program.lines())
+    assert count == len(lines)
+    return lines
+
+
+def test_compile_keeps_text_and_uppercases_words(tmp_path):
+    assert _compile(tmp_path, SOURCE) == [
+        b"G21",
+        b"G1  X10 Y-2.5 F1000",
+        b"M117 Hello World",
+        b"#12 G0 X1 Y2",
+        b"$h",
+    ]
+
+
+def test_compact_strips_all_spaces_for_grbl(tmp_path):
+    assert _compile(tmp_path, SOURCE, compact=True)[:3] == [
+        b"G21",
+        b"G1X10Y-2.5F1000",
+        b"M117HelloWorld",
+    ]
+
+
+def test_compile_a_file_with_line_ends(tmp_path):
+    source = tmp_path / "program.gcode"
+    source.write_bytes(b"G0 X1\r\n\r\n(only a comment)\nm3 s100\n")
+    assert _compile(tmp_path, str(source), line_end=b"\n") == [b"G0 X1", b"M3 S100"]
+
+
+def test_record_script_greets_like_the_device():
+    async def draw(device):
+        await device.move_linear(x=1, y=2, speed=100)
+
+    # the UArm is only ready after "@1", a GRBL after its banner
+    for device_type in (Plotter, UArm):
+        lines = asyncio.run(record_script(draw, device_type))
+        assert lines == [b"G1 X1.00 Y2.00 F100.00"]
@@ -0,0 +1,78 @@
+"""Event loop lag and hot path timing."""
+
+import asyncio
+import time
+
+import pytest
+
+from stubport import settle, start_device
+from asyncgcodecli import diagnostics
+from asyncgcodecli.driver import GenericDriver
+from asyncgcodecli.flowcontrol import StopAndWait
+
+
+@pytest.fixture(autouse=True)
+def clean():
+    diagnostics.disable()
+    diagnostics.reset()
+    yield
+    diagnostics.disable()
+    diagnostics.reset()
+
+
+def test_a_blocked_loop_is_measured():
+    async def run():
+        diagnostics.enable(sample_interval=0.01, report_interval=None)
+        await asyncio.sleep(0.03)
+        # something that should not run on the event loop
+        time.sleep(0.1)
+        await asyncio.sleep(0.03)
+
+    asyncio.run(run())
+    lag = diagnostics.report()["loop_lag"]
+    assert lag["count"] >= 2
+    assert lag["max"] >= 0.08
+
+
+def test_hot_paths_are_timed():
+    async def run():
+        diagnostics.enable(report_interval=None)
+        device, port = await start_device(GenericDriver, flow_control=StopAndWait())
+        first = device.move_linear(x=1)
+        device.move_linear(x=2)
+        await settle()
+        # the second move waits for the device, not for the loop
+        await asyncio.sleep(0.02)
+        port.reply("ok")
+        await first
+        port.reply("ok")
+        await device.wait_queue_empty()
+        device.stop()
+
+    asyncio.run(run())
+    report = diagnostics.report()
+    for name in ("process_queue", "process_response", "handoff"):
+        assert report[name]["count"] > 0
+    assert report["window_full"]["max"] >= 0.02
+
+
+def test_nothing_is_measured_when_off():
+    async def run():
+        device, port = await start_device(GenericDriver, auto_ok=True)
+        await device.move_linear(x=1)
+        device.stop()
+
+    asyncio.run(run())
+    assert diagnostics.report() == {}
+
+
+def test_switched_on_from_the_environment(monkeypatch):
+    monkeypatch.setenv("ASYNCGCODECLI_DIAGNOSTICS", "20")
+    diagnostics._from_environment()
+    assert diagnostics.active
+    assert diagnostics._settings["lag_threshold"] == pytest.approx(0.02)
+
+    diagnostics.disable()
+    monkeypatch.setenv("ASYNCGCODECLI_DIAGNOSTICS", "off")
+    diagnostics._from_environment()
+    assert not diagnostics.active
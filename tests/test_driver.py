@@ -0,0 +1,118 @@
+"""Error policies and abort against a stub transport."""
+
+import asyncio
+import os
+
+import pytest
+
+from stubport import settle, start_device
+from asyncgcodecli.driver import (
+    CommandAbortedException,
+    GCodeGenericCommand,
+    GenericDriver,
+)
+from asyncgcodecli.flowcontrol import CharacterCounting
+from asyncgcodecli.job import Checkpoint, Job
+
+
+async def _started(**kw):
+    kw.setdefault("flow_control", CharacterCounting(buffer_size=30))
+    return await start_device(GenericDriver, **kw)
+
+
+def _queue(device, count):
+    return [
+        device.queue_command(GCodeGenericCommand("G1 X%d F1000" % index))
+        for index in range(count)
+    ]
+
+
+def test_abort_fails_unsent_and_keeps_sent_commands():
+    async def run():
+        device, port = await _started()
+        results = _queue(device, 6)
+        await settle()
+        # 12 bytes per line, two fit in the buffer
+        assert len(port.lines()) == 2
+        assert device.pending_commands == 6
+
+        device.abort()
+        assert device.paused
+        assert port.written[-1] == b"!"
+        assert all(result.done() for result in results)
+        for result in results:
+            with pytest.raises(CommandAbortedException):
+                result.result()
+        # the sent commands stay until the device answers them
+        assert device.pending_commands == 2
+
+        port.reply("ok", "ok")
+        await settle()
+        assert device.pending_commands == 0
+        await asyncio.wait_for(device.wait_queue_empty(), 1)
+
+        # after resume new commands are sent again
+        device.resume()
+        assert port.written[-1] == b"~"
+        later = device.queue_command(GCodeGenericCommand("G0 X0"))
+        await settle()
+        assert port.lines() == [b"G1 X0 F1000", b"G1 X1 F1000", b"G0 X0"]
+        port.reply("ok")
+        assert (await asyncio.wait_for(later, 1))["result"] == "ok"
+        device.stop()
+
+    asyncio.run(run())
+
+
+def test_abort_after_an_answered_command():
+    async def run():
+        device, port = await _started()
+        results = _queue(device, 4)
+        await settle()
+        port.reply("ok")
+        await settle()
+        assert (await results[0])["result"] == "ok"
+
+        device.abort()
+        assert device.pending_commands == 2
+        for result in results[1:]:
+            with pytest.raises(CommandAbortedException):
+                await result
+        device.stop()
+
+    asyncio.run(run())
+
+
+def test_error_policy_abort():
+    async def run():
+        device, port = await _started(error_policy="abort")
+        results = _queue(device, 4)
+        await settle()
+        port.reply("error:20")
+        await settle()
+        assert (await results[0]) == {"result": "error", "error_code": "20"}
+        assert device.paused
+        with pytest.raises(CommandAbortedException) as info:
+            await results[2]
+        assert info.value.result["error_code"] == "20"
+        device.stop()
+
+    asyncio.run(run())
+
+
+def test_job_saves_its_checkpoint_after_an_abort(tmp_path):
+    async def run():
+        device, port = await _started(error_policy="abort")
+        path = str(tmp_path / "job.ckpt")
+        job = Job(["G1 X%d F1000" % index for index in range(6)], checkpoint_path=path)
+        task = asyncio.ensure_future(job.run(device))
+        await settle()
+        port.reply("ok", "error:20")
+        with pytest.raises(CommandAbortedException):
+            await asyncio.wait_for(task, 1)
+        device.stop()
+        # the answered command counts, the rejected one is still done
+        assert os.path.exists(path)
+        assert Checkpoint.load(path).index == 2
+
+    asyncio.run(run())
@@ -0,0 +1,64 @@
+"""Modal gcode encoding."""
+
+import asyncio
+
+from stubport import settle, start_device
+from asyncgcodecli.driver import GenericDriver
+from asyncgcodecli.encoder import GCodeEncoder
+
+
+def test_unchanged_words_are_left_out():
+    encoder = GCodeEncoder()
+    assert encoder.move(b"G1", [("X", 10), ("Y", 5)], 1000) == b"G1 X10 Y5 F1000\r"
+    assert encoder.move(b"G1", [("X", 12), ("Y", 5)], 1000) == b"X12\r"
+    assert encoder.move(b"G0", [("X", 12), ("Y", 7)]) == b"G0 Y7\r"
+
+
+def test_a_line_is_never_empty():
+    encoder = GCodeEncoder()
+    encoder.move(b"G1", [("X", 1)], 500)
+    assert encoder.move(b"G1", [("X", 1)], 500) == b"G1\r"
+
+
+def test_numbers_without_trailing_zeros():
+    encoder = GCodeEncoder(precision={"X": 3})
+    assert encoder.format("X", 1.2) == b"1.2"
+    assert encoder.format("X", 2.0) == b"2"
+    assert encoder.format("Y", -0.001) == b"0"
+    assert encoder.format("X", 0.0004) == b"0"
+
+
+def test_separator():
+    encoder = GCodeEncoder(separator=b"")
+    assert encoder.move(b"G1", [("X", 1), ("Y", 2)]) == b"G1X1Y2\r"
+
+
+def test_arc_always_sends_target_and_center():
+    encoder = GCodeEncoder()
+    encoder.move(b"G1", [("X", 0), ("Y", 0)], 600)
+    assert encoder.arc(True, 0, 0, 5, 0, 600) == b"G2 X0 Y0 I5 J0\r"
+    # the arc updates the position, a move to its target has no axis words
+    assert encoder.move(b"G1", [("X", 0), ("Y", 0)]) == b"G1\r"
+
+
+def test_reset_forgets_the_modal_state():
+    encoder = GCodeEncoder()
+    encoder.move(b"G1", [("X", 10)], 1000)
+    encoder.reset()
+    assert encoder.move(b"G1", [("X", 10)], 1000) == b"G1 X10 F1000\r"
+
+
+def test_driver_sends_full_words_after_an_error():
+    async def run():
+        device, port = await start_device(GenericDriver, encoder=GCodeEncoder())
+        device.move_linear(x=1, y=2, speed=500)
+        await settle()
+        port.reply("error:2")
+        await settle()
+        device.move_linear(x=1, y=2, speed=500)
+        await settle()
+        # the rejected words are sent again in full
+        assert port.lines() == [b"G1 X1 Y2 F500", b"G1 X1 Y2 F500"]
+        device.stop()
+
+    asyncio.run(run())
@@ -0,0 +1,61 @@
+"""Devices in worker processes."""
+
+from stubport import StubTransport
+from asyncgcodecli.driver import GCodeDeviceConnectEvent, GenericDriver
+from asyncgcodecli.fleet import execute_sharded
+
+
+def _devices(count):
+    return [
+        GenericDriver("stub{}".format(index), transport=StubTransport(auto_ok=True))
+        for index in range(count)
+    ]
+
+
+def test_script_drives_devices_in_other_processes():
+    seen = {}
+
+    async def script(proxies):
+        seen["ports"] = [await proxy.get("port") for proxy in proxies]
+        seen["results"] = [
+            await proxy.move_linear(x=index, speed=100)
+            for index, proxy in enumerate(proxies)
+        ]
+        seen["connected"] = [
+            isinstance(await proxy.events.get(), GCodeDeviceConnectEvent)
+            for proxy in proxies
+        ]
+
+    execute_sharded(_devices(3), script, processes=2)
+    # the proxies are in the order of the devices, not of the processes
+    assert seen["ports"] == ["stub0", "stub1", "stub2"]
+    assert [result["result"] for result in seen["results"]] == ["ok"] * 3
+    assert seen["connected"] == [True] * 3
+
+
+def test_errors_cross_the_pipe():
+    seen = {}
+
+    async def script(proxies):
+        proxy = proxies[0]
+        try:
+            await proxy.move_linear(w=1)
+        except Exception as e:
+            seen["call"] = e
+        try:
+            await proxy.get("does_not_exist")
+        except Exception as e:
+            seen["get"] = e
+        try:
+            # a property can only be read with get
+            proxy.status
+        except AttributeError as e:
+            seen["property"] = e
+        seen["status"] = await proxy.get("is_ready")
+
+    execute_sharded(_devices(1), script, processes=1)
+    assert isinstance(seen["call"], TypeError)
+    assert isinstance(seen["get"], AttributeError)
+    assert "use await proxy.get('status')" in str(seen["property"])
+    assert seen["status"] is True
+
@@ -0,0 +1,169 @@
+"""Flow control policies."""
+
+import asyncio
+
+from stubport import settle, start_device
+from asyncgcodecli import flowcontrol
+from asyncgcodecli.driver import GCodeGenericCommand, GenericDriver
+from asyncgcodecli.flowcontrol import (
+    CharacterCounting,
+    StopAndWait,
+    WindowedFlowControl,
+)
+
+OK = {"result": "ok", "error_code": 0}
+ERROR = {"result": "error", "error_code": "20"}
+
+
+def test_stop_and_wait():
+    flow_control = StopAndWait()
+    command = GCodeGenericCommand("G0 X1")
+    assert flow_control.can_send(command, 7)
+    flow_control.on_send(command, 7)
+    assert not flow_control.can_send(command, 7)
+    flow_control.on_confirm(command, 7, OK)
+    assert flow_control.can_send(command, 7)
+
+
+def test_character_counting_fills_the_buffer():
+    flow_control = CharacterCounting(buffer_size=20)
+    command = GCodeGenericCommand("G0 X1")
+    for _ in range(2):
+        assert flow_control.can_send(command, 8)
+        flow_control.on_send(command, 8)
+    assert flow_control.free == 4
+    assert not flow_control.can_send(command, 8)
+    flow_control.on_confirm(command, 8, OK)
+    assert flow_control.can_send(command, 8)
+
+
+def test_character_counting_fills_the_grbl_buffer_exactly():
+    flow_control = CharacterCounting()
+    command = GCodeGenericCommand("G0 X1")
+    for _ in range(4):
+        flow_control.on_send(command, 30)
+    assert flow_control.free == 8
+    assert flow_control.can_send(command, 8)
+    assert not flow_control.can_send(command, 9)
+    flow_control.on_send(command, 8)
+    assert flow_control.free == 0
+    assert not flow_control.can_send(command, 1)
+    flow_control.on_confirm(command, 30, OK)
+    # an error frees the line just like ok
+    flow_control.on_confirm(command, 8, ERROR)
+    assert flow_control.free == 38
+    flow_control.reset()
+    assert flow_control.free == 128
+
+
+def test_character_counting_large_command_goes_alone():
+    flow_control = CharacterCounting(buffer_size=10)
+    command = GCodeGenericCommand("G0 X1")
+    assert flow_control.can_send(command, 50)
+    flow_control.on_send(command, 50)
+    assert not flow_control.can_send(command, 1)
+    flow_control.on_confirm(command, 50, OK)
+    assert flow_control.free == 10
+
+
+def test_character_counting_reset():
+    flow_control = CharacterCounting(buffer_size=10)
+    flow_control.on_send(GCodeGenericCommand("G0 X1"), 8)
+    flow_control.reset()
+    assert flow_control.free == 10
+    assert flow_control.in_flight == 0
+
+
+def test_windowed_limits_commands_in_flight():
+    flow_control = WindowedFlowControl(window=3, adaptive=False)
+    commands = [GCodeGenericCommand("G0 X%d" % i) for i in range(4)]
+    for command in commands[:3]:
+        assert flow_control.can_send(command, 1000)
+        flow_control.on_send(command, 1000)
+    assert not flow_control.can_send(commands[3], 1)
+    flow_control.on_confirm(commands[0], 1000, OK)
+    assert flow_control.can_send(commands[3], 1)
+
+
+def test_windowed_counts_bytes_with_buffer_size():
+    flow_control = WindowedFlowControl(window=10, buffer_size=10, adaptive=False)
+    command = GCodeGenericCommand("G0 X1")
+    flow_control.on_send(command, 8)
+    assert not flow_control.can_send(command, 8)
+
+
+def test_windowed_adaptive_shrinks_on_error_and_grows_when_full(monkeypatch):
+    # a constant round-trip time, the window never shrinks for latency
+    monkeypatch.setattr(flowcontrol.time, "monotonic", lambda: 100.0)
+    flow_control = WindowedFlowControl(window=4, min_window=2, max_window=8)
+    command = GCodeGenericCommand("G0 X1")
+    flow_control.on_send(command, 8)
+    flow_control.on_confirm(command, 8, ERROR)
+    assert flow_control.window == 2
+
+    # replies that arrive while the window is full grow it by one
+    for _ in range(2):
+        for _ in range(flow_control.window):
+            flow_control.on_send(command, 8)
+        flow_control.on_confirm(command, 8, OK)
+        while flow_control.in_flight:
+            flow_control.on_confirm(command, 8, OK)
+    assert flow_control.window > 2
+
+    flow_control.reset()
+    assert flow_control.window == 4
+
+
+def test_windowed_adaptive_shrinks_when_replies_slow_down(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(flowcontrol.time, "monotonic", lambda: now[0])
+    flow_control = WindowedFlowControl(window=6, min_window=2)
+    command = GCodeGenericCommand("G0 X1")
+    flow_control.on_send(command, 8)
+    now[0] += 0.01
+    flow_control.on_confirm(command, 8, OK)
+    assert flow_control.min_rtt == flow_control.rtt
+
+    # the device starts to queue, every reply takes ten times as long
+    for _ in range(20):
+        flow_control.on_send(command, 8)
+        now[0] += 0.1
+        flow_control.on_confirm(command, 8, OK)
+    assert flow_control.window == 2
+
+
+def _lines_in_flight(flow_control, count=10):
+    """Queue count lines, the lines sent and not answered before each reply."""
+
+    async def run():
+        device, port = await start_device(GenericDriver, flow_control=flow_control)
+        results = [
+            device.queue_command(GCodeGenericCommand("G1 X%d F1000" % index))
+            for index in range(count)
+        ]
+        in_flight = []
+        for answered in range(count):
+            await settle()
+            in_flight.append(len(port.lines()) - answered)
+            port.reply("ok")
+        await asyncio.wait_for(asyncio.gather(*results), 1)
+        device.stop()
+        return in_flight
+
+    return asyncio.run(run())
+
+
+def test_driver_stop_and_wait_sends_one_line_per_reply():
+    assert _lines_in_flight(StopAndWait()) == [1] * 10
+
+
+def test_driver_character_counting_keeps_128_bytes_in_flight():
+    # "G1 Xn F1000\r" is 12 bytes, ten fit and the 13 byte "G1 X10 F1000\r"
+    # only fits after the first reply
+    in_flight = _lines_in_flight(CharacterCounting(), count=14)
+    assert in_flight == [10, 10, 10, 10, 10, 9, 8, 7, 6, 5, 4, 3, 2, 1]
+
+
+def test_driver_windowed_keeps_the_window_full():
+    in_flight = _lines_in_flight(WindowedFlowControl(window=3, adaptive=False))
+    assert in_flight == [3] * 8 + [2, 1]
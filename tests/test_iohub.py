@@ -0,0 +1,109 @@
+"""Many serial ports served by one thread."""
+
+import asyncio
+import os
+import threading
+
+import pytest
+
+from stubport import GRBL_BANNER
+from asyncgcodecli.driver import GenericDriver, TimeoutException
+
+if not hasattr(os, "openpty"):
+    pytest.skip("needs pseudo terminals", allow_module_level=True)
+
+from asyncgcodecli.iohub import SerialIOHub  # noqa: E402
+
+
+class _PtyDevice:
+    """A GRBL on the other end of a pseudo terminal."""
+
+    def __init__(self, loop):
+        self.master, slave = os.openpty()
+        self.port = os.ttyname(slave)
+        # the test keeps the slave open so the port survives the driver
+        self.slave = slave
+        self.lines = []
+        self.__buffer = b""
+        loop.add_reader(self.master, self.__read)
+        self.loop = loop
+
+    def __read(self, *args):
+        try:
+            data = os.read(self.master, 4096)
+        except OSError:
+            return
+        if b"\x18" in data:
+            # the driver did not see a banner after connecting
+            self.__buffer = b""
+            data = data.split(b"\x18")[-1]
+            os.write(self.master, b"\r\n" + GRBL_BANNER.encode() + b"\r\n")
+        self.__buffer += data
+        *lines, self.__buffer = self.__buffer.split(b"\r")
+        for line in lines:
+            self.lines.append(line)
+            os.write(self.master, b"ok\r\n")
+
+    def close(self):
+        self.loop.remove_reader(self.master)
+        os.close(self.master)
+        os.close(self.slave)
+
+
+def test_one_thread_serves_all_ports():
+    async def run():
+        loop = asyncio.get_running_loop()
+        hub = SerialIOHub()
+        ptys = [_PtyDevice(loop) for _ in range(3)]
+        before = threading.active_count()
+        devices = []
+        for pty in ptys:
+            device = GenericDriver(pty.port, io_hub=hub)
+            device.banner_timeout = 0.05
+            devices.append(device)
+            device.start()
+        await asyncio.wait_for(
+            asyncio.gather(*[device.ready() for device in devices]), 5
+        )
+        assert threading.active_count() == before + 1
+
+        async def draw(device, offset):
+            for x in range(20):
+                device.move_linear(x=x + offset, speed=1000)
+            await device.wait_queue_empty()
+
+        await asyncio.wait_for(
+            asyncio.gather(
+                *[draw(device, 100 * i) for i, device in enumerate(devices)]
+            ),
+            5,
+        )
+        for device in devices:
+            device.stop()
+        await asyncio.sleep(0.05)
+        for pty in ptys:
+            pty.close()
+        return ptys
+
+    ptys = asyncio.run(run())
+    for i, pty in enumerate(ptys):
+        assert pty.lines[0] == b"$$"
+        assert pty.lines[1:] == [
+            "G1 X{:.2f} F1000.00".format(x + 100 * i).encode() for x in range(20)
+        ]
+
+
+def test_a_port_that_does_not_open_is_not_ready():
+    async def run():
+        hub = SerialIOHub()
+        hub.connect_attempts = 2
+        hub.connect_interval = 0.01
+        device = GenericDriver("/dev/does-not-exist", io_hub=hub)
+        device.start()
+        try:
+            with pytest.raises(TimeoutException):
+                await asyncio.wait_for(device.ready(), 5)
+        finally:
+            device.stop()
+
+    asyncio.run(run())
@@ -0,0 +1,141 @@
+"""Modal state tracking of a job."""
+
+import asyncio
+
+import pytest
+
+from stubport import settle, start_device
+from asyncgcodecli.driver import GenericDriver
+from asyncgcodecli.job import Checkpoint, Job, ModalState, RestoreFailedException
+
+
+def test_update_tracks_motion_position_and_feed():
+    state = ModalState()
+    state.update(b"G21 G90")
+    state.update(b"G1 X10 Y20.5 F3000")
+    state.update(b"M3 S900 (pen down)")
+    assert state.motion == "G1"
+    assert state.position == {"X": 10, "Y": 20.5}
+    assert state.feed == 3000
+    assert state.spindle == "M3"
+    assert state.spindle_speed == 900
+
+
+def test_update_relative_moves():
+    state = ModalState()
+    state.update(b"G0 X10 Y10")
+    state.update(b"G91")
+    state.update(b"G1 X2 Y-3")
+    assert not state.absolute
+    assert state.position == {"X": 12, "Y": 7}
+
+
+def test_update_ignores_axis_words_that_are_not_moves():
+    state = ModalState()
+    state.update(b"G0 X5")
+    state.update(b"G4 P1")
+    state.update(b"G92 X0")
+    state.update(b"g01 x6 ; lower case and a comment")
+    assert state.position == {"X": 6}
+    assert state.motion == "G1"
+
+
+def test_homing_forgets_the_position():
+    state = ModalState()
+    state.update(b"G0 X5 Y5")
+    state.update(b"$H")
+    assert state.position == {}
+
+
+def test_restore_gcode():
+    state = ModalState()
+    for line in (b"G20", b"G1 X1.5 Y2 F200", b"M3 S400", b"G91"):
+        state.update(line)
+    assert state.restore_gcode() == [
+        "G20",
+        "G90",
+        "G0 X1.5 Y2",
+        "M3 S400",
+        "G91",
+        "G1 F200",
+    ]
+
+
+def test_restore_gcode_lifts_before_moving_and_plunges_at_the_feed():
+    state = ModalState()
+    for line in (b"G0 Z5", b"G1 X10 Y20 F300", b"M3 S1000", b"G1 Z-1.5"):
+        state.update(line)
+    assert state.restore_gcode() == [
+        "G21",
+        "G90",
+        "G53 G0 Z0",
+        "G0 X10 Y20",
+        "M3 S1000",
+        "G1 Z-1.5 F300",
+        "G1 F300",
+    ]
+    assert state.restore_gcode(safe_z=5)[2] == "G0 Z5"
+
+
+def test_restore_gcode_after_an_arc_and_spindle_off():
+    state = ModalState()
+    state.update(b"G2 X10 Y0 I5 J0 F100")
+    state.update(b"M5")
+    assert state.restore_gcode() == ["G21", "G90", "G0 X10 Y0", "F100"]
+
+
+def test_restore_gcode_replays_into_the_same_state():
+    state = ModalState()
+    for line in (b"G1 X3 Y4 F1500", b"M4 S250"):
+        state.update(line)
+    restored = ModalState()
+    for line in state.restore_gcode():
+        restored.update(line.encode())
+    assert restored.to_dict() == state.to_dict()
+
+
+def test_resume_dwells_after_the_spindle_before_the_plunge():
+    async def run():
+        device, port = await start_device(GenericDriver, auto_ok=True)
+        state = ModalState()
+        state.update(b"G1 X1 Y2 Z-1 F100")
+        state.update(b"M3 S500")
+        job = Job(["G1 X0", "G1 X1"], spindle_delay=0.5, safe_z=3)
+        job.checkpoint = Checkpoint(1, state)
+        assert (await job.run(device, resume=True))["result"] == "ok"
+        assert port.lines() == [
+            b"G21",
+            b"G90",
+            b"G0 Z3",
+            b"G0 X1 Y2",
+            b"M3 S500",
+            b"G4 P0.5",
+            b"G1 Z-1 F100",
+            b"G1 F100",
+            b"G1 X1",
+        ]
+        device.stop()
+
+    asyncio.run(run())
+
+
+def test_a_rejected_restore_line_is_not_a_reset():
+    async def run():
+        device, port = await start_device(GenericDriver)
+        state = ModalState()
+        state.update(b"G1 X1 F100")
+        job = Job(["G1 X0", "G1 X1"])
+        job.checkpoint = Checkpoint(1, state)
+        task = asyncio.ensure_future(job.run(device, resume=True))
+        await settle()
+        for response in ("ok", "ok", "ok", "error:20"):
+            port.reply(response)
+            await settle()
+        assert port.lines() == [b"G21", b"G90", b"G0 X1", b"G1 F100"]
+        with pytest.raises(RestoreFailedException) as info:
+            await asyncio.wait_for(task, 1)
+        assert info.value.result["result"] == "error"
+        assert job.checkpoint.index == 1
+        device.stop()
+
+    asyncio.run(run())
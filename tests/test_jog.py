@@ -0,0 +1,92 @@
+"""Jogging and jog cancel."""
+
+import asyncio
+
+import pytest
+
+from stubport import settle, start_device
+from asyncgcodecli import Jogger, Plotter, UArm
+from asyncgcodecli.driver import GenericDriver
+from asyncgcodecli.encoder import GCodeEncoder
+
+
+def test_move_back_after_a_cancelled_jog_sends_its_axis_words():
+    async def run():
+        device, port = await start_device(
+            GenericDriver, auto_ok=True, encoder=GCodeEncoder()
+        )
+        await device.move_linear(x=10, y=10, speed=1000)
+        await device.jog(x=5, speed=1000)
+        device.jog_cancel()
+        await device.move_linear(x=10, y=10, speed=1000)
+        assert port.lines() == [
+            b"G1 X10 Y10 F1000",
+            b"$J=G91 G21 X5.000 F1000",
+            b"G1 X10 Y10 F1000",
+        ]
+        assert b"\x85" in port.written
+        device.stop()
+
+    asyncio.run(run())
+
+
+def test_jog_cancel_withdraws_unsent_jogs():
+    async def run():
+        device, port = await start_device(GenericDriver)
+        results = [device.jog(x=1, speed=600) for _ in range(20)]
+        await settle()
+        sent = len(port.lines())
+        assert 0 < sent < 20
+        device.jog_cancel()
+        for result in results[sent:]:
+            assert (await result)["result"] == "cancelled"
+        assert port.written[-1] == b"\x85"
+        device.stop()
+
+    asyncio.run(run())
+
+
+def test_jog_with_z_forgets_the_pen():
+    async def run():
+        device, port = await start_device(Plotter, auto_ok=True)
+        await device.pen_down()
+        await device.jog(x=1, speed=600)
+        assert device.pen_is_down is True
+        await device.jog(z=1, speed=600)
+        assert device.pen_is_down is None
+        device.stop()
+
+    asyncio.run(run())
+
+
+def test_devices_without_jog_cancel_are_refused():
+    async def run():
+        arm = UArm("stub")
+        with pytest.raises(ValueError):
+            arm.jog(x=1)
+        with pytest.raises(ValueError):
+            Jogger(arm)
+        # nothing to cancel
+        arm.jog_cancel()
+
+    asyncio.run(run())
+
+
+def test_jogger_plans_jogs_and_cancels_on_release():
+    async def run():
+        device, port = await start_device(GenericDriver, auto_ok=True)
+
+        async def velocities():
+            yield (600, 0, 0)
+            await asyncio.sleep(0.05)
+            yield None
+
+        jogger = Jogger(device, max_speed=600, interval=0.01, depth=2)
+        await asyncio.wait_for(jogger.run(velocities()), 1)
+        jogs = [line for line in port.lines() if line.startswith(b"$J=")]
+        assert jogs
+        assert all(line.endswith(b"X0.100 F600") for line in jogs)
+        assert port.written[-1] == b"\x85"
+        device.stop()
+
+    asyncio.run(run())
@@ -0,0 +1,52 @@
+"""Pen stroke ordering."""
+
+import random
+
+import context  # noqa: F401
+from asyncgcodecli.pathoptimizer import optimize_strokes, path_travel
+
+
+def _random_strokes(count, seed):
+    generator = random.Random(seed)
+    strokes = []
+    for _ in range(count):
+        x, y = generator.uniform(0, 300), generator.uniform(0, 200)
+        strokes.append([(x, y), (x + generator.uniform(-20, 20), y + 1)])
+    return strokes
+
+
+def _same_strokes(a, b):
+    def key(stroke):
+        return min(tuple(stroke), tuple(reversed(stroke)))
+
+    return sorted(map(key, a)) == sorted(map(key, b))
+
+
+def test_never_worse_than_the_input():
+    for seed in range(20):
+        strokes = _random_strokes(50, seed)
+        for reverse in (True, False):
+            result = optimize_strokes(strokes, reverse=reverse)
+            assert result.travel_after <= result.travel_before + 1e-9
+            assert result.travel_after == path_travel(result.strokes)
+            assert _same_strokes(result.strokes, strokes)
+
+
+def test_an_optimal_input_is_kept():
+    strokes = [[(i, 0), (i + 0.5, 0)] for i in range(10)]
+    result = optimize_strokes(strokes, start=(0, 0))
+    assert result.travel_after == result.travel_before
+    assert result.strokes == strokes
+
+
+def test_reverse_draws_strokes_the_other_way():
+    strokes = [[(10, 0), (20, 0)], [(0, 0), (9, 0)]]
+    result = optimize_strokes(strokes, start=(0, 0), reverse=True)
+    assert result.strokes == [[(0, 0), (9, 0)], [(10, 0), (20, 0)]]
+    assert result.travel_saved > 0
+
+
+def test_empty_strokes_are_dropped():
+    result = optimize_strokes([[], [(1, 1), (2, 2)], []])
+    assert result.strokes == [[(1, 1), (2, 2)]]
+    assert optimize_strokes([]).strokes == []
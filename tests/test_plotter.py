@@ -0,0 +1,79 @@
+"""Pen state of the plotter."""
+
+import asyncio
+
+from stubport import GRBL_BANNER, settle, start_device
+from asyncgcodecli import GCodeGenericCommand, Plotter
+
+
+def _run(script, **kw):
+    async def run():
+        plotter, port = await start_device(Plotter, auto_ok=True, **kw)
+        await script(plotter, port)
+        await plotter.wait_queue_empty()
+        plotter.stop()
+        return port.lines()
+
+    return asyncio.run(run())
+
+
+def test_pen_moves_only_when_it_changes():
+    async def script(plotter, port):
+        plotter.pen_up()
+        plotter.pen_up()
+        plotter.pen_down()
+        await plotter.pen_down()
+
+    # the first move of the servo waits for the full travel, 500 / 500 s
+    assert _run(script) == [b"M3 S400.00", b"G4 P1.00", b"M3 S900.00", b"G4 P1.00"]
+
+
+def test_settle_time_follows_the_servo_travel():
+    async def script(plotter, port):
+        plotter.pen_up()
+        plotter.pen_down()
+        plotter.pen_up()
+
+    lines = _run(script, pen_down_position=500, servo_speed=200)
+    # 100 S units at 200 per second after the first move
+    assert lines == [
+        b"M3 S400.00",
+        b"G4 P0.50",
+        b"M3 S500.00",
+        b"G4 P0.50",
+        b"M3 S400.00",
+        b"G4 P0.50",
+    ]
+
+    async def once(plotter, port):
+        plotter.pen_up()
+
+    assert _run(once, pen_settle_time=0) == [b"M3 S400.00"]
+
+
+def test_raw_gcode_and_a_reset_forget_the_pen():
+    async def script(plotter, port):
+        plotter.pen_up()
+        # may have moved the servo
+        plotter.queue_command(GCodeGenericCommand("M3 S600"))
+        plotter.pen_up()
+        # status and settings do not move the servo
+        plotter.queue_command(GCodeGenericCommand("$$"))
+        plotter.pen_up()
+        await plotter.wait_queue_empty()
+
+        port.reply(GRBL_BANNER)
+        await settle()
+        await plotter.ready()
+        plotter.pen_up()
+
+    lines = _run(script, pen_settle_time=0)
+    assert lines == [
+        b"M3 S400.00",
+        b"M3 S600",
+        b"M3 S400.00",
+        b"$$",
+        # the settings query after the reset
+        b"$$",
+        b"M3 S400.00",
+    ]
@@ -0,0 +1,119 @@
+"""Raster images to laser gcode."""
+
+import asyncio
+
+import pytest
+
+from stubport import start_device
+from asyncgcodecli.driver import GenericDriver
+
+numpy = pytest.importorskip("numpy")
+raster = pytest.importorskip("asyncgcodecli.raster")
+
+# 3 rows of 4 pixels, black burns. 128 is just under half power, the top row
+# has a blank pixel that is crossed and the middle row is blank.
+IMAGE = numpy.array(
+    [[0, 0, 255, 128], [255, 255, 255, 255], [128, 0, 0, 255]], dtype=numpy.uint8
+)
+
+
+def _gcode(image=IMAGE, **kw):
+    return list(raster.raster_gcode(image, pixel_size=1, speed=1000, **kw))
+
+
+def test_golden_bidirectional():
+    assert _gcode() == [
+        b"G0 X0 Y2",
+        b"G1 X2 S255 F1000",
+        b"G0 X3",
+        b"G1 X4 S127",
+        # the blank row is skipped, the next row runs back
+        b"G0 X3 Y0",
+        b"G1 X1 S255",
+        b"G1 X0 S127",
+    ]
+
+
+def test_golden_one_direction():
+    assert _gcode(bidirectional=False) == [
+        b"G0 X0 Y2",
+        b"G1 X2 S255 F1000",
+        b"G0 X3",
+        b"G1 X4 S127",
+        b"G0 X0 Y0",
+        # the power did not change since the last line
+        b"G1 X1",
+        b"G1 X3 S255",
+    ]
+
+
+def test_golden_laser_switch():
+    # two levels with dithering, the 128 pixel burns in the top row only
+    expected = [
+        b"G0 X0 Y2",
+        b"M3",
+        b"G1 X2 F1000",
+        b"M5",
+        b"G0 X3",
+        b"M3",
+        b"G1 X4",
+        b"M5",
+    ]
+    assert _gcode(laser_switch=(b"M3", b"M5")) == expected + [
+        b"G0 X3 Y0",
+        b"M3",
+        b"G1 X1",
+        b"M5",
+    ]
+    assert _gcode(laser_switch=(b"M3", b"M5"), bidirectional=False) == expected + [
+        b"G0 X1 Y0",
+        b"M3",
+        b"G1 X3",
+        b"M5",
+    ]
+
+
+def test_overscan_runs_past_the_row_in_both_directions():
+    assert _gcode(overscan=2, min_gap=None) == [
+        b"G0 X-2 Y2",
+        b"G1 X0 S0 F1000",
+        b"G1 X2 S255",
+        b"G1 X3 S0",
+        b"G1 X4 S127",
+        b"G1 X6 S0",
+        b"G0 X5 Y0",
+        b"G1 X3",
+        b"G1 X1 S255",
+        b"G1 X0 S127",
+        b"G1 X-2 S0",
+    ]
+
+
+def test_equal_pixels_are_one_run():
+    image = numpy.zeros((1, 1000), dtype=numpy.uint8)
+    image[0, 500:] = 100
+    assert _gcode(image, z=3) == [
+        b"G0 X0 Y0 Z3",
+        b"G1 X500 S255 F1000",
+        b"G1 X1000 S155",
+    ]
+
+
+def test_engrave_streams_on_raster_off_in_order():
+    async def run():
+        device, port = await start_device(GenericDriver, auto_ok=True)
+        result = await raster.engrave(
+            device,
+            IMAGE,
+            laser_on=b"M4 S0",
+            laser_off=b"M5",
+            chunk_size=20,
+            pixel_size=1,
+            speed=1000,
+        )
+        device.stop()
+        return result, port.lines()
+
+    result, lines = asyncio.run(run())
+    assert result == {"result": "ok", "error_code": 0}
+    assert lines == [b"M4 S0"] + _gcode() + [b"M5"]
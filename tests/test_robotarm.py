@@ -0,0 +1,143 @@
+"""Path planning of the robot arm."""
+
+import asyncio
+import concurrent.futures
+import math
+
+import pytest
+
+from stubport import settle, start_device
+from asyncgcodecli import RobotArm
+from asyncgcodecli import robotarm
+
+
+class _HeldExecutor(concurrent.futures.Executor):
+    """Runs nothing until the test says so."""
+
+    def __init__(self):
+        self.jobs = []
+
+    def submit(self, fn, *args, **kw):
+        future = concurrent.futures.Future()
+        self.jobs.append((future, fn, args, kw))
+        return future
+
+    def run_next(self):
+        for future, fn, args, kw in self.jobs:
+            if not future.done():
+                future.set_result(fn(*args, **kw))
+                return True
+        return False
+
+
+def _path():
+    return [(150, 50 + i, 100) for i in range(10, 50, 10)]
+
+
+def _move_path(prefetch, executor=None):
+    async def run():
+        device, port = await start_device(RobotArm, auto_ok=True)
+        device.lastXYZ = [150, 50, 100]
+        task = asyncio.ensure_future(
+            device.move_path_async(
+                _path(), executor=executor, chunk_size=4, prefetch=prefetch
+            )
+        )
+        started = []
+        if isinstance(executor, _HeldExecutor):
+            await settle()
+            started.append(len(executor.jobs))
+            while executor.run_next():
+                await settle()
+                started.append(len(executor.jobs))
+        result = await asyncio.wait_for(task, 5)
+        device.stop()
+        return result, port.lines(), started
+
+    return asyncio.run(run())
+
+
+def test_prefetch_bounds_the_chunks_planned_ahead():
+    executor = _HeldExecutor()
+    result, lines, started = _move_path(3, executor)
+    assert result["result"] == "ok"
+    # four moves of 10 segments, in chunks of 4, 4 and 2
+    assert len(executor.jobs) == 12
+    # a new chunk is planned only when one is taken
+    assert started == [3, 4, 5, 6, 7, 8, 9, 10, 11, 12, 12, 12, 12]
+
+    # planning ahead does not change the moves or their order
+    _, in_order, _ = _move_path(1)
+    assert lines == in_order
+    assert len(lines) == 40
+
+
+def test_prefetch_must_be_positive():
+    async def run():
+        device, _ = await start_device(RobotArm, auto_ok=True)
+        with pytest.raises(ValueError):
+            await device.move_path_async(_path(), prefetch=0)
+        device.stop()
+
+    asyncio.run(run())
+
+
+START = (150, 50, 100)
+END = (150, 90, 100)
+
+
+def _tool_speeds(segments, length):
+    """The tool speed (per minute) of each segment, from its joint feed."""
+    previous = robotarm._joint_angles(*START)
+    speeds = []
+    for angles, feed in segments:
+        joint_length = math.dist(previous, angles)
+        previous = angles
+        speeds.append((length / len(segments)) / (joint_length / feed))
+    return speeds
+
+
+def test_cartesian_feed_keeps_the_tool_speed():
+    segments = robotarm._plan_linear_move(START, END, 600)
+    assert len(segments) == 40
+    assert _tool_speeds(segments, 40) == pytest.approx([600] * 40)
+    # in joint mode the feed is the speed
+    joint = robotarm._plan_linear_move(START, END, 600, cartesian=False)
+    assert [feed for _, feed in joint] == [600] * 40
+
+
+def test_acceleration_ramps_up_and_down():
+    segments = robotarm._plan_linear_move(START, END, 6000, acceleration=50)
+    speeds = _tool_speeds(segments, 40)
+    middle = len(speeds) // 2
+    assert speeds[0] < speeds[5] < speeds[middle] <= 6000 + 1e-6
+    assert speeds == pytest.approx(speeds[::-1])
+
+
+def test_joints_stay_under_their_limit():
+    limits = [300, 300, 300]
+    segments = robotarm._plan_linear_move(START, END, 6000, max_joint_speeds=limits)
+    previous = robotarm._joint_angles(*START)
+    for angles, feed in segments:
+        deltas = [abs(b - a) for a, b in zip(previous, angles)]
+        duration = math.dist(previous, angles) / feed
+        previous = angles
+        assert all(delta / duration <= 300 + 1e-6 for delta in deltas)
+
+
+def test_cartesian_move_linear_uses_the_device_limits():
+    async def run():
+        device, port = await start_device(RobotArm, auto_ok=True, feed_mode="cartesian")
+        device.settings.update({"110": "300", "111": "300", "112": "300"})
+        device.lastXYZ = list(START)
+        await device.move_linear(*END, speed=6000)
+        device.stop()
+        return port.lines()
+
+    lines = asyncio.run(run())
+    expected = robotarm._plan_linear_move(
+        START, END, 6000, max_joint_speeds=[300, 300, 300]
+    )
+    assert len(lines) == len(expected) == 40
+    feeds = [float(line.split(b"F")[1]) for line in lines]
+    assert feeds == pytest.approx([feed for _, feed in expected], abs=0.01)
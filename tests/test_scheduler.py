@@ -0,0 +1,98 @@
+"""Jobs spread over a group of devices."""
+
+import asyncio
+
+from stubport import StubTransport
+from asyncgcodecli.driver import GenericDriver
+from asyncgcodecli.scheduler import Scheduler
+
+
+def _devices(count, transports=None):
+    devices = []
+    for index in range(count):
+        transport = StubTransport(auto_ok=True)
+        if transports is not None:
+            transports.append(transport)
+        devices.append(GenericDriver("stub{}".format(index), transport=transport))
+    return devices
+
+
+def _script(log, name, fail_on=()):
+    async def work(device):
+        log.append((name, device.port))
+        if device.port in fail_on:
+            raise RuntimeError("broken on " + device.port)
+        await device.move_linear(x=1, y=1, speed=100)
+
+    return work
+
+
+def test_longest_job_first():
+    log = []
+    scheduler = Scheduler(_devices(1))
+    for estimate in (1, 5, 3):
+        scheduler.submit(_script(log, estimate), estimate=estimate)
+    report = scheduler.execute()
+    assert report["completed"] == 3
+    assert [name for name, _ in log] == [5, 3, 1]
+
+
+def test_failed_job_is_retried_on_another_device():
+    log = []
+    scheduler = Scheduler(_devices(2), ready_timeout=1)
+    job = scheduler.submit(_script(log, "job", fail_on=("stub0",)))
+    report = scheduler.execute()
+    assert job.state == "done"
+    assert job.attempts == 2
+    assert log == [("job", "stub0"), ("job", "stub1")]
+    assert job.device == 1
+    assert report["devices"][0]["failures"] == 1
+
+
+def test_device_goes_offline_after_failures_in_a_row():
+    log = []
+    scheduler = Scheduler(_devices(2), max_device_failures=2, ready_timeout=1)
+    jobs = [
+        scheduler.submit(_script(log, index, fail_on=("stub0",)), estimate=1)
+        for index in range(4)
+    ]
+    report = scheduler.execute()
+    assert all(job.state == "done" for job in jobs)
+    assert report["completed"] == 4
+    assert report["devices"][0]["failures"] == 2
+    assert report["devices"][1]["jobs"] == 4
+    assert not report["devices"][0]["online"]
+    # after going offline nothing more runs on the first device
+    assert [port for _, port in log].count("stub0") == 2
+
+
+def test_job_that_hangs_is_stopped_and_requeued():
+    transports = []
+    devices = _devices(2, transports)
+    log = []
+
+    async def work(device):
+        log.append(device.port)
+        if len(log) == 1:
+            # never finishes
+            await asyncio.Event().wait()
+        await device.move_linear(x=1, speed=100)
+
+    scheduler = Scheduler(devices, ready_timeout=1)
+    job = scheduler.submit(work, timeout=1)
+    report = scheduler.execute()
+    assert job.state == "done"
+    assert job.attempts == 2
+    first = [device.port for device in devices].index(log[0])
+    assert job.device != first
+    assert report["devices"][first]["failures"] == 1
+    # the hanging device was reset and greeted again
+    written = transports[first].port.written
+    reset = written.index(GenericDriver.soft_reset)
+    assert b"$$\r" in written[reset:]
+
+
+def test_job_timeout_is_the_default():
+    scheduler = Scheduler([], job_timeout=5)
+    assert scheduler.submit(_script([], "a")).timeout == 5
+    assert scheduler.submit(_script([], "b"), timeout=1).timeout == 1
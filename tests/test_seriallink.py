@@ -0,0 +1,72 @@
+"""Probing the baudrate and the banner the driver waits for."""
+
+import asyncio
+
+from stubport import start_device
+from asyncgcodecli import Plotter, UArm
+from asyncgcodecli.driver import GenericDriver
+from asyncgcodecli.seriallink import SerialLink
+
+OLDER_BANNER = "Grbl 1.1f ['$' for help]"
+
+
+class _FakeSerial:
+    """Greets after the wakeup, but only at the baudrate it runs at."""
+
+    port = "fake"
+
+    def __init__(self, baudrate, banner):
+        self.device_baudrate = baudrate
+        self.banner = banner
+        self.baudrate = None
+        self.dtr = True
+        self.written = []
+        self.__pending = b""
+
+    @property
+    def in_waiting(self):
+        return len(self.__pending)
+
+    def reset_input_buffer(self):
+        self.__pending = b""
+
+    def write(self, data):
+        self.written.append((self.baudrate, data))
+        if self.baudrate == self.device_baudrate:
+            self.__pending += b"\r\n" + self.banner.encode() + b"\r\n"
+        else:
+            self.__pending += b"\xfe\x80\xff\r\n"
+
+    def read(self, size):
+        data, self.__pending = self.__pending[:size], self.__pending[size:]
+        return data
+
+
+def _probe(device_type, banner):
+    link = SerialLink(probe_baudrates=[250000, 115200], probe_timeout=0.05)
+    connection = _FakeSerial(115200, banner)
+    device = device_type("fake", serial_link=link)
+    return device._probe_link(connection), connection
+
+
+def test_probe_finds_the_baudrate_with_the_driver_banner():
+    lines, connection = _probe(GenericDriver, OLDER_BANNER)
+    assert lines == [OLDER_BANNER]
+    assert connection.baudrate == 115200
+    assert connection.written == [(250000, b"\x18"), (115200, b"\x18")]
+
+
+def test_probe_rejects_a_banner_of_another_device():
+    lines, connection = _probe(UArm, OLDER_BANNER)
+    assert lines is None
+    assert connection.baudrate == 115200
+
+
+def test_a_banner_the_probe_accepts_makes_the_driver_ready():
+    async def run():
+        for device_type in (GenericDriver, Plotter):
+            device, _ = await start_device(device_type, banner=OLDER_BANNER)
+            assert device.is_ready
+            device.stop()
+
+    asyncio.run(run())
@@ -0,0 +1,79 @@
+"""Device settings kept between runs."""
+
+import asyncio
+import json
+
+from stubport import GRBL_BANNER, StubTransport, settle
+from asyncgcodecli import GenericDriver, SettingsCache
+
+SETTINGS = {"110": "500.000", "120": "10.000"}
+
+
+def test_entries_are_per_port_and_firmware(tmp_path):
+    cache = SettingsCache(str(tmp_path / "cache" / "settings.json"))
+    assert cache.load("COM1", GRBL_BANNER) is None
+    assert cache.store("COM1", GRBL_BANNER, SETTINGS)
+    # nothing changed, nothing written
+    assert not cache.store("COM1", GRBL_BANNER, SETTINGS)
+    assert cache.load("COM1", GRBL_BANNER) == SETTINGS
+    assert cache.load("COM2", GRBL_BANNER) is None
+    assert cache.load("COM1", "Grbl 1.1f ['$' for help]") is None
+
+
+def test_damaged_entries_are_ignored(tmp_path):
+    path = tmp_path / "settings.json"
+    cache = SettingsCache(str(path))
+    cache.store("COM1", GRBL_BANNER, SETTINGS)
+    entries = json.loads(path.read_text())
+    for entry in entries.values():
+        entry["settings"]["110"] = "9999"
+    path.write_text(json.dumps(entries))
+    assert cache.load("COM1", GRBL_BANNER) is None
+
+    path.write_text("{not json")
+    assert cache.load("COM1", GRBL_BANNER) is None
+
+
+async def _start(cache):
+    transport = StubTransport()
+    device = GenericDriver("COM1", transport=transport, settings_cache=cache)
+    device.settings_refresh_delay = 0.01
+    device.start()
+    await settle()
+    return device, transport.port
+
+
+def _answer_settings(port):
+    port.reply(*["${}={}".format(key, value) for key, value in SETTINGS.items()])
+    port.reply("ok")
+
+
+def test_cached_settings_make_the_device_ready_at_once(tmp_path):
+    cache = SettingsCache(str(tmp_path / "settings.json"))
+
+    async def run():
+        # the first time the device is only ready after $$
+        device, port = await _start(cache)
+        assert port.lines() == [b"$$"]
+        assert not device._ready_future.done()
+        _answer_settings(port)
+        await asyncio.wait_for(device.ready(), 1)
+        device.stop()
+        assert cache.load("COM1", GRBL_BANNER) == SETTINGS
+
+        # then it is ready after the banner, moves go before $$
+        device, port = await _start(cache)
+        await asyncio.wait_for(device.ready(), 1)
+        assert device.settings == SETTINGS
+        result = device.move_linear(x=1)
+        await settle()
+        assert port.lines() == [b"G1 X1.00 F10000.00"]
+        port.reply("ok")
+        await result
+        await asyncio.sleep(0.05)
+        assert port.lines()[-1] == b"$$"
+        _answer_settings(port)
+        await settle()
+        device.stop()
+
+    asyncio.run(run())
@@ -0,0 +1,143 @@
+"""Polyline simplification and arc fitting."""
+
+import asyncio
+import math
+import random
+import re
+
+import pytest
+
+from stubport import start_device
+from asyncgcodecli import simplify
+from asyncgcodecli.driver import GenericDriver
+from asyncgcodecli.encoder import GCodeEncoder
+from asyncgcodecli.simplify import fit_arcs, simplify_path, simplify_polyline
+
+
+def _arc_points(cx, cy, radius, start, sweep, count, z=None):
+    points = []
+    for index in range(count + 1):
+        angle = start + sweep * index / count
+        point = (cx + radius * math.cos(angle), cy + radius * math.sin(angle))
+        points.append(point if z is None else point + (z,))
+    return points
+
+
+def _distance_to_polyline(point, polyline):
+    best = math.inf
+    for (ax, ay), (bx, by) in zip(polyline, polyline[1:]):
+        dx, dy = bx - ax, by - ay
+        length2 = dx * dx + dy * dy
+        t = 0.0
+        if length2:
+            t = min(max(((point[0] - ax) * dx + (point[1] - ay) * dy) / length2, 0), 1)
+        best = min(best, math.hypot(point[0] - ax - t * dx, point[1] - ay - t * dy))
+    return best
+
+
+@pytest.fixture(params=[True, False], ids=["numpy", "python"])
+def use_numpy(request, monkeypatch):
+    if request.param:
+        pytest.importorskip("numpy")
+    else:
+        monkeypatch.setattr(simplify, "numpy", None)
+    return request.param
+
+
+def test_simplified_line_stays_within_tolerance(use_numpy):
+    generator = random.Random(1)
+    points = [
+        (x * 0.5, math.sin(x * 0.1) * 20 + generator.uniform(-0.05, 0.05))
+        for x in range(200)
+    ]
+    result = simplify_polyline(points, 0.2)
+    assert len(result) < len(points) // 3
+    assert result[0] == points[0] and result[-1] == points[-1]
+    assert all(_distance_to_polyline(p, result) <= 0.2 + 1e-9 for p in points)
+
+
+def test_collinear_and_degenerate_input(use_numpy):
+    line = [(i, 2 * i) for i in range(100)]
+    assert simplify_polyline(line, 0.01) == [line[0], line[-1]]
+    # the same point over and over, and a line that comes back
+    assert simplify_polyline([(1, 1)] * 50, 0.1) == [(1, 1), (1, 1)]
+    back = [(0, 0), (10, 0), (0, 0)]
+    assert simplify_polyline(back, 0.1) == back
+    assert simplify_polyline(line[:2], 1) == line[:2]
+    assert simplify_path([(0, 0)], 1, 1) == []
+    # collinear points are no arc
+    assert all(segment[0] == "line" for segment in fit_arcs(line, 0.01))
+
+
+def test_z_is_kept(use_numpy):
+    # a ramp that is straight in xy but not in z
+    ramp = [(i, 0, i * 0.1 if i < 50 else 5 - (i - 50) * 0.1) for i in range(100)]
+    result = simplify_polyline(ramp, 0.01)
+    assert (50, 0, 5.0) in result
+    assert all(len(point) == 3 for point in result)
+
+    # a helix is no arc, a flat circle at a height keeps its z
+    helix = [p + (i * 0.5,) for i, p in enumerate(_arc_points(0, 0, 10, 0, 3, 60))]
+    assert all(segment[0] == "line" for segment in fit_arcs(helix, 0.01))
+    flat = _arc_points(0, 0, 10, 0, 3, 60, z=-1.5)
+    segments = fit_arcs(flat, 0.01)
+    assert segments[0][0] == "arc"
+    assert segments[-1][1] == flat[-1]
+
+
+def test_arc_fit_has_the_right_centre_and_direction(use_numpy):
+    points = _arc_points(5, -3, 12, 0.3, -2.5, 80)
+    segments = fit_arcs(points, 0.01)
+    assert [segment[0] for segment in segments] == ["arc"]
+    _, end, (i, j), clockwise = segments[0]
+    assert clockwise
+    assert end == points[-1]
+    assert points[0][0] + i == pytest.approx(5)
+    assert points[0][1] + j == pytest.approx(-3)
+
+
+def _radius_errors(lines):
+    """The difference between the start and end radius of each G2/G3."""
+    position = {}
+    errors = []
+    for line in lines:
+        words = dict(
+            (letter, float(value))
+            for letter, value in re.findall(rb"([A-Z])(-?[0-9.]+)", line)
+        )
+        if b"I" in words:
+            cx = position[b"X"] + words[b"I"]
+            cy = position[b"Y"] + words[b"J"]
+            start = math.hypot(words[b"I"], words[b"J"])
+            end = math.hypot(
+                words.get(b"X", position[b"X"]) - cx,
+                words.get(b"Y", position[b"Y"]) - cy,
+            )
+            errors.append(abs(start - end))
+        for axis in (b"X", b"Y"):
+            if axis in words:
+                position[axis] = words[axis]
+    return errors
+
+
+@pytest.mark.parametrize("encoder", [None, GCodeEncoder()], ids=["plain", "encoder"])
+def test_rounded_arcs_pass_the_grbl_radius_check(encoder):
+    async def run():
+        device, port = await start_device(GenericDriver, auto_ok=True, encoder=encoder)
+        generator = random.Random(7)
+        for _ in range(40):
+            cx, cy = generator.uniform(-100, 100), generator.uniform(-100, 100)
+            radius = generator.uniform(0.5, 20)
+            start = generator.uniform(0, 6)
+            sweep = generator.choice((-1, 1)) * generator.uniform(0.5, 3)
+            points = _arc_points(cx, cy, radius, start, sweep, 80)
+            # start at the first point, the arc begins there
+            await device.move_linear(x=points[0][0], y=points[0][1])
+            await device.move_polyline(points, speed=1000, arc_tolerance=0.05)
+        device.stop()
+        return port.lines()
+
+    lines = asyncio.run(run())
+    errors = _radius_errors(lines)
+    assert len(errors) == 40
+    assert max(errors) <= 0.005
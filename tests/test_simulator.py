@@ -0,0 +1,67 @@
+"""Job time estimation."""
+
+import math
+import random
+
+import pytest
+
+import context  # noqa: F401
+from asyncgcodecli import simulator
+
+SETTINGS = {
+    "110": "6000",
+    "111": "6000",
+    "112": "600",
+    "120": "100",
+    "121": "100",
+    "122": "50",
+    "11": "0.01",
+}
+
+
+def _lines():
+    generator = random.Random(1)
+    lines = ["G0 X0 Y0"]
+    for _ in range(500):
+        lines.append(
+            "G1 X%.3f Y%.3f F%d"
+            % (
+                generator.uniform(0, 200),
+                generator.uniform(0, 200),
+                generator.choice([1000, 3000, 6000]),
+            )
+        )
+    lines += ["G4 P0.5", "G2 X10 Y10 I5 J5", "G91", "G1 X1 Y1 Z1", "G90", "G1 X10"]
+    return lines
+
+
+def test_trapezoid():
+    # 100 mm at 50 mm/s with 100 mm/s^2: 0.5 s up, 1.5 s cruise, 0.5 s down
+    result = simulator.simulate(["G1 X100 F3000"], SETTINGS)
+    assert result.total_time == pytest.approx(2.5)
+    assert result.length == pytest.approx(100)
+
+
+def test_dwell_counts_per_line():
+    result = simulator.simulate(["G1 X4 F3000", "G4 P1.5"], SETTINGS)
+    assert result.dwell_time == pytest.approx(1.5)
+    times = list(result.line_times())
+    assert times[0] == pytest.approx(0.4)
+    assert times[1] == pytest.approx(1.5)
+
+
+@pytest.mark.skipif(simulator.numpy is None, reason="needs numpy")
+@pytest.mark.parametrize("lookahead", [15, None])
+def test_numpy_and_python_agree(monkeypatch, lookahead):
+    lines = _lines()
+    with_numpy = simulator.simulate(lines, SETTINGS, lookahead=lookahead)
+    monkeypatch.setattr(simulator, "numpy", None)
+    without = simulator.simulate(lines, SETTINGS, lookahead=lookahead)
+
+    assert len(with_numpy.segment_times) == len(without.segment_times)
+    assert list(with_numpy.segment_lines) == list(without.segment_lines)
+    for a, b in zip(with_numpy.segment_times, without.segment_times):
+        assert a == pytest.approx(b, rel=1e-9, abs=1e-12)
+    assert with_numpy.total_time == pytest.approx(without.total_time)
+    assert with_numpy.length == pytest.approx(without.length)
+    assert not math.isnan(with_numpy.total_time)
@@ -0,0 +1,139 @@
+"""Device state in shared memory."""
+
+import asyncio
+import os
+import struct
+import subprocess
+import sys
+import time
+
+from stubport import settle, start_device
+from asyncgcodecli import UArm
+from asyncgcodecli.driver import GenericDriver
+from asyncgcodecli import stateboard
+from asyncgcodecli.stateboard import StateBoard, StateBoardReader
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class _Device:
+    """Only what a StateBoard reads."""
+
+    def __init__(self, port):
+        self.port = port
+        self.status = None
+        self.position = None
+        self.pending_commands = 0
+        self.is_ready = True
+        self.paused = False
+
+    def query_status(self):
+        pass
+
+
+def test_unknown_values_are_empty():
+    with StateBoard([_Device(None)]) as board:
+        with StateBoardReader(board.name) as reader:
+            state = reader.read(0)
+    assert state["port"] is None
+    assert state["status"] is None
+    assert state["position"] is None
+
+
+def test_status_report_is_published():
+    async def run():
+        device, port = await start_device(GenericDriver)
+        with StateBoard([device]) as board, StateBoardReader(board.name) as reader:
+            assert reader.find("stub")["status"] is None
+            port.reply("<Idle|MPos:1.000,2.000,-3.500|FS:0,0>")
+            await settle()
+            board.publish()
+            state = reader.find("stub")
+        device.stop()
+        return state
+
+    state = asyncio.run(run())
+    assert state["status"] == "Idle"
+    assert state["position"] == (1, 2, -3.5)
+    assert state["ready"] and not state["paused"]
+
+
+def test_query_status_is_real_time_and_a_no_op_on_the_uarm():
+    async def run():
+        device, port = await start_device(GenericDriver)
+        device.query_status()
+        assert port.written == [b"?"]
+        device.stop()
+
+        arm, port = await start_device(UArm, banner="@1")
+        arm.query_status()
+        assert port.written == []
+        arm.stop()
+
+    asyncio.run(run())
+
+
+# reads records while the test writes them, every record it accepts must be
+# from one write: x, y, z and pending are all the same counter
+_READER = """
+import sys
+from asyncgcodecli.stateboard import StateBoardReader
+
+reader = StateBoardReader(sys.argv[1])
+print("open", flush=True)
+consistent = 0
+while consistent < 20000:
+    state = reader.read(0, retries=1000000)
+    if state["position"] is None:
+        continue
+    x, y, z = state["position"]
+    pending = state["pending"]
+    if not x == y == z == pending:
+        print("torn", state, flush=True)
+        sys.exit(1)
+    consistent += x > 0
+reader.close()
+print("ok", consistent, flush=True)
+"""
+
+
+def _write_field_by_field(board, counter):
+    """Write x, y, z and pending one at a time, like a slow writer would."""
+    buf = board.memory.buf
+    offset = stateboard._HEADER.size
+    sequence = stateboard._SEQUENCE.unpack_from(buf, offset)[0]
+    stateboard._SEQUENCE.pack_into(buf, offset, sequence + 1)
+    for field in (16, 24, 32):
+        struct.pack_into("<d", buf, offset + field, counter)
+    struct.pack_into("<I", buf, offset + 40, counter)
+    stateboard._SEQUENCE.pack_into(buf, offset, sequence + 2)
+
+
+def test_seqlock_round_trip_in_another_process():
+    device = _Device("seqlock")
+    with StateBoard([device]) as board:
+        env = dict(os.environ, PYTHONPATH=ROOT)
+        reader = subprocess.Popen(
+            [sys.executable, "-c", _READER, board.name],
+            stdout=subprocess.PIPE,
+            text=True,
+            env=env,
+        )
+        assert reader.stdout.readline().strip() == "open"
+        deadline = time.monotonic() + 60
+        counter = 0
+        while reader.poll() is None and time.monotonic() < deadline:
+            counter += 1
+            if counter < 5000:
+                device.position = (counter, counter, counter)
+                device.pending_commands = counter
+                board.publish()
+            else:
+                # publish writes the record at once, this gives a reader
+                # that ignores the sequence a chance to see half a write
+                _write_field_by_field(board, counter)
+        if reader.poll() is None:
+            reader.kill()
+        output = reader.communicate()[0]
+    assert reader.returncode == 0, output
+    assert output.startswith("ok")
@@ -0,0 +1,125 @@
+"""The TCP and telnet transport against a local socket."""
+
+import asyncio
+
+from stubport import GRBL_BANNER, StubTransport, settle, start_device
+from asyncgcodecli.driver import GenericDriver
+from asyncgcodecli.tcp import TcpConnector, _TelnetFilter
+
+
+class _Bridge:
+    """
+    A GRBL behind a ser2net bridge: connecting does not reset it, so it
+    only greets after a soft reset.
+    """
+
+    def __init__(self, telnet=False):
+        self.telnet = telnet
+        self.received = bytearray()
+        self.server = None
+
+    async def __aenter__(self):
+        self.server = await asyncio.start_server(self.__serve, "127.0.0.1", 0)
+        return self
+
+    async def __aexit__(self, *exc):
+        self.server.close()
+        await self.server.wait_closed()
+
+    def url(self):
+        port = self.server.sockets[0].getsockname()[1]
+        return "{}://127.0.0.1:{}".format("telnet" if self.telnet else "tcp", port)
+
+    async def __serve(self, reader, writer):
+        if self.telnet:
+            # IAC DO ECHO
+            writer.write(b"\xff\xfd\x01")
+        lines = b""
+        while True:
+            data = await reader.read(4096)
+            if not data:
+                break
+            self.received += data
+            if b"\x18" in data:
+                writer.write(GRBL_BANNER.encode() + b"\r\n")
+                data = data.split(b"\x18")[-1]
+            lines += data
+            *done, lines = lines.replace(b"\n", b"\r").split(b"\r")
+            for line in done:
+                if line:
+                    writer.write(b"ok\r\n")
+        writer.close()
+
+
+def _connector():
+    return TcpConnector(connect_timeout=1, connect_attempts=1, reconnect=False)
+
+
+def test_tcp_device_without_a_banner_is_reset_and_streams():
+    async def run():
+        async with _Bridge() as bridge:
+            device = GenericDriver(bridge.url(), transport=_connector())
+            device.banner_timeout = 0.05
+            device.start()
+            await asyncio.wait_for(device.ready(), 2)
+            result = await asyncio.wait_for(device.move_linear(x=1, speed=100), 2)
+            assert result["result"] == "ok"
+            device.stop()
+            assert bridge.received.startswith(b"\x18$$\r")
+            assert bridge.received.endswith(b"G1 X1.00 F100.00\r")
+
+    asyncio.run(run())
+
+
+def test_telnet_options_are_refused_and_iac_is_escaped():
+    async def run():
+        async with _Bridge(telnet=True) as bridge:
+            device = GenericDriver(bridge.url(), transport=_connector())
+            device.banner_timeout = 0.05
+            device.start()
+            await asyncio.wait_for(device.ready(), 2)
+            device._write_realtime(b"\xff")
+            await asyncio.wait_for(device.move_linear(x=1, speed=100), 2)
+            device.stop()
+            # IAC WONT ECHO, then the data with IAC doubled
+            assert bridge.received.startswith(b"\xff\xfc\x01")
+            assert b"\xff\xffG1 X1.00 F100.00\r" in bridge.received
+
+    asyncio.run(run())
+
+
+def test_telnet_filter_keeps_data_split_over_reads():
+    telnet = _TelnetFilter()
+    assert telnet.feed(b"ok\xff") == (b"ok", b"")
+    assert telnet.feed(b"\xfb\x03ok\xff\xff") == (b"ok\xff", b"\xff\xfe\x03")
+    assert telnet.feed(b"\xff\xfa\x18\x00\xff\xf0ok") == (b"ok", b"")
+
+
+def test_no_banner_sends_a_soft_reset_once():
+    async def run():
+        transport = StubTransport(banner=None)
+        device = GenericDriver("stub", transport=transport)
+        device.banner_timeout = 0.01
+        device.start()
+        await asyncio.sleep(0.05)
+        assert transport.port.written == [b"\x18"]
+        transport.port.reply(GRBL_BANNER)
+        await settle()
+        transport.port.reply("ok")
+        await asyncio.wait_for(device.ready(), 1)
+        await asyncio.sleep(0.05)
+        assert transport.port.written == [b"\x18", b"$$\r"]
+        device.stop()
+
+    asyncio.run(run())
+
+
+def test_a_banner_in_time_needs_no_reset():
+    async def run():
+        device, port = await start_device(GenericDriver)
+        device.banner_timeout = 0.01
+        await asyncio.sleep(0.05)
+        assert port.written == []
+        device.stop()
+
+    asyncio.run(run())
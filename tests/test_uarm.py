@@ -0,0 +1,84 @@
+"""Pipelined commands on the uArm."""
+
+import asyncio
+
+import pytest
+
+from stubport import settle, start_device
+from asyncgcodecli import CommandAbortedException, UArm
+
+
+def _sequences(lines):
+    """The sequence numbers of the lines, "#7 G1 X1" is 7."""
+    return [int(line.split()[0][1:]) for line in lines]
+
+
+def test_out_of_order_answers_confirm_their_own_command():
+    async def run():
+        arm, port = await start_device(UArm, banner="@1", pipeline_window=3)
+        results = [arm.move_linear(x=x) for x in (1, 2, 3, 4)]
+        await settle()
+        first, second, third = _sequences(port.lines())
+        assert len(set((first, second, third))) == 3
+        # the window is full
+        assert len(port.lines()) == 3
+
+        port.reply("${} ok".format(third))
+        await settle()
+        assert [result.done() for result in results] == [False, False, True, False]
+        # an answer makes room, the fourth goes out
+        assert len(port.lines()) == 4
+
+        port.reply("${} E22".format(first), "${} ok V1.0".format(second))
+        await settle()
+        assert results[0].result() == {"result": "error", "error_code": "22"}
+        assert results[1].result() == {
+            "result": "ok",
+            "error_code": 0,
+            "response": "V1.0",
+        }
+        assert results[2].result()["result"] == "ok"
+        assert not results[3].done()
+        arm.stop()
+
+    asyncio.run(run())
+
+
+def test_numbers_that_were_never_sent_are_dropped():
+    async def run():
+        arm, port = await start_device(UArm, banner="@1", pipeline_window=2)
+        results = [arm.move_linear(x=x) for x in (1, 2, 3, 4)]
+        await settle()
+        sent = _sequences(port.lines())
+        assert len(sent) == 2
+
+        # the next command was numbered while the window was full
+        arm.abort()
+        await settle()
+        for result in results:
+            with pytest.raises(CommandAbortedException):
+                result.result()
+
+        # the device still answers what it had, nothing waits for the rest
+        port.reply(*["${} ok".format(sequence) for sequence in sent])
+        await settle()
+        assert arm.pending_commands == 0
+
+        arm.resume()
+        result = arm.move_linear(x=9)
+        await settle()
+        (sequence,) = _sequences(port.lines()[2:])
+        # a stray answer for a number that was dropped confirms nothing
+        for stray in range(max(sent) + 1, sequence):
+            port.reply("${} ok".format(stray))
+        port.reply("$99999 ok")
+        await settle()
+        assert not result.done()
+
+        port.reply("${} ok".format(sequence))
+        await settle()
+        assert result.result()["result"] == "ok"
+        assert arm.pending_commands == 0
+        arm.stop()
+
+    asyncio.run(run())